@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""Benchmark the audio library against synthetic data.
+
+Run with `python -m benchmarks`. Results can be saved with --output, and
+compared to a previous run with --baseline, failing if anything is more
+than --threshold slower."""
+
+import argparse
+import gc
+import json
+import logging
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from scom7330.audiolib import AudioDataEntry, Index, SpeechLib
+from scom7330.audiolib_tool import extract_audio
+
+from .synthetic import (SPLIBENG_MEAN_LENGTH, SPLIBENG_WORDS, generate_speechLib,
+                        write_directory)
+
+
+def measure(function: Callable[[], Any], size: int, repeat: int) -> Dict[str, float]:
+    """Time function (best of repeat runs), then measure its peak memory
+       in a separate run, as tracemalloc slows everything down"""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    seconds = min(times)
+    return {
+        'seconds': seconds,
+        'mb_per_s': size / seconds / 1e6 if seconds else float('inf'),
+        'peak_bytes': peak,
+    }
+
+
+def run(word_count: int, mean_length: int, repeat: int, work_dir: Path) -> Dict[str, Any]:
+    # codes 3000+ so that the directory can be read by from_directory
+    speechLib = generate_speechLib(word_count, mean_length, first_code=3000)
+    data = speechLib.to_bytes()
+    size = len(data)
+
+    lib_file = work_dir / 'lib.bin'
+    lib_file.write_bytes(data)
+    input_dir = work_dir / 'input'
+    write_directory({word_code: entry.data
+                     for word_code, entry in speechLib.audioData.entries.items()}, input_dir)
+
+    def extract() -> None:
+        # into a new directory each time, rather than overwriting files
+        extract_audio(lib_file, Path(tempfile.mkdtemp(dir=work_dir)))
+
+    index_bytes = data[0x200:0x200 + speechLib.index.index_size]
+    offsets = list(speechLib.index.word_offsets.values())
+
+    benchmarks: Dict[str, Callable[[], Any]] = {
+        'SpeechLib.from_bytes': lambda: SpeechLib.from_bytes(data),
+        'SpeechLib.to_bytes': speechLib.to_bytes,
+        # SpLibEng scale is beyond the limit for custom audio
+        'SpeechLib.from_directory': lambda: SpeechLib.from_directory(input_dir,
+                                                                     check_length=False),
+        'extract_audio': extract,
+        'Index.from_bytes': lambda: Index.from_bytes(index_bytes),
+        'AudioDataEntry.from_bytes': lambda: [AudioDataEntry.from_bytes(data, offset)
+                                              for offset in offsets],
+    }
+
+    results = {}
+    for name, function in benchmarks.items():
+        results[name] = measure(function, len(index_bytes) if name == 'Index.from_bytes' else size,
+                                repeat)
+        print(f"{name:<28} {results[name]['seconds'] * 1000:>10.2f} ms "
+              f"{results[name]['mb_per_s']:>10.1f} MB/s "
+              f"{results[name]['peak_bytes'] / 2**20:>8.1f} MiB peak",
+              file=sys.stderr)
+
+    return {
+        'params': {'word_count': word_count, 'mean_length': mean_length,
+                   'repeat': repeat, 'library_size': size},
+        'results': results,
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Return a description of each benchmark more than threshold slower than baseline"""
+    if results['params'] != baseline['params']:
+        logging.warning("Benchmark parameters differ from the baseline, "
+                        "comparisons may not be meaningful")
+
+    regressions = []
+    for name, result in results['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+
+        ratio = result['seconds'] / base['seconds']
+        if ratio > 1 + threshold:
+            regressions.append(f"{name}: {base['seconds'] * 1000:.2f} ms -> "
+                               f"{result['seconds'] * 1000:.2f} ms ({ratio:.2f}x)")
+
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--words', type=int, default=SPLIBENG_WORDS,
+                        help="Number of words in the synthetic library (at most 2000)")
+    parser.add_argument('--mean-length', type=int, default=SPLIBENG_MEAN_LENGTH,
+                        help="Mean length of each word, in bytes")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Number of timed runs of each benchmark (the best is kept)")
+    parser.add_argument('-o', '--output', type=Path,
+                        help="Write the results to this JSON file")
+    parser.add_argument('--baseline', type=Path,
+                        help="Compare against results from a previous run")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="Fraction slower than the baseline counted as a regression")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = run(args.words, args.mean_length, args.repeat, Path(work_dir))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
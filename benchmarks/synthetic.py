@@ -0,0 +1,58 @@
+"""Deterministic generation of synthetic speech libraries, for benchmarks and tests"""
+
+import random
+from pathlib import Path
+from typing import Dict
+
+from scom7330.audiolib import AudioData, AudioDataEntry, Header, ImageHeader, Index, SpeechLib
+
+# roughly the shape of SpLibEng_1.3.bin: 1631 words, 7.7 MB
+SPLIBENG_WORDS = 1631
+SPLIBENG_MEAN_LENGTH = 4740
+
+
+def generate_entries(word_count: int = SPLIBENG_WORDS,
+                     mean_length: int = SPLIBENG_MEAN_LENGTH,
+                     first_code: int = 0,
+                     seed: int = 7330) -> Dict[int, bytes]:
+    """Generate word_count entries of random audio, with lengths
+       uniformly distributed between half and one and a half times
+       mean_length. The same arguments always give the same entries."""
+    rng = random.Random(seed)
+    entries = {}
+
+    for word_code in range(first_code, first_code + word_count):
+        length = rng.randint(mean_length // 2, mean_length * 3 // 2)
+        entries[word_code] = rng.getrandbits(length * 8).to_bytes(length, 'little')
+
+    return entries
+
+
+def make_speechLib(entries: Dict[int, bytes]) -> SpeechLib:
+    """Build a speech lib of the given entries, with a fixed timestamp
+       so that the same entries always give the same file"""
+    audioData = AudioData({word_code: AudioDataEntry(data)
+                           for word_code, data in entries.items()})
+    index = Index.from_AudioData(audioData)
+    firstFree = 0x200 + index.index_size + audioData.full_length
+
+    return SpeechLib(
+        Header(firstFree, timestamp_raw=b'09/09/09 12:00'),
+        ImageHeader(index.index_size, index.max_word, firstFree),
+        index,
+        audioData)
+
+
+def generate_speechLib(word_count: int = SPLIBENG_WORDS,
+                       mean_length: int = SPLIBENG_MEAN_LENGTH,
+                       first_code: int = 0,
+                       seed: int = 7330) -> SpeechLib:
+    return make_speechLib(generate_entries(word_count, mean_length, first_code, seed))
+
+
+def write_directory(entries: Dict[int, bytes], output_dir: Path) -> None:
+    """Write entries as raw audio files, as read by SpeechLib.from_directory"""
+    output_dir.mkdir(exist_ok=True)
+
+    for word_code, data in entries.items():
+        (output_dir / f"{word_code}.raw").write_bytes(data)
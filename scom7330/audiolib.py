@@ -1,17 +1,100 @@
 from __future__ import annotations
 
+import hashlib
 import logging
 import math
-from dataclasses import dataclass, field
+import mmap
+import os
+import sys
+import tempfile
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
 from datetime import datetime
+from hashlib import blake2b
 from pathlib import Path
-from typing import ByteString, Dict, Iterable, Optional
+from typing import (BinaryIO, ByteString, Callable, Container, Dict, Iterable, Iterator, List,
+                    Mapping, MutableMapping, Optional, Tuple)
+
+from . import profiling, ulaw
 
 
 class AudioLengthException(Exception):
     pass
 
 
+# Lookup table for the (self-inverse) transform applied to the word
+# data: every byte with the highest bit set has its lower 7 bits inverted
+_INVERT_TABLE = bytes(byte ^ 127 if byte > 127 else byte for byte in range(256))
+
+# maximum size of a single read when skipping through a stream
+_SKIP_CHUNK_SIZE = 0x10000
+
+# size of each read when encoding a file straight to the output
+_STREAM_CHUNK_SIZE = 0x10000
+
+
+def _read_exactly(input_stream: BinaryIO, length: int) -> bytes:
+    """Read exactly length bytes, even if the stream returns short reads (e.g. pipes)"""
+    data = input_stream.read(length)
+    if len(data) == length:
+        return data
+
+    chunks = [data]
+    remaining = length - len(data)
+    while remaining > 0:
+        chunk = input_stream.read(remaining)
+        if not chunk:
+            raise EOFError(f"Unexpected end of stream, {remaining} bytes short")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+
+    return b''.join(chunks)
+
+
+@contextmanager
+def _atomic_open(output_file: Path) -> Iterator[BinaryIO]:
+    """Open a temporary file beside output_file for writing, which
+       replaces output_file only once the context exits successfully"""
+    output_file = Path(output_file)
+    fd, temp_name = tempfile.mkstemp(dir=output_file.parent, prefix=f".{output_file.name}.")
+
+    try:
+        if output_file.exists():
+            mode = output_file.stat().st_mode
+        else:
+            # mkstemp creates files readable only by the owner
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.chmod(temp_name, mode & 0o7777)
+
+        with open(fd, 'wb') as f:
+            yield f
+        os.replace(temp_name, output_file)
+    except BaseException:
+        os.unlink(temp_name)
+        raise
+
+
+def _log_trimmed(lengths: Mapping[int, int], trimmed_lengths: Mapping[int, int]) -> None:
+    if logging.getLogger().isEnabledFor(logging.INFO):
+        for word_code, length in lengths.items():
+            if trimmed_lengths[word_code] != length:
+                logging.info("word code: %d trimmed %d bytes of silence",
+                             word_code, length - trimmed_lengths[word_code])
+
+    logging.info("Trimmed %d bytes of silence in total",
+                 sum(lengths.values()) - sum(trimmed_lengths.values()))
+
+
+def _skip(input_stream: BinaryIO, length: int) -> None:
+    """Skip forward length bytes, without seeking"""
+    while length > 0:
+        length -= len(_read_exactly(input_stream, min(length, _SKIP_CHUNK_SIZE)))
+
+
 @dataclass
 class Header:
     TIMESTAMP_FORMAT = "%m/%d/%y %H:%M"
@@ -71,22 +154,27 @@ class Header:
             zeros=header[0x3c:0x3c + 4],
         )
 
-    def _assign_pos(self, header: bytearray, pos: int, content: ByteString) -> None:
+    def _assign_pos(self, header: memoryview, pos: int, content: ByteString) -> None:
         header[pos:pos + len(content)] = content
 
-    def to_bytes(self) -> bytes:
+    def write_into(self, buffer: bytearray, offset: int) -> None:
         # __post_init__ should guarentee that this will always have a value
         assert self.timestamp_raw is not None
 
-        header = bytearray(b'\xff' * 0x100)
-        self._assign_pos(header, 0x00, self.preamble)
-        self._assign_pos(header, 0x05, self.name)
-        self._assign_pos(header, 0x15, self.version)
-        self._assign_pos(header, 0x21, self.timestamp_raw)
-        header[0x38] = self.file_type
-        # TODO: why is this -0x100? seems to be ignoring this header?
-        self._assign_pos(header, 0x39, (self.firstFree - 0x100).to_bytes(3, "big"))
-        self._assign_pos(header, 0x3c, self.zeros)
+        with memoryview(buffer)[offset:offset + 0x100] as header:
+            header[:] = b'\xff' * 0x100
+            self._assign_pos(header, 0x00, self.preamble)
+            self._assign_pos(header, 0x05, self.name)
+            self._assign_pos(header, 0x15, self.version)
+            self._assign_pos(header, 0x21, self.timestamp_raw)
+            header[0x38] = self.file_type
+            # TODO: why is this -0x100? seems to be ignoring this header?
+            self._assign_pos(header, 0x39, (self.firstFree - 0x100).to_bytes(3, "big"))
+            self._assign_pos(header, 0x3c, self.zeros)
+
+    def to_bytes(self) -> bytes:
+        header = bytearray(0x100)
+        self.write_into(header, 0)
 
         # sanity check
         assert len(header) == 0x100
@@ -123,13 +211,18 @@ class ImageHeader:
             firstFree=int.from_bytes(header[6:9], "big"),
         )
 
-    def to_bytes(self) -> bytes:
-        header = bytearray(b'\xff' * 0x100)
+    def write_into(self, buffer: bytearray, offset: int) -> None:
+        with memoryview(buffer)[offset:offset + 0x100] as header:
+            header[:] = b'\xff' * 0x100
+
+            header[0:3] = b'\x00\x02\x00'  # constants in source
+            header[3] = self.index_size.to_bytes(3, "big")[1]
+            header[4:6] = (self.max_word + 1).to_bytes(3, "big")[1:3]  # TODO: why is this +1?
+            header[6:9] = self.firstFree.to_bytes(3, "big")
 
-        header[0:3] = [0, 2, 0]  # constants in source
-        header[3] = self.index_size.to_bytes(3, "big")[1]
-        header[4:6] = (self.max_word + 1).to_bytes(3, "big")[1:3]  # TODO: why is this +1?
-        header[6:9] = self.firstFree.to_bytes(3, "big")
+    def to_bytes(self) -> bytes:
+        header = bytearray(0x100)
+        self.write_into(header, 0)
 
         # sanity check
         assert len(header) == 0x100
@@ -146,14 +239,98 @@ class ImageHeader:
         ])
 
 
+class _IndexOffsets(MutableMapping[int, int]):
+    """Mapping of word code to offset, stored as an array of index slots.
+
+       Each slot holds the 4 bytes of the index entry as a big endian
+       integer: the 3 byte address followed by 0xff, or all 0xff if unused."""
+
+    EMPTY_SLOT = 0xffffffff
+
+    def __init__(self, slots: array) -> None:
+        self._slots = slots
+
+    @classmethod
+    def from_bytes(cls, index: ByteString) -> _IndexOffsets:
+        index = bytearray(index[:len(index) // 4 * 4])
+        # the last byte of each slot is unused, and should always be 0xff
+        index[3::4] = b'\xff' * (len(index) // 4)
+
+        slots = array('I')
+        assert slots.itemsize == 4
+        slots.frombytes(index)
+        if sys.byteorder == 'little':
+            slots.byteswap()
+
+        return cls(slots)
+
+    @classmethod
+    def from_dict(cls, word_offsets: Mapping[int, int], index_size: int) -> _IndexOffsets:
+        num_slots = max(index_size // 4, max(word_offsets, default=-1) + 1)
+        offsets = cls(array('I', [cls.EMPTY_SLOT]) * num_slots)
+        offsets.update(word_offsets)
+
+        return offsets
+
+    def to_bytes(self) -> bytes:
+        slots = array('I', self._slots)
+        if sys.byteorder == 'little':
+            slots.byteswap()
+
+        return slots.tobytes()
+
+    def __getitem__(self, word_code: int) -> int:
+        if 0 <= word_code < len(self._slots):
+            slot = self._slots[word_code]
+            if slot != self.EMPTY_SLOT:
+                return slot >> 8
+
+        raise KeyError(word_code)
+
+    def __setitem__(self, word_code: int, offset: int) -> None:
+        if word_code < 0 or not 0 <= offset < 0xffffff:
+            raise ValueError(f"Can't store word code {word_code} at 0x{offset:X} in the index")
+
+        if word_code >= len(self._slots):
+            self._slots.extend([self.EMPTY_SLOT] * (word_code + 1 - len(self._slots)))
+        self._slots[word_code] = (offset << 8) | 0xff
+
+    def __delitem__(self, word_code: int) -> None:
+        self[word_code]  # raise KeyError if not present
+        self._slots[word_code] = self.EMPTY_SLOT
+
+    def __iter__(self) -> Iterator[int]:
+        empty = self.EMPTY_SLOT
+        return (word_code for word_code, slot in enumerate(self._slots) if slot != empty)
+
+    def __len__(self) -> int:
+        return len(self._slots) - self._slots.count(self.EMPTY_SLOT)
+
+    def max_word_code(self) -> int:
+        for word_code in range(len(self._slots) - 1, -1, -1):
+            if self._slots[word_code] != self.EMPTY_SLOT:
+                return word_code
+
+        raise ValueError("The index is empty")
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict(self)})"
+
+
 @dataclass
 class Index:
     index_size: int
-    word_offsets: Dict[int, int]
+    word_offsets: MutableMapping[int, int]
     max_word: int = field(init=False)
 
     def __post_init__(self) -> None:
-        self.max_word = max(self.word_offsets.keys())
+        # the offsets are stored in a compact array, which still behaves as a dict
+        word_offsets = self.word_offsets
+        if not isinstance(word_offsets, _IndexOffsets):
+            word_offsets = _IndexOffsets.from_dict(word_offsets, self.index_size)
+            self.word_offsets = word_offsets
+
+        self.max_word = word_offsets.max_word_code()
 
         logging.info(f"Maximum word: {self.max_word} (0x{self.max_word:X}), "
                      f"Index Size: {self.index_size}, (0x{self.index_size:X})")
@@ -165,37 +342,60 @@ class Index:
     # TODO: not sure I like the coupling here, but couldn't think of a
     # cleaner way to do this
     @classmethod
-    def from_AudioData(cls, audioData: AudioData, base_offset: int = 0x200) -> Index:
+    def from_AudioData(cls, audioData: AudioData, base_offset: int = 0x200,
+                       dedup: bool = False) -> Index:
+        return cls.from_lengths({word_code: len(entry.data)
+                                 for word_code, entry in audioData.entries.items()},
+                                base_offset,
+                                audioData.find_duplicates() if dedup else None)
+
+    @classmethod
+    def from_lengths(cls, lengths: Mapping[int, int], base_offset: int = 0x200,
+                     duplicates: Optional[Mapping[int, int]] = None) -> Index:
+        """Lay out entries of the given audio lengths, in order. Word codes
+           in duplicates share the entry of the (earlier) word code they
+           map to, rather than getting their own."""
         # each element in the index is 4 bytes (but only uses 3)
-        # total size is rounded up to nearest 0x100
-        max_word = max(audioData.entries.keys())
-        index_size = cls._arbitrary_round_up(max_word * 4, 0x100)
+        # total size is rounded up to nearest 0x100, leaving room for
+        # the max word's own slot (at max_word * 4)
+        max_word = max(lengths.keys())
+        index_size = cls._arbitrary_round_up((max_word + 1) * 4, 0x100)
 
-        word_offsets = {}
+        word_offsets: Dict[int, int] = {}
         offset = base_offset + index_size
+        debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+
+        with profiling.phase("index build", index_size):
+            for word_code, length in lengths.items():
+                if duplicates and word_code in duplicates:
+                    word_offsets[word_code] = word_offsets[duplicates[word_code]]
+                    if debug:
+                        logging.debug("word code: %d duplicate of: %d",
+                                      word_code, duplicates[word_code])
+                    continue
 
-        for word_code, entry in audioData.entries.items():
-            word_offsets[word_code] = offset
-            logging.info(f"word code: {word_code} start: 0x{offset:06X}")
-            offset += len(entry.data) + 3
+                word_offsets[word_code] = offset
+                if debug:
+                    logging.debug("word code: %d start: 0x%06X", word_code, offset)
+                offset += length + 3
 
-        return cls(index_size, word_offsets)
+            return cls(index_size, word_offsets)
 
     @classmethod
     def from_bytes(cls, index: bytes) -> Index:
-        def get_address(index: bytes, word_code: int) -> int:
-            return int.from_bytes(index[word_code * 4: word_code * 4 + 3], "big")
+        return cls(len(index), _IndexOffsets.from_bytes(index))
 
-        word_codes = {word_code: address
-                      for word_code in range(0, len(index) // 4)
-                      if (address := get_address(index, word_code)) != 0xffffff}
+    def write_into(self, buffer: bytearray, offset: int) -> None:
+        assert isinstance(self.word_offsets, _IndexOffsets)
+        slots = self.word_offsets.to_bytes()
 
-        return cls(len(index), word_codes)
+        with memoryview(buffer)[offset:offset + self.index_size] as index:
+            index[:] = b'\xff' * self.index_size
+            index[:len(slots)] = slots
 
     def to_bytes(self) -> bytes:
-        index = bytearray(b'\xff' * self.index_size)
-        for word_code, offset in self.word_offsets.items():
-            index[word_code * 4:word_code * 4 + 3] = offset.to_bytes(3, 'big')
+        index = bytearray(self.index_size)
+        self.write_into(index, 0)
 
         return bytes(index)
 
@@ -208,31 +408,94 @@ class AudioDataEntry:
     def _invert_high_bytes(data: ByteString) -> bytearray:
         """Inverts the lower 7 bits of every byte with the highest bit set.
            I have no idea why their code does this."""
-        dataarray = bytearray(data)
-
-        for index, byte in enumerate(dataarray):
-            dataarray[index] = byte ^ 127 if byte > 127 else byte
-
-        return dataarray
+        return bytearray(data).translate(_INVERT_TABLE)
 
-    @classmethod
-    def from_bytes(cls, audio_data: bytes, offset: int) -> AudioDataEntry:
+    @staticmethod
+    def encoded_span(audio_data: ByteString, offset: int) -> Tuple[int, int]:
+        """The start and end of the encoded data of the entry at offset,
+           from its stop address"""
         stop = int.from_bytes(audio_data[offset:offset + 3], "big")
 
         if stop > len(audio_data):
             raise IndexError("Stop address is greater than the length of the data!")
 
-        b = bytes(cls._invert_high_bytes(audio_data[offset + 3:stop + 1]))
+        return offset + 3, stop + 1
+
+    @classmethod
+    def from_bytes(cls, audio_data: ByteString, offset: int) -> AudioDataEntry:
+        start, end = cls.encoded_span(audio_data, offset)
+
+        # bytes() is a no-op for bytes input, and the only copy for a memoryview
+        b = bytes(audio_data[start:end]).translate(_INVERT_TABLE)
 
         return cls(b)
 
+    def encoded(self) -> bytes:
+        """The audio data as it is stored in a speech lib"""
+        return bytes(self.data).translate(_INVERT_TABLE)
+
+    def to_pcm(self) -> bytes:
+        """The audio decoded to 16 bit little endian PCM, at 8 kHz"""
+        return ulaw.decode(self.data)
+
+    def to_wav(self) -> bytes:
+        """The audio as a 16 bit PCM WAV file"""
+        return ulaw.to_wav(self.data)
+
     def to_bytes(self, offset: int) -> bytes:
         # calculate the position of the end of the file, including the
         # 3 bytes for the stop number.
         stop = (offset + len(self.data) + 2)
 
-        inverted_bytes = bytes(self._invert_high_bytes(self.data))
-        return stop.to_bytes(3, 'big') + inverted_bytes
+        return stop.to_bytes(3, 'big') + self.encoded()
+
+    def write_into(self, buffer: bytearray, offset: int) -> None:
+        """Write this entry into buffer at offset, which is also
+           taken to be the entry's address in the file"""
+        self.write_encoded_into(buffer, offset, self.encoded())
+
+    @staticmethod
+    def write_encoded_into(buffer: bytearray, offset: int, encoded: ByteString) -> None:
+        """Like write_into, but for data that has already been encoded"""
+        stop = (offset + len(encoded) + 2)
+
+        with memoryview(buffer)[offset:stop + 1] as entry:
+            entry[0:3] = stop.to_bytes(3, 'big')
+            entry[3:] = encoded
+
+
+class _LazyEntries(Mapping[int, AudioDataEntry]):
+    """Mapping of word code to AudioDataEntry, decoding each entry from
+       the underlying buffer the first time it is accessed."""
+
+    def __init__(self, data: ByteString, index: Index) -> None:
+        self._data = data
+        self._word_offsets = index.word_offsets
+        # keyed by offset, so that word codes sharing an entry share the decoding
+        self._decoded: Dict[int, AudioDataEntry] = {}
+
+    def __getitem__(self, word_code: int) -> AudioDataEntry:
+        offset = self._word_offsets[word_code]
+        entry = self._decoded.get(offset)
+        if entry is None:
+            entry = AudioDataEntry.from_bytes(self._data, offset)
+            self._decoded[offset] = entry
+
+        return entry
+
+    def encoded_span(self, word_code: int) -> Tuple[int, int]:
+        """Where the still encoded data of a word is in the buffer, without
+           decoding it"""
+        return AudioDataEntry.encoded_span(self._data, self._word_offsets[word_code])
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._word_offsets)
+
+    def __len__(self) -> int:
+        return len(self._word_offsets)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({len(self)} entries, {len(self._decoded)} decoded)"
 
 
 @dataclass
@@ -240,34 +503,110 @@ class AudioData:
     MAX_AUDIO_LENGTH = 12.0
     AUDIO_SAMPLE_RATE = 8000  # 8kHz
 
-    entries: Dict[int, AudioDataEntry]
+    entries: Mapping[int, AudioDataEntry]
 
     @classmethod
-    def from_files(cls, word_files: Iterable[Path]) -> AudioData:
-        entries = {}
-
-        for word_file in word_files:
-            word_code = int(word_file.stem)
+    def from_files(cls, word_files: Iterable[Path], jobs: int = 1) -> AudioData:
+        """Read raw audio files named by word code, with up to jobs files
+           being read concurrently. WAV files are converted, on a pool of
+           jobs processes."""
+        def read(word_file: Path) -> AudioDataEntry:
             with open(word_file, 'rb') as input_file:
-                entries[word_code] = AudioDataEntry(input_file.read())
+                data = input_file.read()
+            profiling.count("file read", len(data))
+            return AudioDataEntry(data)
 
-        return cls(entries)
+        word_files = list(word_files)
+        raw_files = [word_file for word_file in word_files if word_file.suffix != '.wav']
+        wav_files = [word_file for word_file in word_files if word_file.suffix == '.wav']
+
+        with profiling.phase("file read"), ThreadPoolExecutor(jobs) as executor:
+            entries = dict(zip(raw_files, executor.map(read, raw_files)))
+        if wav_files:
+            with profiling.phase("wav convert"):
+                entries.update(zip(wav_files,
+                                   map(AudioDataEntry, ulaw.read_wavs(wav_files, jobs))))
+
+        return cls({int(word_file.stem): entries[word_file] for word_file in word_files})
 
     @classmethod
     def from_bytes(cls, data: bytes, index: Index) -> AudioData:
-        entries = {}
+        entries: Dict[int, AudioDataEntry] = {}
+
+        if not index.word_offsets:
+            return cls(entries)
+
+        # invert the whole word data region in one pass, then slice
+        # each entry out of it, rather than inverting entry by entry
+        start = min(index.word_offsets.values())
+        decoded = bytes(AudioDataEntry._invert_high_bytes(memoryview(data)[start:]))
+
+        # word codes sharing an offset share a single entry
+        by_offset: Dict[int, AudioDataEntry] = {}
 
         for word_code, offset in index.word_offsets.items():
-            entries[word_code] = AudioDataEntry.from_bytes(data, offset)
+            entry = by_offset.get(offset)
+            if entry is None:
+                stop = int.from_bytes(data[offset:offset + 3], "big")
+
+                if stop > len(data):
+                    raise IndexError("Stop address is greater than the length of the data!")
+
+                entry = AudioDataEntry(decoded[offset + 3 - start:stop + 1 - start])
+                by_offset[offset] = entry
+
+            entries[word_code] = entry
 
         return cls(entries)
 
-    def to_bytes(self, index: Index, base_offset: int = 0x200) -> bytes:
-        out_data = bytes()
+    @classmethod
+    def from_buffer(cls, data: ByteString, index: Index) -> AudioData:
+        """Like from_bytes, but entries are only decoded when accessed"""
+        return cls(_LazyEntries(data, index))
+
+    @staticmethod
+    def _unique_offsets(index: Index) -> Dict[int, int]:
+        """Map each distinct offset in the index to the first word code
+           using it, in offset order"""
+        offsets: Dict[int, int] = {}
         for word_code, offset in index.word_offsets.items():
-            out_data += self.entries[word_code].to_bytes(offset)
+            offsets.setdefault(offset, word_code)
+        return dict(sorted(offsets.items()))
 
-        return out_data
+    def to_bytes(self, index: Index, base_offset: int = 0x200) -> bytes:
+        return b''.join(self.entries[word_code].to_bytes(offset)
+                        for offset, word_code in self._unique_offsets(index).items())
+
+    def write_into(self, buffer: bytearray, index: Index) -> None:
+        for offset, word_code in self._unique_offsets(index).items():
+            self.entries[word_code].write_into(buffer, offset)
+
+    def trimmed(self, trim: ulaw.SilenceTrim) -> AudioData:
+        """Trim leading and trailing silence from every entry, logging
+           the bytes saved"""
+        # the regex searches hold the GIL, and only touch the ends of
+        # each entry, so there's nothing to gain from a pool
+        with profiling.phase("silence trim", self.data_length):
+            entries = {word_code: AudioDataEntry(trim.trim(entry.data))
+                       for word_code, entry in self.entries.items()}
+
+        _log_trimmed({word_code: len(entry.data) for word_code, entry in self.entries.items()},
+                     {word_code: len(entry.data) for word_code, entry in entries.items()})
+        return AudioData(entries)
+
+    def find_duplicates(self) -> Dict[int, int]:
+        """Find entries with identical audio, mapping the word code of each
+           duplicate to the first word code with the same audio"""
+        first_codes: Dict[bytes, int] = {}
+        duplicates = {}
+
+        for word_code, entry in self.entries.items():
+            digest = blake2b(entry.data, digest_size=16).digest()
+            first_code = first_codes.setdefault(digest, word_code)
+            if first_code != word_code:
+                duplicates[word_code] = first_code
+
+        return duplicates
 
     @property
     def data_length(self) -> int:
@@ -277,13 +616,34 @@ class AudioData:
     def full_length(self) -> int:
         return sum(len(entry.data) + 3 for entry in self.entries.values())
 
-    def check_audio_length(self) -> None:
-        """Calculate minutes of audio and compare with max"""
-        audio_length = self.data_length / (self.AUDIO_SAMPLE_RATE * 60)
-        if audio_length > self.MAX_AUDIO_LENGTH:
+    def stored_data_length(self, index: Index) -> int:
+        """Like data_length, but counting entries shared in the index once"""
+        return sum(len(self.entries[word_code].data)
+                   for word_code in self._unique_offsets(index).values())
+
+    def stored_full_length(self, index: Index) -> int:
+        """Like full_length, but counting entries shared in the index once"""
+        return sum(len(self.entries[word_code].data) + 3
+                   for word_code in self._unique_offsets(index).values())
+
+    def check_audio_length(self, index: Optional[Index] = None) -> None:
+        """Calculate minutes of audio and compare with max. If an index is
+           given, entries it shares between word codes are only counted once."""
+        stored_length = self.data_length if index is None else self.stored_data_length(index)
+        logging.info(f"Audio data: {self.data_length} bytes, "
+                     f"{stored_length} bytes stored")
+
+        self.check_length(stored_length)
+
+    @classmethod
+    def check_length(cls, stored_length: int) -> None:
+        """Compare a number of bytes of stored audio with the max, such as
+           the total size of the files to be packed, before reading them"""
+        audio_length = stored_length / (cls.AUDIO_SAMPLE_RATE * 60)
+        if audio_length > cls.MAX_AUDIO_LENGTH:
             raise AudioLengthException(
-                f"You have {audio_length:.2f} ({self.data_length} bytes) minutes "
-                f"of custom audio but the maximum is {self.MAX_AUDIO_LENGTH} minutes.\n"
+                f"You have {audio_length:.2f} ({stored_length} bytes) minutes "
+                f"of custom audio but the maximum is {cls.MAX_AUDIO_LENGTH} minutes.\n"
                 "Please remove or shorten some custom words")
 
 
@@ -296,30 +656,355 @@ class SpeechLib:
 
     @classmethod
     def from_bytes(cls, data: bytes) -> SpeechLib:
-        header = Header.from_bytes(data[0:0x100])
-        imageHeader = ImageHeader.from_bytes(data[0x100:0x200])
-        index = Index.from_bytes(data[0x200:0x200 + imageHeader.index_size])
+        with profiling.phase("header parse", 0x200):
+            header = Header.from_bytes(data[0:0x100])
+            imageHeader = ImageHeader.from_bytes(data[0x100:0x200])
+        with profiling.phase("index parse", imageHeader.index_size):
+            index = Index.from_bytes(data[0x200:0x200 + imageHeader.index_size])
 
-        audioData = AudioData.from_bytes(data, index)
+        with profiling.phase("entry decode", len(data)):
+            audioData = AudioData.from_bytes(data, index)
 
         return cls(header, imageHeader, index, audioData)
 
     @classmethod
     def from_file(cls, input_file: Path) -> SpeechLib:
+        with open(input_file, 'rb') as f, profiling.phase("file read"):
+            data = f.read()
+            profiling.count("file read", len(data))
+
+        return cls.from_bytes(data)
+
+    @staticmethod
+    def read_headers(input_stream: BinaryIO) -> Tuple[Header, ImageHeader, Index]:
+        """Read the header, image header and index from the start of a
+           stream, leaving it positioned at the start of the word data"""
+        with profiling.phase("header parse", 0x200):
+            header = Header.from_bytes(_read_exactly(input_stream, 0x100))
+            imageHeader = ImageHeader.from_bytes(_read_exactly(input_stream, 0x100))
+        with profiling.phase("index parse", imageHeader.index_size):
+            index = Index.from_bytes(_read_exactly(input_stream, imageHeader.index_size))
+
+        return header, imageHeader, index
+
+    @staticmethod
+    def read_stops(input_stream: BinaryIO, index: Index) -> Dict[int, int]:
+        """Read the stop address of each entry in the index from a seekable
+           stream, without reading the audio data itself. Returns a mapping
+           of entry offset to stop address, in file order."""
+        stops = {}
+
+        with profiling.phase("file read"):
+            for offset in sorted(set(index.word_offsets.values())):
+                input_stream.seek(offset)
+                stop = int.from_bytes(_read_exactly(input_stream, 3), "big")
+                if stop < offset + 2:
+                    raise IndexError(f"Entry at 0x{offset:X} has an invalid stop address!")
+                stops[offset] = stop
+        profiling.count("file read", len(stops) * 3)
+
+        return stops
+
+    @classmethod
+    def iter_entries(cls, input_stream: BinaryIO) -> Iterator[Tuple[int, AudioDataEntry]]:
+        """Yield (word code, entry) pairs from a speech lib in a stream, in
+           offset order. Only reads forward, and only holds one entry at a
+           time, so works on pipes and other non-seekable streams."""
+        _, imageHeader, index = cls.read_headers(input_stream)
+        position = 0x200 + imageHeader.index_size
+
+        by_offset: Dict[int, List[int]] = {}
+        for word_code, offset in index.word_offsets.items():
+            by_offset.setdefault(offset, []).append(word_code)
+
+        for offset in sorted(by_offset):
+            if offset < position:
+                raise IndexError(f"Entry at 0x{offset:X} overlaps the previous entry!")
+            with profiling.phase("file read"):
+                _skip(input_stream, offset - position)
+
+                stop = int.from_bytes(_read_exactly(input_stream, 3), "big")
+                if stop < offset + 2:
+                    raise IndexError(f"Entry at 0x{offset:X} has an invalid stop address!")
+
+                encoded = _read_exactly(input_stream, stop - offset - 2)
+            profiling.count("file read", stop + 1 - position)
+
+            with profiling.phase("entry decode", len(encoded)):
+                entry = AudioDataEntry(encoded.translate(_INVERT_TABLE))
+            position = stop + 1
+
+            for word_code in by_offset[offset]:
+                yield word_code, entry
+
+    @staticmethod
+    def read_words(input_file: Path, word_codes: Iterable[int]) -> Dict[int, AudioDataEntry]:
+        """Read just the given words from a speech lib file, seeking
+           directly to their index slots and entries"""
+        word_codes = list(word_codes)
+
         with open(input_file, 'rb') as f:
-            return cls.from_bytes(f.read())
+            f.seek(0x100)
+            imageHeader = ImageHeader.from_bytes(_read_exactly(f, 0x100))
+
+            offsets = {}
+            for word_code in sorted(set(word_codes)):
+                if word_code < 0 or word_code * 4 + 3 > imageHeader.index_size:
+                    raise KeyError(f"Word code {word_code} is outside of the index")
+
+                f.seek(0x200 + word_code * 4)
+                offset = int.from_bytes(_read_exactly(f, 3), "big")
+                if offset == 0xffffff:
+                    raise KeyError(f"Word code {word_code} is not in the index")
+                offsets[word_code] = offset
+
+            # read in file order, and each entry only once
+            entries: Dict[int, AudioDataEntry] = {}
+            for offset in sorted(set(offsets.values())):
+                f.seek(offset)
+                stop = int.from_bytes(_read_exactly(f, 3), "big")
+                if stop < offset + 2:
+                    raise IndexError(f"Entry at 0x{offset:X} has an invalid stop address!")
+
+                entries[offset] = AudioDataEntry(
+                    _read_exactly(f, stop - offset - 2).translate(_INVERT_TABLE))
+
+        return {word_code: entries[offsets[word_code]] for word_code in word_codes}
 
     @classmethod
-    def from_directory(cls, input_directory: Path) -> SpeechLib:
-        word_files = sorted(
-            f for f in input_directory.iterdir()
-            if f.stem.isdigit() and f.suffix == '.raw'
-            and int(f.stem) >= 3000 and int(f.stem) < 5000)
+    def read_word(cls, input_file: Path, word_code: int) -> AudioDataEntry:
+        return cls.read_words(input_file, [word_code])[word_code]
 
-        word_data = AudioData.from_files(word_files)
-        index = Index.from_AudioData(word_data)
+    @classmethod
+    def patch_file(cls, input_file: Path, words: Mapping[int, bytes]) -> None:
+        """Replace or add words in an existing speech lib file, in place.
+
+           Words that fit in their existing entry are overwritten there,
+           anything else is appended to the end of the file and the index
+           is repointed. The space left behind can be reclaimed with
+           compact_file."""
+        with open(input_file, 'r+b') as f:
+            _, imageHeader, index = cls.read_headers(f)
+            firstFree = imageHeader.firstFree
+            max_word = imageHeader.max_word
+
+            # check everything up front, so the file isn't left half patched
+            for word_code in words:
+                if word_code < 0 or word_code * 4 + 3 > imageHeader.index_size:
+                    raise KeyError(f"Word code {word_code} does not fit in the existing "
+                                   "index, the library must be rebuilt")
+
+            for word_code, data in words.items():
+                old_length = -1
+                offset = index.word_offsets.get(word_code)
+                if offset is not None:
+                    f.seek(offset)
+                    old_length = int.from_bytes(_read_exactly(f, 3), "big") - offset - 2
+
+                # entries shared with other word codes can't be overwritten
+                shared = offset is not None and \
+                    sum(other == offset for other in index.word_offsets.values()) > 1
+
+                if offset is not None and not shared and len(data) <= old_length:
+                    logging.debug("word code: %d overwriting at: 0x%06X", word_code, offset)
+                    f.seek(offset)
+                    f.write(AudioDataEntry(data).to_bytes(offset))
+                    # blank out the now unused tail of the old entry
+                    f.write(b'\xff' * (old_length - len(data)))
+                else:
+                    offset = firstFree
+                    logging.debug("word code: %d appending at: 0x%06X", word_code, offset)
+                    f.seek(offset)
+                    f.write(AudioDataEntry(data).to_bytes(offset))
+                    firstFree += len(data) + 3
+
+                    index.word_offsets[word_code] = offset
+                    f.seek(0x200 + word_code * 4)
+                    f.write(offset.to_bytes(3, "big"))
+
+                max_word = max(max_word, word_code)
+
+            # update the fields that track the end of the data in both headers
+            f.seek(0x39)
+            f.write((firstFree - 0x100).to_bytes(3, "big"))
+            f.seek(0x104)
+            f.write((max_word + 1).to_bytes(2, "big"))
+            f.write(firstFree.to_bytes(3, "big"))
+
+    def compacted(self) -> SpeechLib:
+        """Return a copy with the entries laid out contiguously in word
+           code order, dropping any unused space between them"""
+        audioData = AudioData({word_code: self.audioData.entries[word_code]
+                               for word_code in sorted(self.index.word_offsets)})
+        # keep sharing entries if this library already did
+        dedup = len(set(self.index.word_offsets.values())) < len(self.index.word_offsets)
+        index = Index.from_AudioData(audioData, dedup=dedup)
+
+        firstFree = 0x200 + index.index_size + audioData.stored_full_length(index)
+
+        return SpeechLib(
+            replace(self.header, firstFree=firstFree, timestamp=None),
+            ImageHeader(index.index_size, index.max_word, firstFree),
+            index,
+            audioData
+        )
 
-        firstFree = 0x200 + index.index_size + word_data.full_length
+    @classmethod
+    def compact_file(cls, input_file: Path) -> None:
+        """Rewrite a speech lib file without unused space, as left behind by patch_file"""
+        with cls.open(input_file) as speechLib:
+            data = speechLib.compacted().to_bytes()
+
+        with _atomic_open(input_file) as f:
+            f.write(data)
+
+    @classmethod
+    @contextmanager
+    def open(cls, input_file: Path) -> Iterator[SpeechLib]:
+        """Memory map a speech lib, parsing only the headers and index up
+           front. Entries are decoded when first accessed, and must be
+           accessed before the context exits."""
+        with open(input_file, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            data = memoryview(mapped)
+            try:
+                with profiling.phase("header parse", 0x200):
+                    header = Header.from_bytes(bytes(data[0:0x100]))
+                    imageHeader = ImageHeader.from_bytes(bytes(data[0x100:0x200]))
+                with profiling.phase("index parse", imageHeader.index_size):
+                    index = Index.from_bytes(bytes(data[0x200:0x200 + imageHeader.index_size]))
+
+                yield cls(header, imageHeader, index, AudioData.from_buffer(data, index))
+            finally:
+                data.release()
+
+    def render(self, word_codes: Iterable[int], gap_ms: int = 0,
+               lookup: Optional[Callable[[int], ByteString]] = None) -> bytearray:
+        """Join the audio of a phrase of words, with gap_ms of silence
+           between each, into a single buffer.
+
+           For a memory mapped speech lib, the buffer is sized from the
+           entries' stop addresses, the still encoded entries are copied
+           into it, and it is then decoded all at once. Otherwise each
+           distinct word is decoded once, or looked up with lookup if given
+           (such as from a cache), and copied in."""
+        if gap_ms < 0:
+            raise ValueError(f"The gap can't be negative, got {gap_ms} ms")
+
+        word_codes = list(word_codes)
+        gap = gap_ms * AudioData.AUDIO_SAMPLE_RATE // 1000
+        gaps = gap * max(len(word_codes) - 1, 0)
+        entries = self.audioData.entries
+
+        if lookup is None and isinstance(entries, _LazyEntries):
+            spans = {word_code: entries.encoded_span(word_code)
+                     for word_code in dict.fromkeys(word_codes)}
+            length = sum(end - start for start, end in map(spans.__getitem__, word_codes))
+            # encoded, so that it decodes to silence
+            buffer = bytearray(ulaw.SILENCE.translate(_INVERT_TABLE)) * (length + gaps)
+
+            with profiling.phase("render", length + gaps), memoryview(buffer) as output:
+                position = 0
+                for word_code in word_codes:
+                    start, end = spans[word_code]
+                    output[position:position + end - start] = entries._data[start:end]
+                    position += end - start + gap
+
+            with profiling.phase("entry decode", len(buffer)):
+                return buffer.translate(_INVERT_TABLE)
+
+        if lookup is None:
+            lookup = lambda word_code: entries[word_code].data  # noqa: E731
+        with profiling.phase("entry decode"):
+            words = {word_code: lookup(word_code) for word_code in dict.fromkeys(word_codes)}
+
+        length = sum(len(words[word_code]) for word_code in word_codes)
+        buffer = bytearray(ulaw.SILENCE) * (length + gaps)
+
+        with profiling.phase("render", length + gaps), memoryview(buffer) as output:
+            position = 0
+            for word_code in word_codes:
+                data = words[word_code]
+                output[position:position + len(data)] = data
+                position += len(data) + gap
+
+        return buffer
+
+    @staticmethod
+    def scan_directory(input_directory: Path,
+                       word_codes: Container[int] = range(3000, 5000),
+                       suffixes: Container[str] = ('raw',)) -> Dict[int, Tuple[Path, int]]:
+        """Find the custom word files in a directory, returning a mapping
+           of word code to path and size, sorted by word code. For WAV
+           files, the size is that of the audio once converted."""
+        word_files: Dict[int, Tuple[Path, int]] = {}
+
+        with profiling.phase("directory scan"), os.scandir(input_directory) as it:
+            for dir_entry in it:
+                stem, _, suffix = dir_entry.name.rpartition('.')
+                if suffix not in suffixes or not stem.isdigit() or not dir_entry.is_file():
+                    continue
+
+                word_code = int(stem)
+                if word_code not in word_codes:
+                    continue
+                if word_code in word_files:
+                    raise ValueError(f"Word code {word_code} has more than one file: "
+                                     f"{word_files[word_code][0].name}, {dir_entry.name}")
+
+                path = Path(dir_entry.path)
+                size = ulaw.wav_length(path) if suffix == 'wav' else dir_entry.stat().st_size
+                word_files[word_code] = (path, size)
+
+        return dict(sorted(word_files.items()))
+
+    @staticmethod
+    def plan(lengths: Mapping[int, int],
+             duplicates: Optional[Mapping[int, int]] = None) -> Tuple[Header, ImageHeader, Index]:
+        """Lay out a new speech lib containing audio of the given lengths,
+           with duplicates as for Index.from_lengths"""
+        index = Index.from_lengths(lengths, duplicates=duplicates)
+        firstFree = 0x200 + index.index_size + sum(
+            length + 3 for word_code, length in lengths.items()
+            if not duplicates or word_code not in duplicates)
+
+        return (Header(firstFree),
+                ImageHeader(index.index_size, index.max_word, firstFree),
+                index)
+
+    @classmethod
+    def from_directory(cls, input_directory: Path, jobs: int = 1, dedup: bool = False,
+                       trim: Optional[ulaw.SilenceTrim] = None,
+                       check_length: bool = True) -> SpeechLib:
+        """Build a speech lib from a directory of .raw (or .wav) files,
+           named by word code, optionally trimming silence from each.
+           Without check_length, more than MAX_AUDIO_LENGTH is allowed,
+           such as for benchmarks."""
+        word_files = cls.scan_directory(input_directory, suffixes=('raw', 'wav'))
+        if check_length and not dedup and trim is None:
+            # fail before reading anything if the audio can't fit
+            AudioData.check_length(sum(size for _, size in word_files.values()))
+
+        # lay out the library from the file sizes before reading anything
+        index = Index.from_lengths({word_code: size
+                                    for word_code, (_, size) in word_files.items()})
+        word_data = AudioData.from_files((path for path, _ in word_files.values()), jobs)
+
+        if any(len(word_data.entries[word_code].data) != size
+               for word_code, (_, size) in word_files.items()):
+            logging.warning("Files changed size while being read, recalculating index")
+            index = Index.from_AudioData(word_data)
+
+        if trim is not None:
+            word_data = word_data.trimmed(trim)
+
+        if dedup or trim is not None:
+            # sharing or trimming entries needs their contents, so can't be planned up front
+            index = Index.from_AudioData(word_data, dedup=dedup)
+
+        if check_length:
+            word_data.check_audio_length(index)
+        firstFree = 0x200 + index.index_size + word_data.stored_full_length(index)
 
         return cls(
             Header(firstFree),
@@ -328,8 +1013,84 @@ class SpeechLib:
             word_data
         )
 
-    def to_bytes(self) -> bytes:
-        return self.header.to_bytes() + \
-            self.imageHeader.to_bytes() + \
-            self.index.to_bytes() + \
-            self.audioData.to_bytes(self.index)
+    @classmethod
+    def write_directory(cls, input_directory: Path, output_file: Path, jobs: int = 1,
+                        algorithm: Optional[str] = None) -> Tuple[Index, Dict[int, str]]:
+        """Build a speech lib from a directory of .raw (or .wav) files like
+           from_directory, but writing it straight to output_file. The
+           layout is planned from the file sizes, then each raw file is
+           encoded a chunk at a time, so only WAV files (converted on a
+           pool of jobs processes) are held in memory.
+
+           Returns the index and, if algorithm is given, the hash of each
+           word's audio, hashed as it is written."""
+        word_files = cls.scan_directory(input_directory, suffixes=('raw', 'wav'))
+        lengths = {word_code: size for word_code, (_, size) in word_files.items()}
+        AudioData.check_length(sum(lengths.values()))
+        header, imageHeader, index = cls.plan(lengths)
+
+        wav_files = [path for path, _ in word_files.values() if path.suffix == '.wav']
+        with profiling.phase("wav convert"):
+            converted = dict(zip(wav_files, ulaw.read_wavs(wav_files, jobs) if jobs > 1 else []))
+
+        with profiling.phase("file write", header.firstFree), _atomic_open(output_file) as f:
+            f.write(header.to_bytes())
+            f.write(imageHeader.to_bytes())
+            f.write(index.to_bytes())
+
+            hashes = {}
+            for word_code, (path, size) in word_files.items():
+                offset = index.word_offsets[word_code]
+                assert f.tell() == offset
+                f.write((offset + size + 2).to_bytes(3, 'big'))
+                word_hash = None if algorithm is None else hashlib.new(algorithm)
+
+                if path.suffix == '.wav':
+                    data = converted.pop(path, None)
+                    if data is None:
+                        data = ulaw.read_wav(path)
+                    changed = len(data) != size
+                    if not changed:
+                        f.write(data.translate(_INVERT_TABLE))
+                        if word_hash is not None:
+                            word_hash.update(data)
+                else:
+                    with open(path, 'rb') as input_file:
+                        remaining = size
+                        while remaining > 0:
+                            data = input_file.read(min(remaining, _STREAM_CHUNK_SIZE))
+                            if not data:
+                                break
+                            f.write(data.translate(_INVERT_TABLE))
+                            if word_hash is not None:
+                                word_hash.update(data)
+                            remaining -= len(data)
+                        changed = remaining > 0 or bool(input_file.read(1))
+
+                # the index has already been written, so can't be recalculated
+                if changed:
+                    raise ValueError(f"{path} changed size while being read")
+                profiling.count("entry encode", size)
+                if word_hash is not None:
+                    hashes[word_code] = word_hash.hexdigest()
+
+            assert f.tell() == header.firstFree
+
+        return index, hashes
+
+    def to_bytes(self) -> bytearray:
+        """The whole speech lib file. This is the buffer it was built in,
+           returned as is rather than copied into an immutable bytes."""
+        # firstFree is the total length of the file, so everything
+        # can be written in place into a single buffer
+        buffer = bytearray(b'\xff') * self.header.firstFree
+
+        with profiling.phase("header encode", 0x200):
+            self.header.write_into(buffer, 0)
+            self.imageHeader.write_into(buffer, 0x100)
+        with profiling.phase("index encode", self.index.index_size):
+            self.index.write_into(buffer, 0x200)
+        with profiling.phase("entry encode", len(buffer)):
+            self.audioData.write_into(buffer, self.index)
+
+        return buffer
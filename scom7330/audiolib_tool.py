@@ -1,56 +1,548 @@
 #!/usr/bin/env python3
 
 import argparse
+import csv
+import glob
+import hashlib
+import io
+import json
 import logging
+import os
+import shlex
+import sys
+import time
+from concurrent.futures import (FIRST_COMPLETED, Future, ProcessPoolExecutor,
+                                ThreadPoolExecutor, as_completed, wait)
+from contextlib import nullcontext, redirect_stdout
+from dataclasses import dataclass
 from pathlib import Path
+from typing import (Any, BinaryIO, ByteString, ContextManager, Dict, Iterator, List, Optional,
+                    TextIO)
 
-from . import audiolib
+from . import audiolib, buildcache, profiling, server, ulaw
+from .catalog import Catalog, hash_audio
+from .diff import LibDiff
+from .manifest import Manifest
 
 
-def info(input_file: Path) -> None:
+# the shake algorithms need a digest length
+_HASH_ALGORITHMS = sorted(hashlib.algorithms_guaranteed - {'shake_128', 'shake_256'})
+
+
+class ExtractException(Exception):
+    pass
+
+
+def _summarize(imageHeader: audiolib.ImageHeader, index: audiolib.Index,
+               stops: Dict[int, int], file_size: int) -> Dict[str, Any]:
+    stored_length = sum(stop - offset - 2 for offset, stop in stops.items())
+    audio_seconds = stored_length / audiolib.AudioData.AUDIO_SAMPLE_RATE
+    max_seconds = audiolib.AudioData.MAX_AUDIO_LENGTH * 60
+
+    return {
+        'words': len(index.word_offsets),
+        'entries': len(stops),
+        'index_slots': imageHeader.index_size // 4,
+        'unused_index_slots': imageHeader.index_size // 4 - len(index.word_offsets),
+        'audio_bytes': stored_length,
+        'audio_seconds': audio_seconds,
+        'max_audio_seconds': max_seconds,
+        'slack_seconds': max_seconds - audio_seconds,
+        'file_size': file_size,
+        # left behind by patching, until the library is compacted
+        'unreferenced_bytes': (file_size - 0x200 - imageHeader.index_size
+                               - sum(stop - offset + 1 for offset, stop in stops.items())),
+    }
+
+
+def info(input_file: Path, output_format: str = 'text',
+         output: Optional[TextIO] = None) -> None:
+    """Describe a speech lib, reading only its headers, index and the
+       stop address of each entry"""
+    if output is None:
+        output = sys.stdout
+
     with open(input_file, 'rb') as f:
-        data = f.read()
+        header, imageHeader, index = audiolib.SpeechLib.read_headers(f)
+        stops = audiolib.SpeechLib.read_stops(f, index)
+        file_size = os.fstat(f.fileno()).st_size
+
+    def words() -> Iterator[Dict[str, Any]]:
+        for word_code, offset in index.word_offsets.items():
+            length = stops[offset] - offset - 2
+            yield {
+                'word_code': word_code,
+                'start': offset,
+                'end': stops[offset],
+                'length': length,
+                'seconds': length / audiolib.AudioData.AUDIO_SAMPLE_RATE,
+            }
+
+    if output_format == 'csv':
+        writer = csv.DictWriter(output, ['word_code', 'start', 'end', 'length', 'seconds'])
+        writer.writeheader()
+        writer.writerows(words())
+        return
+
+    summary = _summarize(imageHeader, index, stops, file_size)
+
+    if output_format == 'json':
+        json.dump({
+            'header': {
+                'name': header.name.decode('ascii', 'replace'),
+                'version': header.version.decode('ascii', 'replace'),
+                'timestamp': header.timestamp and header.timestamp.isoformat(),
+                'file_type': header.file_type,
+                'first_free': header.firstFree,
+            },
+            'image_header': {
+                'index_size': imageHeader.index_size,
+                'max_word': imageHeader.max_word,
+                'first_free': imageHeader.firstFree,
+            },
+            'words': list(words()),
+            'summary': summary,
+        }, output, indent=4)
+        print(file=output)
+        return
+
+    print(header, file=output)
+    print(imageHeader, file=output)
+
+    print("Audio Data:", file=output)
+    for word in words():
+        print(f"  word code: {word['word_code']:<5} "
+              f"start: 0x{word['start']:<6X} "
+              f"end: 0x{word['end']:<6X} "
+              f"length: 0x{word['length']:<6X} ({word['length']} bytes)", file=output)
+
+    print("Summary:", file=output)
+    print(f"  words: {summary['words']} ({summary['entries']} entries)", file=output)
+    print(f"  unused index slots: {summary['unused_index_slots']} "
+          f"of {summary['index_slots']}", file=output)
+    print(f"  audio: {summary['audio_seconds']:.2f} seconds "
+          f"({summary['audio_bytes']} bytes), "
+          f"{summary['slack_seconds']:.2f} seconds below the maximum", file=output)
+    print(f"  unreferenced: {summary['unreferenced_bytes']} bytes", file=output)
+
+
+def _open_input(input_file: Path) -> ContextManager[BinaryIO]:
+    """Open an input file, with "-" meaning stdin"""
+    if str(input_file) == '-':
+        return nullcontext(sys.stdin.buffer)
+    return open(input_file, 'rb')
+
+
+def _write_word(output_file: Path, data: ByteString, skip_existing: bool = False) -> bool:
+    """Write data to output_file, returning False if it was skipped
+       because the file already had that content"""
+    if skip_existing:
+        try:
+            if output_file.stat().st_size == len(data) and output_file.read_bytes() == data:
+                return False
+        except FileNotFoundError:
+            pass
 
-    speechLib = audiolib.SpeechLib.from_bytes(data)
+    with profiling.phase("file write", len(data)), open(output_file, 'wb') as f:
+        f.write(data)
 
-    print(speechLib.header)
-    print(speechLib.imageHeader)
+    return True
 
-    print("Audio Data:")
-    for word_code, offset in speechLib.index.word_offsets.items():
-        entry = speechLib.audioData.entries[word_code]
-        stop = int.from_bytes(data[offset:offset + 3], "big")
-        length = len(entry.data)
-        print(f"  word code: {word_code:<5} "
-              f"start: 0x{offset:<6X} "
-              f"end: 0x{stop:<6X} "
-              f"length: 0x{length:<6X} ({length} bytes)")
 
+def _write_entry(output_dir: Path, word_code: int, entry: audiolib.AudioDataEntry,
+                 output_format: str = 'raw', skip_existing: bool = False) -> bool:
+    if output_format == 'wav':
+        return _write_word(output_dir / f"{word_code}.wav", entry.to_wav(), skip_existing)
+    return _write_word(output_dir / f"{word_code}.raw", entry.data, skip_existing)
 
-def extract_audio(input_file: Path, output_dir: Path) -> None:
-    speechLib = audiolib.SpeechLib.from_file(input_file)
 
+def extract_audio(input_file: Path, output_dir: Path, jobs: int = 1,
+                  skip_existing: bool = False, output_format: str = 'raw') -> None:
+    """Write each word to output_dir, as raw μ-law or as a WAV file
+       decoded to 16 bit PCM"""
     output_dir.mkdir(exist_ok=True)
 
-    for word_code, entry in speechLib.audioData.entries.items():
+    errors: Dict[int, Exception] = {}
+    skipped = 0
+
+    def collect(futures: Dict[Future, int]) -> None:
+        nonlocal skipped
+        for future, word_code in futures.items():
+            try:
+                if not future.result():
+                    skipped += 1
+            except OSError as e:
+                errors[word_code] = e
+
+    with _open_input(input_file) as input_stream, ThreadPoolExecutor(jobs) as executor:
+        pending: Dict[Future, int] = {}
+
+        for word_code, entry in audiolib.SpeechLib.iter_entries(input_stream):
+            future = executor.submit(
+                _write_entry, output_dir, word_code, entry, output_format, skip_existing)
+            pending[future] = word_code
+
+            # bound the number of decoded entries held in memory at once
+            if len(pending) >= jobs * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect({future: pending.pop(future) for future in done})
+
+        wait(pending)
+        collect(pending)
+
+    if skipped:
+        logging.info(f"Skipped {skipped} unchanged files")
+
+    if errors:
+        for word_code, error in sorted(errors.items()):
+            logging.error(f"word code: {word_code}: {error}")
+        raise ExtractException(
+            f"Failed to write {len(errors)} words, first: {min(errors)}")
+
+
+def get_words(input_file: Path, word_codes: List[int], output_dir: Path) -> None:
+    entries = audiolib.SpeechLib.read_words(input_file, word_codes)
+
+    output_dir.mkdir(exist_ok=True)
+
+    for word_code, entry in entries.items():
         with open(output_dir / f"{word_code}.raw", 'wb') as f:
             f.write(entry.data)
 
 
-def generate_CustomAudioLib(input_dir: Path, output_file: Path) -> None:
-    speechLib = audiolib.SpeechLib.from_directory(input_dir)
+def patch(input_file: Path, word_files: List[Path], compact: bool) -> None:
+    words = {}
+    for word_file in word_files:
+        with open(word_file, 'rb') as f:
+            words[int(word_file.stem)] = f.read()
 
-    with open(output_file, 'wb') as f:
-        f.write(speechLib.to_bytes())
+    audiolib.SpeechLib.patch_file(input_file, words)
 
+    if compact:
+        audiolib.SpeechLib.compact_file(input_file)
 
-def main():
+
+def generate_CustomAudioLib(input_dir: Path, output_file: Path, jobs: int = 1,
+                            use_cache: bool = False,
+                            cache_size: int = buildcache.BuildCache.DEFAULT_MAX_SIZE,
+                            dedup: bool = False, manifest_file: Optional[Path] = None,
+                            algorithm: str = 'md5',
+                            trim: Optional[ulaw.SilenceTrim] = None) -> None:
+    """Pack a directory of raw audio files into output_file. If
+       manifest_file is given, a manifest of the words written is saved
+       there too, hashed as the words are written.
+
+       Entries are streamed to the output one at a time, except when they
+       are deduplicated or trimmed without the cache, which needs all of
+       them in memory."""
+    if use_cache:
+        with buildcache.BuildCache.for_output(output_file, cache_size) as cache:
+            index, hashes = buildcache.generate_cached(
+                input_dir, output_file, cache, jobs, dedup, trim,
+                None if manifest_file is None else algorithm)
+
+        if manifest_file is not None:
+            Manifest(algorithm, hashes, dict(index.word_offsets)).save(manifest_file)
+        return
+
+    if not dedup and trim is None:
+        index, hashes = audiolib.SpeechLib.write_directory(
+            input_dir, output_file, jobs, None if manifest_file is None else algorithm)
+
+        if manifest_file is not None:
+            Manifest(algorithm, hashes, dict(index.word_offsets)).save(manifest_file)
+        return
+
+    speechLib = audiolib.SpeechLib.from_directory(input_dir, jobs, dedup, trim)
+    data = speechLib.to_bytes()
+
+    # replaced rather than truncated, as it may be memory mapped by serve
+    with profiling.phase("file write", len(data)), audiolib._atomic_open(output_file) as f:
+        f.write(data)
+
+    if manifest_file is not None:
+        Manifest.from_words({word_code: entry.data for word_code, entry
+                             in speechLib.audioData.entries.items()},
+                            speechLib.index, algorithm, jobs).save(manifest_file)
+
+
+def render(input_file: Path, word_codes: List[int], output_file: Path,
+           gap_ms: int = 0, output_format: str = 'raw') -> None:
+    with audiolib.SpeechLib.open(input_file) as speechLib:
+        phrase = speechLib.render(word_codes, gap_ms)
+
+    data: ByteString = ulaw.to_wav(phrase) if output_format == 'wav' else phrase
+    with profiling.phase("file write", len(data)), open(output_file, 'wb') as f:
+        f.write(data)
+
+
+def plan_build(input_dir: Path, output_format: str = 'text',
+               output: Optional[TextIO] = None) -> bool:
+    """Lay out the speech lib that create would build from input_dir,
+       from the file sizes alone, returning False if the audio won't fit"""
+    if output is None:
+        output = sys.stdout
+
+    word_files = audiolib.SpeechLib.scan_directory(input_dir, suffixes=('raw', 'wav'))
+    lengths = {word_code: size for word_code, (_, size) in word_files.items()}
+    header, imageHeader, index = audiolib.SpeechLib.plan(lengths)
+
+    bytes_per_minute = audiolib.AudioData.AUDIO_SAMPLE_RATE * 60
+    audio_bytes = sum(lengths.values())
+    max_bytes = int(audiolib.AudioData.MAX_AUDIO_LENGTH * bytes_per_minute)
+    fits = audio_bytes <= max_bytes
+
+    summary = {
+        'words': len(lengths),
+        'max_word': imageHeader.max_word,
+        'index_size': index.index_size,
+        'first_free': header.firstFree,
+        'audio_bytes': audio_bytes,
+        'audio_minutes': audio_bytes / bytes_per_minute,
+        'max_audio_minutes': audiolib.AudioData.MAX_AUDIO_LENGTH,
+        'fits': fits,
+    }
+    # largest first, being the ones worth shortening
+    words = [{
+        'word_code': word_code,
+        'file': word_files[word_code][0].name,
+        'start': index.word_offsets[word_code],
+        'length': length,
+        'seconds': length / audiolib.AudioData.AUDIO_SAMPLE_RATE,
+        'budget_fraction': length / max_bytes,
+    } for word_code, length in sorted(lengths.items(), key=lambda item: (-item[1], item[0]))]
+
+    if output_format == 'json':
+        json.dump({'summary': summary, 'words': words}, output, indent=4)
+        print(file=output)
+        return fits
+
+    print(f"words: {summary['words']} (max word code {summary['max_word']})", file=output)
+    print(f"index size: 0x{index.index_size:X}", file=output)
+    print(f"firstFree: 0x{header.firstFree:X} ({header.firstFree} bytes)", file=output)
+    print(f"audio: {summary['audio_minutes']:.2f} of {summary['max_audio_minutes']} minutes "
+          f"({audio_bytes} of {max_bytes} bytes)"
+          f"{'' if fits else f', {audio_bytes - max_bytes} bytes too many'}", file=output)
+
+    print("Words, largest first:", file=output)
+    for word in words:
+        print(f"  word code: {word['word_code']:<5} "
+              f"length: {word['length']:<8} "
+              f"{word['seconds']:>7.2f}s "
+              f"{word['budget_fraction']:>7.2%} of the maximum", file=output)
+
+    return fits
+
+
+def diff(old_file: Path, new_file: Path, output_format: str = 'text',
+         output: Optional[TextIO] = None, catalog_file: Optional[Path] = None) -> bool:
+    """Print the differences between two speech libs, returning whether
+       they are identical. With catalog_file, the libraries are compared
+       by their catalogued hashes, without being read."""
+    if output is None:
+        output = sys.stdout
+
+    if catalog_file is None:
+        libDiff = LibDiff.from_files(old_file, new_file)
+    else:
+        with Catalog(catalog_file) as catalog:
+            libDiff = catalog.diff(old_file, new_file)
+    if output_format == 'json':
+        json.dump(libDiff.to_json(), output, indent=4)
+        print(file=output)
+    else:
+        print(libDiff, file=output)
+
+    return libDiff.identical
+
+
+def verify(path: Path, manifest_file: Path, jobs: int = 1) -> bool:
+    """Check a speech lib or directory of raw audio files against a
+       manifest, logging any mismatches"""
+    expected = Manifest.load(manifest_file)
+    actual = Manifest.from_path(path, expected.algorithm, jobs)
+
+    mismatches = expected.compare(actual)
+    for mismatch in mismatches:
+        logging.error(mismatch)
+
+    print(f"{path}: {'OK' if not mismatches else f'{len(mismatches)} mismatches'}")
+    return not mismatches
+
+
+def _audio_hash(catalog: Catalog, args: argparse.Namespace) -> str:
+    """The hash of the audio to search for, from the catalog query arguments"""
+    if args.hash is not None:
+        return args.hash
+    if args.file is not None:
+        if args.file.suffix == '.wav':
+            data = ulaw.read_wav(args.file)
+        else:
+            with open(args.file, 'rb') as f:
+                data = f.read()
+        return hash_audio(data)
+
+    return catalog.word_hash(args.source_lib, args.word_code)
+
+
+def catalog_command(args: argparse.Namespace, output: Optional[TextIO] = None) -> bool:
+    """Run a catalog subcommand, returning False if a query found nothing
+       or a library couldn't be catalogued"""
+    if output is None:
+        output = sys.stdout
+
+    if args.catalog_command == 'diff':
+        return diff(args.old_file, args.new_file, args.output_format, output, args.db)
+
+    with Catalog(args.db) as catalog:
+        if args.catalog_command == 'update':
+            lib_files: List[Path] = []
+            for path in args.paths:
+                if not path.is_dir():
+                    lib_files.append(path)
+                    continue
+                # skipping the blobs in create's build cache directories
+                lib_files.extend(lib_file for lib_file in sorted(path.rglob('*.bin'))
+                                 if not any(part.endswith('.cache') for part
+                                            in lib_file.relative_to(path).parent.parts))
+            updated, unchanged, pruned, failed = catalog.update(lib_files, args.prune)
+            print(f"{updated} updated, {unchanged} unchanged, {pruned} pruned, {failed} failed",
+                  file=output)
+            return not failed
+
+        elif args.catalog_command == 'list':
+            for path, name, version, timestamp, words in catalog.libraries():
+                print(f"{path}  {name} {version}  "
+                      f"timestamp: {'unknown' if timestamp is None else timestamp.isoformat(' ')}"
+                      f"  words: {words}", file=output)
+
+        elif args.catalog_command in ('find', 'first'):
+            occurrences = catalog.find(_audio_hash(catalog, args), args.word_code)
+            if args.catalog_command == 'first':
+                occurrences = occurrences[:1]
+            for occurrence in occurrences:
+                print(occurrence, file=output)
+            return bool(occurrences)
+
+        elif args.catalog_command == 'dedup':
+            groups = catalog.duplicates(args.lib_file)
+            for word_codes, saving in groups:
+                print(f"word codes: {', '.join(map(str, word_codes))}  "
+                      f"saving: {saving} bytes", file=output)
+            print(f"{sum(saving for _, saving in groups)} bytes could be saved "
+                  "with create --dedup", file=output)
+
+    return True
+
+
+@dataclass
+class JobResult:
+    argv: List[str]
+    ok: bool
+    seconds: float
+    output: str = ''
+    error: str = ''
+
+
+def _init_worker(log_level: int) -> None:
+    logging.basicConfig(format="{levelname}: {message}", style='{', level=log_level)
+
+
+def _run_job(argv: List[str]) -> JobResult:
+    """Run one batch job in a worker process, capturing its output and
+       any failure"""
+    output = io.StringIO()
+    start = time.perf_counter()
+
+    try:
+        args = parse_args(argv)
+        if args.subcommand == 'batch':
+            raise ValueError("batch jobs can't be nested")
+        with redirect_stdout(output):
+            ok = run(args)
+    except SystemExit as e:
+        # argparse errors, the usage message having gone to stderr
+        return JobResult(argv, False, time.perf_counter() - start, output.getvalue(),
+                         f"invalid arguments (exit status {e.code})")
+    except Exception as e:
+        return JobResult(argv, False, time.perf_counter() - start, output.getvalue(),
+                         f"{type(e).__name__}: {e}")
+
+    if not ok:
+        # as main() would exit, such as for a failed verify
+        return JobResult(argv, False, time.perf_counter() - start, output.getvalue(),
+                         "exited with status 1")
+    return JobResult(argv, True, time.perf_counter() - start, output.getvalue())
+
+
+def _read_manifest(manifest: Path) -> List[List[str]]:
+    """Read a batch manifest: one tool command line per line, ignoring
+       blank lines and # comments"""
+    with (nullcontext(sys.stdin) if str(manifest) == '-' else open(manifest)) as f:
+        return [argv for argv in (shlex.split(line, comments=True) for line in f) if argv]
+
+
+def _expand_glob(pattern: str, template: List[str]) -> List[List[str]]:
+    """Make a job from template for each path matching pattern, replacing
+       {path}, {name} and {stem} in its arguments"""
+    return [[arg.format(path=path, name=Path(path).name, stem=Path(path).stem)
+             for arg in template]
+            for path in sorted(glob.glob(pattern))]
+
+
+def batch(job_argvs: List[List[str]], jobs: Optional[int] = None) -> List[JobResult]:
+    """Run tool command lines across a pool of worker processes, so the
+       interpreter is only started once per worker. Each job's output is
+       printed when it finishes, and a failed job doesn't stop the others."""
+    results = []
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(jobs, initializer=_init_worker,
+                             initargs=(logging.getLogger().level,)) as executor:
+        futures = {executor.submit(_run_job, argv): argv for argv in job_argvs}
+
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+
+            sys.stdout.write(result.output)
+            command = shlex.join(result.argv)
+            if result.ok:
+                logging.info(f"ok ({result.seconds:.2f}s): {command}")
+            else:
+                logging.error(f"failed ({result.seconds:.2f}s): {command}: {result.error}")
+
+    failed = [result for result in results if not result.ok]
+    print(f"{len(results)} jobs in {time.perf_counter() - start:.2f}s: "
+          f"{len(results) - len(failed)} succeeded, {len(failed)} failed", file=sys.stderr)
+    for result in failed:
+        print(f"  {shlex.join(result.argv)}: {result.error}", file=sys.stderr)
+
+    return results
+
+
+def _non_negative_int(value: str) -> int:
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"{value} is negative")
+    return number
+
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument("-l", "--log", dest="logLevel",
                         choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
                         default="WARNING",
                         help="Set the logging level")
+    parser.add_argument("--profile",
+                        action='store_true',
+                        help="Print the time, bytes processed and peak memory "
+                        "of each phase to stderr")
+    parser.add_argument("--profile-format",
+                        choices=['table', 'json'],
+                        default='table',
+                        help="The format of the --profile output")
 
     subparsers = parser.add_subparsers(title="Subcommands",
                                        dest='subcommand',
@@ -71,6 +563,43 @@ def main():
                                nargs='?',
                                default='CustomAudioLib.bin',
                                help="The output audio library file")
+    parser_create.add_argument('-j', '--jobs',
+                               type=int,
+                               default=1,
+                               help="Number of files to read concurrently")
+    parser_create.add_argument('--no-cache',
+                               dest='use_cache',
+                               action='store_false',
+                               help="Don't use or update the build cache "
+                               "(a directory named after the output file, plus .cache)")
+    parser_create.add_argument('--cache-size',
+                               type=int,
+                               default=buildcache.BuildCache.DEFAULT_MAX_SIZE // 2**20,
+                               help="Maximum size of the build cache, in MiB")
+    parser_create.add_argument('--dedup',
+                               action='store_true',
+                               help="Store words with identical audio only once")
+    parser_create.add_argument('--trim-silence',
+                               action='store_true',
+                               help="Trim leading and trailing silence from each word")
+    parser_create.add_argument('--silence-threshold',
+                               type=int,
+                               default=ulaw.SilenceTrim.threshold,
+                               help="For --trim-silence, the loudest sample counted as silence, "
+                               "as a 16 bit amplitude")
+    parser_create.add_argument('--trim-padding',
+                               type=int,
+                               default=ulaw.SilenceTrim.padding * 1000 // ulaw.SAMPLE_RATE,
+                               help="For --trim-silence, milliseconds of silence to keep "
+                               "before and after each word")
+    parser_create.add_argument('--manifest',
+                               type=Path,
+                               help="Also write a manifest of the hash and offset of each word "
+                               "to this file, without reading the output back")
+    parser_create.add_argument('--algorithm',
+                               choices=_HASH_ALGORITHMS,
+                               default='md5',
+                               help="Hash algorithm for --manifest")
 
     parser_extract = subparsers.add_parser(
         'extract',
@@ -80,12 +609,101 @@ def main():
                                 type=Path,
                                 nargs='?',
                                 default='CustomAudioLib.bin',
-                                help="The input audio library file")
+                                help="The input audio library file, or - for stdin")
     parser_extract.add_argument('output_dir',
                                 type=Path,
                                 nargs='?',
                                 default='CustomAudioFiles',
                                 help="A directory to which raw audio files will be written")
+    parser_extract.add_argument('-j', '--jobs',
+                                type=int,
+                                default=1,
+                                help="Number of files to write concurrently")
+    parser_extract.add_argument('--skip-existing',
+                                action='store_true',
+                                help="Don't rewrite files whose size and contents already match")
+    parser_extract.add_argument('--format',
+                                dest='output_format',
+                                choices=['raw', 'wav'],
+                                default='raw',
+                                help="Write raw μ-law files, or WAV files decoded to 16 bit PCM")
+
+    parser_get = subparsers.add_parser(
+        'get',
+        help="Extract specific words from a speech lib, without reading the rest",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser_get.add_argument('input_file',
+                            type=Path,
+                            help="The input audio library file")
+    parser_get.add_argument('word_codes',
+                            type=int,
+                            nargs='+',
+                            help="The word codes to extract")
+    parser_get.add_argument('-o', '--output-dir',
+                            type=Path,
+                            default='.',
+                            help="A directory to which raw audio files will be written")
+
+    parser_render = subparsers.add_parser(
+        'render',
+        help="Join words from a speech lib into a single audio file, "
+        "to preview an announcement",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser_render.add_argument('input_file',
+                               type=Path,
+                               help="The input audio library file")
+    parser_render.add_argument('word_codes',
+                               type=int,
+                               nargs='+',
+                               help="The word codes of the phrase, in order")
+    parser_render.add_argument('-o', '--output',
+                               type=Path,
+                               default='phrase.raw',
+                               help="The audio file to write")
+    parser_render.add_argument('--gap',
+                               type=_non_negative_int,
+                               default=0,
+                               help="Milliseconds of silence between words")
+    parser_render.add_argument('--format',
+                               dest='output_format',
+                               choices=['raw', 'wav'],
+                               default='raw',
+                               help="Write raw μ-law, or a WAV file decoded to 16 bit PCM")
+
+    parser_serve = subparsers.add_parser(
+        'serve',
+        help="Serve the words of speech libs over HTTP, for previewing words and phrases",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser_serve.add_argument('lib_files',
+                              type=Path,
+                              nargs='+',
+                              help="The audio library files to serve, named by file stem")
+    parser_serve.add_argument('--host',
+                              default='127.0.0.1',
+                              help="The address to listen on")
+    parser_serve.add_argument('--port',
+                              type=int,
+                              default=8330,
+                              help="The port to listen on")
+    parser_serve.add_argument('--cache-size',
+                              type=int,
+                              default=16,
+                              help="Size limit of the decoded word cache, in MiB")
+
+    parser_patch = subparsers.add_parser(
+        'patch',
+        help="Replace or add words in an existing audio library, in place",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser_patch.add_argument('input_file',
+                              type=Path,
+                              help="The audio library file to modify")
+    parser_patch.add_argument('word_files',
+                              type=Path,
+                              nargs='*',
+                              help="Raw audio files to add, named by word code (ex 4001.raw)")
+    parser_patch.add_argument('--compact',
+                              action='store_true',
+                              help="Afterwards, rewrite the library to reclaim unused space")
 
     parser_info = subparsers.add_parser(
         'info',
@@ -96,20 +714,260 @@ def main():
                              nargs='?',
                              default='CustomAudioLib.bin',
                              help="The input audio library file")
+    parser_info.add_argument('--format',
+                             dest='output_format',
+                             choices=['text', 'json', 'csv'],
+                             default='text',
+                             help="Output format. csv lists only the words, "
+                             "without headers or summary")
+
+    parser_plan = subparsers.add_parser(
+        'plan',
+        help="Lay out a new audio library from the input file sizes, "
+        "without reading any audio, and check that it will fit",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser_plan.add_argument('input_dir',
+                             type=Path,
+                             nargs='?',
+                             default='CustomAudioFiles',
+                             help="A directory with raw audio files to pack")
+    parser_plan.add_argument('--format',
+                             dest='output_format',
+                             choices=['text', 'json'],
+                             default='text',
+                             help="Output format")
+
+    parser_diff = subparsers.add_parser(
+        'diff',
+        help="Compare two audio libraries, exiting with status 1 if they differ",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser_diff.add_argument('old_file',
+                             type=Path,
+                             help="The original audio library file")
+    parser_diff.add_argument('new_file',
+                             type=Path,
+                             help="The audio library file to compare with it")
+    parser_diff.add_argument('--format',
+                             dest='output_format',
+                             choices=['text', 'json'],
+                             default='text',
+                             help="Output format")
+
+    parser_manifest = subparsers.add_parser(
+        'manifest',
+        help="Write the hash (and offset) of each word in a speech lib or directory",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser_manifest.add_argument('input_path',
+                                 type=Path,
+                                 help="An audio library file, or a directory of raw audio files")
+    parser_manifest.add_argument('-o', '--output',
+                                 type=Path,
+                                 help="The manifest file to write (default: stdout)")
+    parser_manifest.add_argument('--algorithm',
+                                 choices=_HASH_ALGORITHMS,
+                                 default='md5',
+                                 help="Hash algorithm")
+    parser_manifest.add_argument('-j', '--jobs',
+                                 type=int,
+                                 default=1,
+                                 help="Number of words to hash concurrently")
+
+    parser_verify = subparsers.add_parser(
+        'verify',
+        help="Check a speech lib or directory against a manifest",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser_verify.add_argument('input_path',
+                               type=Path,
+                               help="An audio library file, or a directory of raw audio files")
+    parser_verify.add_argument('manifest',
+                               type=Path,
+                               help="The manifest to check against")
+    parser_verify.add_argument('-j', '--jobs',
+                               type=int,
+                               default=1,
+                               help="Number of words to hash concurrently")
+
+    parser_catalog = subparsers.add_parser(
+        'catalog',
+        help="Index speech libs into an SQLite catalog, and query it",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser_catalog.add_argument('--db',
+                                type=Path,
+                                default=Catalog.DEFAULT_PATH,
+                                help="The catalog database file")
+    catalog_subparsers = parser_catalog.add_subparsers(dest='catalog_command', required=True)
+
+    parser_catalog_update = catalog_subparsers.add_parser(
+        'update',
+        help="Add new or changed speech libs to the catalog",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser_catalog_update.add_argument('paths',
+                                       type=Path,
+                                       nargs='+',
+                                       help="Audio library files, or directories to search "
+                                       "for .bin files (outside any .cache directories)")
+    parser_catalog_update.add_argument('--prune',
+                                       action='store_true',
+                                       help="Also forget libraries whose files no longer exist")
+
+    catalog_subparsers.add_parser(
+        'list',
+        help="List the catalogued speech libs, oldest first")
+
+    query_commands = [
+        ('find', "List every catalogued word with some audio, oldest first"),
+        ('first', "Find where some audio first appeared, by library timestamp"),
+    ]
+    for name, help_text in query_commands:
+        parser_query = catalog_subparsers.add_parser(
+            name,
+            help=help_text,
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+        parser_query.add_argument('word_code',
+                                  type=int,
+                                  nargs='?',
+                                  help="Only look for the audio with this word code "
+                                  "(and with --from, the word whose audio to look for)")
+        audio_group = parser_query.add_mutually_exclusive_group(required=True)
+        audio_group.add_argument('--from',
+                                 dest='source_lib',
+                                 type=Path,
+                                 help="The catalogued audio library the word is from")
+        audio_group.add_argument('--file',
+                                 type=Path,
+                                 help="A raw or WAV audio file with the audio to look for")
+        audio_group.add_argument('--hash',
+                                 help="The catalog hash of the audio to look for")
+
+    parser_catalog_diff = catalog_subparsers.add_parser(
+        'diff',
+        help="Compare two catalogued audio libraries, exiting with status 1 if they differ",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser_catalog_diff.add_argument('old_file',
+                                     type=Path,
+                                     help="The original audio library file")
+    parser_catalog_diff.add_argument('new_file',
+                                     type=Path,
+                                     help="The audio library file to compare with it")
+    parser_catalog_diff.add_argument('--format',
+                                     dest='output_format',
+                                     choices=['text', 'json'],
+                                     default='text',
+                                     help="Output format")
+
+    parser_catalog_dedup = catalog_subparsers.add_parser(
+        'dedup',
+        help="List the words of a catalogued library with the same audio, "
+        "and the space create --dedup would save")
+    parser_catalog_dedup.add_argument('lib_file',
+                                      type=Path,
+                                      help="The audio library file")
+
+    parser_batch = subparsers.add_parser(
+        'batch',
+        help="Run many subcommands, across a pool of processes",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser_batch.add_argument('-m', '--manifest',
+                              type=Path,
+                              help="A file (or - for stdin) with one subcommand line per job, "
+                              "like 'extract site1.bin site1/'")
+    parser_batch.add_argument('--glob',
+                              metavar='PATTERN',
+                              help="Instead of a manifest, run COMMAND for each matching path")
+    parser_batch.add_argument('command',
+                              nargs=argparse.REMAINDER,
+                              help="With --glob, the subcommand line to run (after any "
+                              "other options), in which "
+                              "{path}, {name} and {stem} are replaced by the matched path, "
+                              "ex: info --format json {path}")
+    parser_batch.add_argument('-j', '--jobs',
+                              type=int,
+                              help="Number of processes (default: the number of CPUs)")
 
-    args = parser.parse_args()
+    return parser
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse the command line (sys.argv by default), exiting with a usage
+       error for combinations of arguments argparse can't check itself"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if (args.subcommand == 'catalog' and args.catalog_command in ('find', 'first')
+            and args.source_lib is not None and args.word_code is None):
+        parser.error(f"catalog {args.catalog_command} --from needs a word code")
+    if args.subcommand == 'batch' and (args.glob is None) == (args.manifest is None):
+        parser.error("batch needs either a manifest or --glob")
+    return args
+
+
+def run(args: argparse.Namespace) -> bool:
+    """Run the subcommand from parsed arguments, returning False if it
+       partially failed"""
+    if args.subcommand == 'create':
+        generate_CustomAudioLib(args.input_dir, args.output_file, args.jobs,
+                                args.use_cache, args.cache_size * 2**20, args.dedup,
+                                args.manifest, args.algorithm,
+                                ulaw.SilenceTrim(args.silence_threshold,
+                                                 args.trim_padding * ulaw.SAMPLE_RATE // 1000)
+                                if args.trim_silence else None)
+    elif args.subcommand == 'info':
+        info(args.input_file, args.output_format)
+    elif args.subcommand == 'extract':
+        extract_audio(args.input_file, args.output_dir, args.jobs, args.skip_existing,
+                      args.output_format)
+    elif args.subcommand == 'render':
+        render(args.input_file, args.word_codes, args.output, args.gap, args.output_format)
+    elif args.subcommand == 'serve':
+        server.serve(args.lib_files, args.host, args.port, args.cache_size * 2**20)
+    elif args.subcommand == 'patch':
+        patch(args.input_file, args.word_files, args.compact)
+    elif args.subcommand == 'get':
+        get_words(args.input_file, args.word_codes, args.output_dir)
+    elif args.subcommand == 'plan':
+        return plan_build(args.input_dir, args.output_format)
+    elif args.subcommand == 'diff':
+        return diff(args.old_file, args.new_file, args.output_format)
+    elif args.subcommand == 'manifest':
+        manifest = Manifest.from_path(args.input_path, args.algorithm, args.jobs)
+        if args.output is None:
+            json.dump(manifest.to_json(), sys.stdout, indent=4)
+            print()
+        else:
+            manifest.save(args.output)
+    elif args.subcommand == 'verify':
+        return verify(args.input_path, args.manifest, args.jobs)
+    elif args.subcommand == 'catalog':
+        return catalog_command(args)
+    elif args.subcommand == 'batch':
+        job_argvs = (_read_manifest(args.manifest) if args.glob is None
+                     else _expand_glob(args.glob, args.command))
+        return all(result.ok for result in batch(job_argvs, args.jobs))
+
+    return True
+
+
+def main():
+    args = parse_args()
 
     logging.basicConfig(
         format="{levelname}: {message}",
         style='{',
         level=logging.getLevelName(args.logLevel))
 
-    if args.subcommand == 'create':
-        generate_CustomAudioLib(args.input_dir, args.output_file)
-    elif args.subcommand == 'info':
-        info(args.input_file)
-    elif args.subcommand == 'extract':
-        extract_audio(args.input_file, args.output_dir)
+    profile = profiling.profile() if args.profile else nullcontext()
+
+    with profile as profiler:
+        ok = run(args)
+
+    if args.profile:
+        if args.profile_format == 'json':
+            print(json.dumps(profiler.to_dict(), indent=4), file=sys.stderr)
+        else:
+            print(profiler.format_table(), file=sys.stderr)
+
+    if not ok:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
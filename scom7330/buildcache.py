@@ -0,0 +1,316 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from hashlib import blake2b
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from . import profiling, ulaw
+from .audiolib import (_INVERT_TABLE, AudioData, AudioDataEntry, Index, SpeechLib,
+                       _atomic_open, _log_trimmed)
+
+
+class BuildCache:
+    """On-disk cache of encoded (inverted) entries, for rebuilding a
+       speech lib when only some of the input files have changed.
+
+       Input files are identified by path, size and mtime, and their
+       encoded data is looked up by content hash, first in the previous
+       build's output file, then in the cache directory. The cache
+       directory is limited to max_size bytes, evicting the least
+       recently used entries."""
+
+    DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+    MANIFEST_NAME = 'manifest.json'
+
+    def __init__(self, cache_dir: Path, max_size: int = DEFAULT_MAX_SIZE) -> None:
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+
+        # path -> {size, mtime_ns, hash}
+        self._files: Dict[str, Dict[str, Any]] = {}
+        # hash -> (offset, length) of the encoded data in the previous output
+        self._output_entries: Dict[str, Tuple[int, int]] = {}
+        self._output_record: Optional[Dict[str, Any]] = None
+        self._output: Optional[mmap.mmap] = None
+
+        self._load()
+
+    @classmethod
+    def for_output(cls, output_file: Path, max_size: int = DEFAULT_MAX_SIZE) -> BuildCache:
+        """The cache for builds of output_file, in a directory beside it"""
+        return cls(output_file.with_name(output_file.name + '.cache'), max_size)
+
+    def __enter__(self) -> BuildCache:
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def _load(self) -> None:
+        try:
+            with open(self.cache_dir / self.MANIFEST_NAME) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        self._files = manifest.get('files', {})
+        output = manifest.get('output')
+        if output is None:
+            return
+
+        # only trust the previous output if it hasn't changed since. It is
+        # memory mapped, which stays valid once the new output replaces it
+        try:
+            with open(output['path'], 'rb') as output_file:
+                stat = os.fstat(output_file.fileno())
+                if stat.st_size != output['size'] or stat.st_mtime_ns != output['mtime_ns']:
+                    return
+                self._output = mmap.mmap(output_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return
+
+        self._output_record = output
+        self._output_entries = {content_hash: (offset, length)
+                                for content_hash, (offset, length) in output['entries'].items()}
+
+    def _blob_path(self, content_hash: str) -> Path:
+        return self.cache_dir / f"{content_hash}.bin"
+
+    def _touch(self, content_hash: str) -> None:
+        """Mark a blob as recently used, for _evict"""
+        try:
+            os.utime(self._blob_path(content_hash))
+        except FileNotFoundError:
+            pass
+
+    def _get(self, content_hash: str) -> Optional[bytes]:
+        location = self._output_entries.get(content_hash)
+        if location is not None and self._output is not None:
+            # the blob is kept in use too, for when the output changes
+            self._touch(content_hash)
+            offset, length = location
+            return self._output[offset:offset + length]
+
+        try:
+            with open(self._blob_path(content_hash), 'rb') as f:
+                encoded = f.read()
+        except FileNotFoundError:
+            return None
+
+        self._touch(content_hash)
+        return encoded
+
+    def _put(self, content_hash: str, encoded: bytes) -> None:
+        blob_path = self._blob_path(content_hash)
+        if not blob_path.exists():
+            self.cache_dir.mkdir(exist_ok=True)
+            with _atomic_open(blob_path) as f:
+                f.write(encoded)
+
+    def _fresh_record(self, path: Path, stat: os.stat_result) -> Optional[Dict[str, Any]]:
+        record = self._files.get(str(path))
+        if record is not None and record['size'] == stat.st_size \
+           and record['mtime_ns'] == stat.st_mtime_ns:
+            return record
+        return None
+
+    def is_fresh(self, path: Path) -> bool:
+        """Whether the file at path is unchanged since it was last encoded"""
+        return self._fresh_record(path, path.stat()) is not None
+
+    def encode(self, path: Path, data: Optional[bytes] = None) -> Tuple[str, bytes]:
+        """Return the content hash and encoded data of the raw audio file at
+           path (or WAV file, converted unless data is given)"""
+        stat = path.stat()
+        record = self._fresh_record(path, stat)
+
+        if record is not None:
+            encoded = self._get(record['hash'])
+            if encoded is not None:
+                self.hits += 1
+                return record['hash'], encoded
+
+        self.misses += 1
+        if data is None:
+            if path.suffix == '.wav':
+                data = ulaw.read_wav(path)
+            else:
+                with open(path, 'rb') as f:
+                    data = f.read()
+
+        profiling.count("entry encode", len(data))
+        content_hash = blake2b(data, digest_size=16).hexdigest()
+        cached = self._get(content_hash)
+        encoded = cached if cached is not None else AudioDataEntry(data).encoded()
+        self._put(content_hash, encoded)
+
+        self._files[str(path)] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'hash': content_hash,
+        }
+
+        return content_hash, encoded
+
+    def record_output(self, output_file: Path, index: Index,
+                      entries: Dict[int, Tuple[str, int]]) -> None:
+        """Note the location of each (hash, length) entry in a newly built
+           output file, so it can be used as a source by the next build"""
+        stat = output_file.stat()
+        self._output_record = {
+            'path': str(output_file.resolve()),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'entries': {content_hash: (index.word_offsets[word_code] + 3, length)
+                        for word_code, (content_hash, length) in entries.items()},
+        }
+
+    def _evict(self) -> None:
+        blobs = []
+        for dir_entry in os.scandir(self.cache_dir):
+            if dir_entry.name.endswith('.bin'):
+                stat = dir_entry.stat()
+                blobs.append((stat.st_mtime_ns, stat.st_size, dir_entry.path))
+
+        total_size = sum(size for _, size, _ in blobs)
+        for _, size, path in sorted(blobs):
+            if total_size <= self.max_size:
+                break
+            os.unlink(path)
+            total_size -= size
+
+    def close(self) -> None:
+        """Write out the manifest, forgetting input files that no longer
+           exist, and enforce the size limit"""
+        if self._output is not None:
+            self._output.close()
+            self._output = None
+
+        self._files = {path: record for path, record in self._files.items()
+                       if os.path.exists(path)}
+
+        self.cache_dir.mkdir(exist_ok=True)
+        self._evict()
+
+        with _atomic_open(self.cache_dir / self.MANIFEST_NAME) as f:
+            f.write(json.dumps({
+                'files': self._files,
+                'output': self._output_record,
+            }).encode())
+
+
+def _trim_encoded(entry: Tuple[str, bytes], trim: ulaw.SilenceTrim) -> Tuple[str, bytes]:
+    content_hash, encoded = entry
+    # the encoding maps bytes one to one, so could be trimmed as is, but
+    # the loudness thresholds are for decoded bytes
+    trimmed = trim.trim(encoded.translate(_INVERT_TABLE)).translate(_INVERT_TABLE)
+    if len(trimmed) == len(encoded):
+        return entry
+
+    # not the content hash of the file, so the trimmed data isn't
+    # mistaken for it by later builds
+    return f"{content_hash}-trim-{trim.threshold}-{trim.padding}", trimmed
+
+
+@dataclass
+class _PlannedEntry:
+    # of the input file, by which the encoded data is cached
+    content_hash: str
+    # of the entry as written, which differs if it was trimmed
+    entry_hash: str
+    length: int
+    untrimmed_length: int
+
+
+def generate_cached(input_directory: Path, output_file: Path,
+                    cache: BuildCache, jobs: int = 1, dedup: bool = False,
+                    trim: Optional[ulaw.SilenceTrim] = None,
+                    algorithm: Optional[str] = None) -> Tuple[Index, Dict[int, str]]:
+    """Build a speech lib from a directory of raw audio files, like
+       SpeechLib.from_directory, but taking encoded entries from the cache
+       for any files that haven't changed.
+
+       Entries are first encoded (or found in the cache) only to plan the
+       layout, then fetched from the cache again one at a time as they are
+       written, so they are never all in memory at once. Returns the index
+       and, if algorithm is given, the hash of each word's audio."""
+    word_files = SpeechLib.scan_directory(input_directory, suffixes=('raw', 'wav'))
+    if not dedup and trim is None:
+        AudioData.check_length(sum(size for _, size in word_files.values()))
+
+    # changed WAV files are converted up front on a process pool, being CPU bound
+    wav_files = [path for path, _ in word_files.values()
+                 if path.suffix == '.wav' and not cache.is_fresh(path)]
+    with profiling.phase("wav convert"):
+        converted = dict(zip(wav_files, ulaw.read_wavs(wav_files, jobs)))
+
+    def plan_entry(path: Path) -> _PlannedEntry:
+        content_hash, encoded = cache.encode(path, converted.get(path))
+        entry_hash, trimmed = (content_hash, encoded) if trim is None \
+            else _trim_encoded((content_hash, encoded), trim)
+        return _PlannedEntry(content_hash, entry_hash, len(trimmed), len(encoded))
+
+    with profiling.phase("entry encode"), ThreadPoolExecutor(jobs) as executor:
+        entries = dict(zip(word_files, executor.map(plan_entry,
+                                                    (path for path, _ in word_files.values()))))
+    # no longer needed, while the entries are written
+    converted.clear()
+
+    if trim is not None:
+        _log_trimmed({word_code: entry.untrimmed_length for word_code, entry in entries.items()},
+                     {word_code: entry.length for word_code, entry in entries.items()})
+
+    duplicates = {}
+    if dedup:
+        first_codes: Dict[str, int] = {}
+        for word_code, entry in entries.items():
+            first_code = first_codes.setdefault(entry.entry_hash, word_code)
+            if first_code != word_code:
+                duplicates[word_code] = first_code
+
+    lengths = {word_code: entry.length for word_code, entry in entries.items()}
+    AudioData.check_length(sum(length for word_code, length in lengths.items()
+                               if word_code not in duplicates))
+    header, imageHeader, index = SpeechLib.plan(lengths, duplicates)
+
+    hashes = {}
+    with profiling.phase("file write", header.firstFree), _atomic_open(output_file) as f:
+        f.write(header.to_bytes())
+        f.write(imageHeader.to_bytes())
+        f.write(index.to_bytes())
+
+        for offset, word_code in AudioData._unique_offsets(index).items():
+            entry = entries[word_code]
+            encoded = cache._get(entry.content_hash)
+            if encoded is None:
+                raise FileNotFoundError(f"Cached data for word code {word_code} has gone missing")
+            if trim is not None:
+                _, encoded = _trim_encoded((entry.content_hash, encoded), trim)
+            assert f.tell() == offset and len(encoded) == entry.length
+
+            f.write((offset + len(encoded) + 2).to_bytes(3, 'big'))
+            f.write(encoded)
+            if algorithm is not None:
+                hashes[word_code] = hashlib.new(algorithm,
+                                                encoded.translate(_INVERT_TABLE)).hexdigest()
+
+        assert f.tell() == header.firstFree
+
+    cache.record_output(output_file, index, {word_code: (entry.entry_hash, entry.length)
+                                             for word_code, entry in entries.items()})
+    logging.info(f"Build cache: {cache.hits} hits, {cache.misses} misses")
+
+    if algorithm is None:
+        return index, {}
+    return index, {word_code: hashes[duplicates.get(word_code, word_code)]
+                   for word_code in index.word_offsets}
@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime
+from hashlib import blake2b
+from pathlib import Path
+from typing import Any, ByteString, Dict, Iterable, List, Optional, Tuple
+
+from . import profiling
+from .audiolib import Header, ImageHeader, SpeechLib
+from .diff import LibDiff, _diff_fields
+
+_SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE libraries (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    name TEXT,
+    version TEXT,
+    timestamp TEXT,
+    first_free INTEGER NOT NULL,
+    max_word INTEGER NOT NULL,
+    header BLOB NOT NULL,
+    image_header BLOB NOT NULL
+);
+CREATE TABLE words (
+    library_id INTEGER NOT NULL REFERENCES libraries (id) ON DELETE CASCADE,
+    word_code INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    PRIMARY KEY (library_id, word_code)
+);
+CREATE INDEX words_hash ON words (hash);
+CREATE INDEX words_word_code ON words (word_code, hash);
+"""
+
+
+def hash_audio(data: ByteString) -> str:
+    """The hash by which the catalog identifies (decoded) audio"""
+    return blake2b(data, digest_size=16).hexdigest()
+
+
+@dataclass
+class Occurrence:
+    """A word in a catalogued speech lib"""
+    path: Path
+    word_code: int
+    offset: int
+    length: int
+    timestamp: Optional[datetime]
+
+    def __str__(self) -> str:
+        timestamp = 'unknown' if self.timestamp is None else self.timestamp.isoformat(' ')
+        return (f"{self.path}  word code: {self.word_code:<5} offset: 0x{self.offset:06X} "
+                f"length: {self.length:<6} timestamp: {timestamp}")
+
+
+class Catalog:
+    """SQLite database of the headers of many speech libs and the offset,
+       length and hash of each of their words, so the libraries that
+       contain some audio can be found without reading them.
+
+       Libraries are identified by their resolved path, and only re-read
+       by update when their size or mtime has changed."""
+
+    DEFAULT_PATH = Path('catalog.sqlite')
+
+    def __init__(self, db_file: Path = DEFAULT_PATH) -> None:
+        self.db_file = db_file
+        self.connection = sqlite3.connect(str(db_file))
+        self.connection.execute("PRAGMA foreign_keys = ON")
+
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version == 0:
+            with self.connection:
+                self.connection.executescript(_SCHEMA)
+                self.connection.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+        elif version != _SCHEMA_VERSION:
+            raise ValueError(f"{db_file} is a catalog of an unsupported version ({version})")
+
+    def __enter__(self) -> Catalog:
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def _library_id(self, path: Path) -> int:
+        row = self.connection.execute("SELECT id FROM libraries WHERE path = ?",
+                                      (str(path.resolve()),)).fetchone()
+        if row is None:
+            raise KeyError(f"{path} is not in the catalog")
+        return row[0]
+
+    def _add(self, path: Path, stat: os.stat_result) -> None:
+        with SpeechLib.open(path) as speechLib:
+            header, imageHeader = speechLib.header, speechLib.imageHeader
+            words = []
+            with profiling.phase("hash"):
+                for word_code, offset in speechLib.index.word_offsets.items():
+                    data = speechLib.audioData.entries[word_code].data
+                    words.append((word_code, offset, len(data), hash_audio(data)))
+
+        # kept as stored, to compare headers as LibDiff does
+        with open(path, 'rb') as f:
+            raw_headers = f.read(0x200)
+
+        with self.connection:
+            self.connection.execute("DELETE FROM libraries WHERE path = ?", (str(path),))
+            library_id = self.connection.execute(
+                "INSERT INTO libraries (path, size, mtime_ns, name, version, timestamp, "
+                "first_free, max_word, header, image_header) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (str(path), stat.st_size, stat.st_mtime_ns,
+                 header.name.decode('ascii', 'replace'),
+                 header.version.decode('ascii', 'replace'),
+                 None if header.timestamp is None else header.timestamp.isoformat(),
+                 header.firstFree, imageHeader.max_word,
+                 raw_headers[0:0x100], raw_headers[0x100:0x200])).lastrowid
+            self.connection.executemany(
+                "INSERT INTO words (library_id, word_code, offset, length, hash) "
+                "VALUES (?, ?, ?, ?, ?)",
+                ((library_id, *word) for word in words))
+
+    def update(self, lib_files: Iterable[Path],
+               prune: bool = False) -> Tuple[int, int, int, int]:
+        """Add or re-read each speech lib that is new or has changed,
+           and with prune, forget libraries whose files no longer exist.
+           A file that can't be read is logged and skipped. Returns the
+           numbers updated, unchanged, pruned and failed."""
+        known = {path: (size, mtime_ns) for path, size, mtime_ns in self.connection.execute(
+            "SELECT path, size, mtime_ns FROM libraries")}
+
+        updated = unchanged = pruned = failed = 0
+        for lib_file in lib_files:
+            path = lib_file.resolve()
+            try:
+                stat = path.stat()
+                if known.get(str(path)) == (stat.st_size, stat.st_mtime_ns):
+                    unchanged += 1
+                    continue
+
+                logging.info(f"Cataloguing {path}")
+                self._add(path, stat)
+            except (OSError, ValueError, IndexError) as e:
+                # not a speech lib, or a truncated one
+                logging.error(f"{path}: {e}")
+                failed += 1
+                continue
+            updated += 1
+
+        if prune:
+            missing = [path for path in known if not Path(path).is_file()]
+            with self.connection:
+                self.connection.executemany("DELETE FROM libraries WHERE path = ?",
+                                            ((path,) for path in missing))
+            pruned = len(missing)
+
+        return updated, unchanged, pruned, failed
+
+    def libraries(self) -> List[Tuple[Path, str, str, Optional[datetime], int]]:
+        """The path, name, version, timestamp and word count of each library"""
+        return [(Path(path), name, version,
+                 None if timestamp is None else datetime.fromisoformat(timestamp), count)
+                for path, name, version, timestamp, count in self.connection.execute(
+                    "SELECT path, name, version, timestamp, "
+                    "(SELECT COUNT(*) FROM words WHERE library_id = libraries.id) "
+                    "FROM libraries ORDER BY timestamp IS NULL, timestamp, path")]
+
+    def word_hash(self, lib_file: Path, word_code: int) -> str:
+        row = self.connection.execute(
+            "SELECT hash FROM words WHERE library_id = ? AND word_code = ?",
+            (self._library_id(lib_file), word_code)).fetchone()
+        if row is None:
+            raise KeyError(f"No word code {word_code} in {lib_file}")
+        return row[0]
+
+    def find(self, audio_hash: str, word_code: Optional[int] = None) -> List[Occurrence]:
+        """Every word with the given audio, optionally only with the
+           given word code, oldest library first"""
+        query = ("SELECT path, word_code, offset, length, timestamp "
+                 "FROM words JOIN libraries ON libraries.id = words.library_id "
+                 "WHERE hash = ?")
+        parameters: Tuple[Any, ...] = (audio_hash,)
+        if word_code is not None:
+            query += " AND word_code = ?"
+            parameters += (word_code,)
+        query += " ORDER BY timestamp IS NULL, timestamp, mtime_ns, path, word_code"
+
+        return [Occurrence(Path(path), word_code, offset, length,
+                           None if timestamp is None else datetime.fromisoformat(timestamp))
+                for path, word_code, offset, length, timestamp
+                in self.connection.execute(query, parameters)]
+
+    def first(self, audio_hash: str) -> Optional[Occurrence]:
+        """Where the given audio first appeared, by library timestamp"""
+        occurrences = self.find(audio_hash)
+        return occurrences[0] if occurrences else None
+
+    def _words(self, library_id: int) -> Dict[int, Tuple[int, int, str]]:
+        return {word_code: (offset, length, audio_hash)
+                for word_code, offset, length, audio_hash in self.connection.execute(
+                    "SELECT word_code, offset, length, hash FROM words WHERE library_id = ?",
+                    (library_id,))}
+
+    def diff(self, old_file: Path, new_file: Path) -> LibDiff:
+        """Like LibDiff.from_files, but from the catalogued hashes"""
+        library_ids = [self._library_id(old_file), self._library_id(new_file)]
+        (old_header, old_imageHeader), (new_header, new_imageHeader) = [
+            (Header.from_bytes(header), ImageHeader.from_bytes(image_header))
+            for header, image_header in (self.connection.execute(
+                "SELECT header, image_header FROM libraries WHERE id = ?",
+                (library_id,)).fetchone() for library_id in library_ids)]
+        old_words, new_words = map(self._words, library_ids)
+
+        libDiff = LibDiff(_diff_fields(old_header, new_header),
+                          _diff_fields(old_imageHeader, new_imageHeader))
+        libDiff.added = sorted(new_words.keys() - old_words.keys())
+        libDiff.removed = sorted(old_words.keys() - new_words.keys())
+
+        for word_code in sorted(old_words.keys() & new_words.keys()):
+            old_offset, old_length, old_hash = old_words[word_code]
+            new_offset, new_length, new_hash = new_words[word_code]
+
+            if old_length != new_length or old_hash != new_hash:
+                libDiff.changed[word_code] = (old_length, new_length)
+            elif old_offset != new_offset:
+                libDiff.moved[word_code] = (old_offset, new_offset)
+            else:
+                libDiff.unchanged += 1
+
+        return libDiff
+
+    def duplicates(self, lib_file: Path) -> List[Tuple[List[int], int]]:
+        """The groups of word codes in a library with the same audio, each
+           with the bytes that sharing one entry between them would save
+           (nothing if they already share one, as after create --dedup)"""
+        rows = self.connection.execute(
+            "SELECT GROUP_CONCAT(word_code), COUNT(DISTINCT offset), MAX(length) FROM words "
+            "WHERE library_id = ? GROUP BY hash HAVING COUNT(*) > 1 ORDER BY MIN(word_code)",
+            (self._library_id(lib_file),))
+
+        return [(sorted(int(word_code) for word_code in word_codes.split(',')),
+                 (entries - 1) * (length + 3))
+                for word_codes, entries, length in rows]
@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import mmap
+from contextlib import contextmanager
+from dataclasses import dataclass, field, fields
+from datetime import datetime
+from hashlib import blake2b
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from . import profiling
+from .audiolib import Header, ImageHeader, Index
+
+
+class _MappedLib:
+    """The headers and index of a memory mapped speech lib, with access
+       to the still encoded entries"""
+
+    def __init__(self, data: memoryview) -> None:
+        self.data = data
+        self.header = Header.from_bytes(bytes(data[0:0x100]))
+        self.imageHeader = ImageHeader.from_bytes(bytes(data[0x100:0x200]))
+        self.index = Index.from_bytes(bytes(data[0x200:0x200 + self.imageHeader.index_size]))
+
+        self._digests: Dict[int, bytes] = {}
+
+    @classmethod
+    @contextmanager
+    def open(cls, input_file: Path) -> Iterator[_MappedLib]:
+        with open(input_file, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            data = memoryview(mapped)
+            try:
+                yield cls(data)
+            finally:
+                data.release()
+
+    def length(self, offset: int) -> int:
+        stop = int.from_bytes(self.data[offset:offset + 3], "big")
+        if stop < offset + 2 or stop >= len(self.data):
+            raise IndexError(f"Entry at 0x{offset:X} has an invalid stop address!")
+        return stop - offset - 2
+
+    def digest(self, offset: int, length: int) -> bytes:
+        """Hash of the encoded entry at offset, hashed straight from the map"""
+        digest = self._digests.get(offset)
+        if digest is None:
+            with self.data[offset + 3:offset + 3 + length] as encoded:
+                digest = blake2b(encoded, digest_size=16).digest()
+            self._digests[offset] = digest
+        return digest
+
+
+def _format_codes(word_codes: Iterable[int]) -> str:
+    """Format sorted word codes, collapsing runs of consecutive codes"""
+    runs: List[List[int]] = []
+    for word_code in word_codes:
+        if runs and runs[-1][1] == word_code - 1:
+            runs[-1][1] = word_code
+        else:
+            runs.append([word_code, word_code])
+
+    return ", ".join(str(first) if first == last else f"{first}-{last}"
+                     for first, last in runs)
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, bytes):
+        return value.decode('ascii', 'replace')
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _diff_fields(old: Any, new: Any) -> Dict[str, Tuple[Any, Any]]:
+    return {f.name: (getattr(old, f.name), getattr(new, f.name))
+            for f in fields(old) if getattr(old, f.name) != getattr(new, f.name)}
+
+
+@dataclass
+class LibDiff:
+    """The differences between two speech libs. Words are moved if their
+       audio is the same but at a different offset, and changed if their
+       audio differs, with changed mapping to the old and new lengths."""
+    header: Dict[str, Tuple[Any, Any]] = field(default_factory=dict)
+    imageHeader: Dict[str, Tuple[Any, Any]] = field(default_factory=dict)
+    added: List[int] = field(default_factory=list)
+    removed: List[int] = field(default_factory=list)
+    moved: Dict[int, Tuple[int, int]] = field(default_factory=dict)
+    changed: Dict[int, Tuple[int, int]] = field(default_factory=dict)
+    unchanged: int = 0
+
+    @classmethod
+    def from_files(cls, old_file: Path, new_file: Path) -> LibDiff:
+        """Compare the headers and index of two speech libs, then the
+           encoded audio of words in both, only where the lengths match"""
+        with _MappedLib.open(old_file) as old, _MappedLib.open(new_file) as new, \
+                profiling.phase("diff"):
+            libDiff = cls(_diff_fields(old.header, new.header),
+                          _diff_fields(old.imageHeader, new.imageHeader))
+
+            old_offsets = old.index.word_offsets
+            new_offsets = new.index.word_offsets
+            libDiff.added = sorted(new_offsets.keys() - old_offsets.keys())
+            libDiff.removed = sorted(old_offsets.keys() - new_offsets.keys())
+
+            for word_code in sorted(old_offsets.keys() & new_offsets.keys()):
+                old_offset, new_offset = old_offsets[word_code], new_offsets[word_code]
+                old_length, new_length = old.length(old_offset), new.length(new_offset)
+
+                if old_length != new_length or \
+                   old.digest(old_offset, old_length) != new.digest(new_offset, new_length):
+                    libDiff.changed[word_code] = (old_length, new_length)
+                elif old_offset != new_offset:
+                    libDiff.moved[word_code] = (old_offset, new_offset)
+                else:
+                    libDiff.unchanged += 1
+
+        return libDiff
+
+    @property
+    def identical(self) -> bool:
+        return not (self.header or self.imageHeader or self.added or self.removed
+                    or self.moved or self.changed)
+
+    @property
+    def same_audio(self) -> bool:
+        """Whether every word has the same audio, wherever it is stored"""
+        return not (self.added or self.removed or self.changed)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            'header': {name: [_json_value(old), _json_value(new)]
+                       for name, (old, new) in self.header.items()},
+            'image_header': {name: [_json_value(old), _json_value(new)]
+                             for name, (old, new) in self.imageHeader.items()},
+            'added': self.added,
+            'removed': self.removed,
+            'moved': {str(word_code): {'old_offset': old, 'new_offset': new}
+                      for word_code, (old, new) in self.moved.items()},
+            'changed': {str(word_code): {'old_length': old, 'new_length': new}
+                        for word_code, (old, new) in self.changed.items()},
+            'unchanged': self.unchanged,
+        }
+
+    def __str__(self) -> str:
+        lines = []
+        for title, differences in [("Header", self.header), ("Image Header", self.imageHeader)]:
+            if differences:
+                lines.append(f"{title}:")
+                lines.extend(f"  {name}: {old!s} -> {new!s}"
+                             for name, (old, new) in differences.items())
+
+        if self.added:
+            lines.append(f"Added: {_format_codes(self.added)}")
+        if self.removed:
+            lines.append(f"Removed: {_format_codes(self.removed)}")
+        if self.changed:
+            lines.append("Changed:")
+            lines.extend(f"  word code: {word_code:<5} length: {old} -> {new}"
+                         for word_code, (old, new) in self.changed.items())
+        if self.moved:
+            lines.append(f"Moved: {_format_codes(self.moved)}")
+
+        lines.append(f"{self.unchanged} unchanged, {len(self.moved)} moved, "
+                     f"{len(self.changed)} changed, {len(self.added)} added, "
+                     f"{len(self.removed)} removed")
+        return "\n".join(lines)
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, ByteString, Dict, List, Mapping, Optional
+
+from . import profiling
+from .audiolib import Index, SpeechLib
+
+
+def hash_words(words: Mapping[int, ByteString], algorithm: str = 'md5',
+               jobs: int = 1) -> Dict[int, str]:
+    """Hash the (decoded) audio of each word, in parallel. hashlib
+       releases the GIL while hashing, so threads are enough."""
+    def digest(data: ByteString) -> str:
+        return hashlib.new(algorithm, data).hexdigest()
+
+    with profiling.phase("hash", sum(len(data) for data in words.values())), \
+            ThreadPoolExecutor(jobs) as executor:
+        return dict(zip(words, executor.map(digest, words.values())))
+
+
+@dataclass
+class Manifest:
+    """Hashes of the decoded audio of each word, and optionally the
+       offset of each word's entry in a speech lib.
+
+       Stored as JSON, with word codes as string keys. The older per-file
+       formats (a mapping of word code to md5 hash, or to offset) can be
+       read as well."""
+    algorithm: str = 'md5'
+    hashes: Optional[Dict[int, str]] = None
+    offsets: Optional[Dict[int, int]] = None
+
+    @classmethod
+    def from_json(cls, document: Mapping[str, Any]) -> Manifest:
+        if 'hashes' not in document and 'offsets' not in document:
+            values = {int(word_code): value for word_code, value in document.items()}
+            if all(isinstance(value, int) for value in values.values()):
+                return cls(offsets=values)
+            return cls(hashes=values)
+
+        return cls(
+            algorithm=document.get('algorithm', 'md5'),
+            hashes=None if document.get('hashes') is None else {
+                int(word_code): digest for word_code, digest in document['hashes'].items()},
+            offsets=None if document.get('offsets') is None else {
+                int(word_code): offset for word_code, offset in document['offsets'].items()},
+        )
+
+    def to_json(self) -> Dict[str, Any]:
+        document: Dict[str, Any] = {'algorithm': self.algorithm}
+        if self.hashes is not None:
+            document['hashes'] = {str(word_code): digest
+                                  for word_code, digest in self.hashes.items()}
+        if self.offsets is not None:
+            document['offsets'] = {str(word_code): offset
+                                   for word_code, offset in self.offsets.items()}
+        return document
+
+    @classmethod
+    def load(cls, manifest_file: Path) -> Manifest:
+        with open(manifest_file) as f:
+            return cls.from_json(json.load(f))
+
+    def save(self, manifest_file: Path) -> None:
+        with open(manifest_file, 'w') as f:
+            json.dump(self.to_json(), f, indent=4)
+
+    @classmethod
+    def from_words(cls, words: Mapping[int, ByteString], index: Optional[Index] = None,
+                   algorithm: str = 'md5', jobs: int = 1) -> Manifest:
+        return cls(algorithm, hash_words(words, algorithm, jobs),
+                   None if index is None else dict(index.word_offsets))
+
+    @classmethod
+    def from_library(cls, input_file: Path, algorithm: str = 'md5',
+                     jobs: int = 1) -> Manifest:
+        with SpeechLib.open(input_file) as speechLib:
+            return cls.from_words({word_code: entry.data for word_code, entry
+                                   in speechLib.audioData.entries.items()},
+                                  speechLib.index, algorithm, jobs)
+
+    @classmethod
+    def from_directory(cls, input_directory: Path, algorithm: str = 'md5',
+                       jobs: int = 1) -> Manifest:
+        """From a directory of raw audio files, with any word code"""
+        word_files = SpeechLib.scan_directory(input_directory, range(0x10000))
+
+        def read(path: Path) -> bytes:
+            with open(path, 'rb') as f:
+                return f.read()
+
+        with profiling.phase("file read"), ThreadPoolExecutor(jobs) as executor:
+            words = dict(zip(word_files, executor.map(
+                read, (path for path, _ in word_files.values()))))
+
+        return cls.from_words(words, None, algorithm, jobs)
+
+    @classmethod
+    def from_path(cls, path: Path, algorithm: str = 'md5', jobs: int = 1) -> Manifest:
+        """From either a speech lib file or a directory of raw audio files"""
+        if path.is_dir():
+            return cls.from_directory(path, algorithm, jobs)
+        return cls.from_library(path, algorithm, jobs)
+
+    def compare(self, actual: Manifest) -> List[str]:
+        """Describe each way in which actual differs from this (expected)
+           manifest. Only what both manifests record is compared."""
+        mismatches = []
+
+        if self.hashes is not None and actual.hashes is not None:
+            if self.algorithm != actual.algorithm:
+                raise ValueError(f"Can't compare {self.algorithm} hashes "
+                                 f"with {actual.algorithm} hashes")
+
+            for word_code in sorted(self.hashes.keys() - actual.hashes.keys()):
+                mismatches.append(f"word code {word_code}: missing")
+            for word_code in sorted(actual.hashes.keys() - self.hashes.keys()):
+                mismatches.append(f"word code {word_code}: unexpected")
+            for word_code in sorted(self.hashes.keys() & actual.hashes.keys()):
+                if self.hashes[word_code] != actual.hashes[word_code]:
+                    mismatches.append(f"word code {word_code}: {self.algorithm} "
+                                      f"{actual.hashes[word_code]}, "
+                                      f"expected {self.hashes[word_code]}")
+
+        if self.offsets is not None and actual.offsets is not None:
+            for word_code in sorted(self.offsets.keys() | actual.offsets.keys()):
+                expected = self.offsets.get(word_code)
+                offset = actual.offsets.get(word_code)
+                if expected is not None and offset is not None and expected != offset:
+                    mismatches.append(f"word code {word_code}: offset 0x{offset:X}, "
+                                      f"expected 0x{expected:X}")
+                elif self.hashes is None or actual.hashes is None:
+                    # not already reported as missing or unexpected
+                    if offset is None:
+                        mismatches.append(f"word code {word_code}: missing")
+                    elif expected is None:
+                        mismatches.append(f"word code {word_code}: unexpected")
+
+        return mismatches
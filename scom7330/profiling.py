@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, dataclass
+from typing import Any, ContextManager, Dict, Iterator, List, Optional
+
+
+@dataclass
+class PhaseStats:
+    calls: int = 0
+    seconds: float = 0.0
+    bytes: int = 0
+    peak_memory: int = 0
+
+
+class Profiler:
+    """Records wall time, bytes processed and peak memory for each named
+       phase. Phases may be nested, and are then counted in both.
+
+       Memory is only traced for phases in the main thread. Before Python
+       3.9 the tracemalloc peak can't be reset, so the peak memory of a
+       phase may include that of earlier phases."""
+
+    def __init__(self, trace_memory: bool = True) -> None:
+        self.trace_memory = trace_memory
+        self.phases: Dict[str, PhaseStats] = {}
+
+        self._lock = threading.Lock()
+        # the highest traced memory seen so far by each running phase
+        self._peaks: List[int] = []
+
+    @contextmanager
+    def phase(self, name: str, nbytes: int = 0) -> Iterator[None]:
+        trace_memory = self.trace_memory and tracemalloc.is_tracing() and \
+            threading.current_thread() is threading.main_thread()
+
+        if trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            self._peaks.append(current)
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+
+            peak_memory = 0
+            if trace_memory:
+                peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+                peak_memory = peak - current
+
+            with self._lock:
+                stats = self.phases.setdefault(name, PhaseStats())
+                stats.calls += 1
+                stats.seconds += seconds
+                stats.bytes += nbytes
+                stats.peak_memory = max(stats.peak_memory, peak_memory)
+
+    def count(self, name: str, nbytes: int) -> None:
+        """Add to the bytes processed by a phase, for when the amount
+           isn't known until the phase has finished"""
+        with self._lock:
+            self.phases.setdefault(name, PhaseStats()).bytes += nbytes
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: asdict(stats) for name, stats in self.phases.items()}
+
+    def format_table(self) -> str:
+        lines = [f"{'phase':<16} {'calls':>7} {'time (ms)':>10} "
+                 f"{'bytes':>12} {'MB/s':>9} {'peak (KiB)':>11}"]
+
+        for name, stats in self.phases.items():
+            rate = stats.bytes / stats.seconds / 1e6 if stats.seconds else 0.0
+            lines.append(f"{name:<16} {stats.calls:>7} {stats.seconds * 1000:>10.2f} "
+                         f"{stats.bytes:>12} {rate:>9.1f} {stats.peak_memory / 1024:>11.1f}")
+
+        return "\n".join(lines)
+
+
+_active: Optional[Profiler] = None
+_inactive = nullcontext()
+
+
+def phase(name: str, nbytes: int = 0) -> ContextManager[None]:
+    """Record a phase in the active profiler, if there is one"""
+    if _active is None:
+        return _inactive
+    return _active.phase(name, nbytes)
+
+
+@contextmanager
+def profile(trace_memory: bool = True) -> Iterator[Profiler]:
+    """Profile the phases run within this context"""
+    global _active
+
+    profiler = Profiler(trace_memory)
+    previous, _active = _active, profiler
+
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+
+    try:
+        yield profiler
+    finally:
+        _active = previous
+        if started_tracing:
+            tracemalloc.stop()
+
+
+def count(name: str, nbytes: int) -> None:
+    """Add to the bytes processed by a phase in the active profiler, if there is one"""
+    if _active is not None:
+        _active.count(name, nbytes)
@@ -0,0 +1,320 @@
+"""A local HTTP server for previewing the words and phrases of speech libs,
+keeping the libraries open and their decoded words cached between requests.
+
+Only what a browser or curl needs is implemented: GET requests, with one
+request per connection."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import ExitStack
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, ByteString, Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from . import ulaw
+from .audiolib import SpeechLib
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+            500: 'Internal Server Error'}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+class DecodedCache:
+    """Least recently used cache of decoded words, limited to max_bytes
+       of audio in total"""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: OrderedDict[Tuple[str, int], bytes] = OrderedDict()
+
+    def get(self, lib_name: str, word_code: int, speechLib: SpeechLib) -> bytes:
+        key = (lib_name, word_code)
+        data = self._entries.get(key)
+        if data is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return data
+
+        self.misses += 1
+        data = bytes(speechLib.audioData.entries[word_code].data)
+        if len(data) <= self.max_bytes:
+            self._entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+        return data
+
+    def purge(self, lib_name: str) -> None:
+        """Drop the words of one library, after it has changed"""
+        for key in [key for key in self._entries if key[0] == lib_name]:
+            self.size -= len(self._entries.pop(key))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+@dataclass
+class EndpointStats:
+    requests: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    def record(self, seconds: float) -> None:
+        self.requests += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            'requests': self.requests,
+            'avg_ms': self.seconds / self.requests * 1000 if self.requests else 0.0,
+            'max_ms': self.max_seconds * 1000,
+        }
+
+
+class _Library:
+    """A speech lib kept open, and reopened whenever the file changes"""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.speechLib: Optional[SpeechLib] = None
+        self._stack = ExitStack()
+        self._stat_key: Optional[Tuple[int, int]] = None
+
+    def refresh(self) -> bool:
+        """Open the library if it has changed since it was last opened,
+           returning True if it was reopened"""
+        stat = os.stat(self.path)
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        if stat_key == self._stat_key:
+            return False
+
+        self.close()
+        self.speechLib = self._stack.enter_context(SpeechLib.open(self.path))
+        self._stat_key = stat_key
+        return True
+
+    def close(self) -> None:
+        self.speechLib = None
+        self._stat_key = None
+        self._stack.close()
+
+
+class PreviewServer:
+    """Serves the words and phrases of one or more speech libs, named
+       by file stem, as raw μ-law or WAV:
+
+           GET /word/<code>?lib=<name>&format=raw|wav
+           GET /phrase?codes=3001,3002&gap=<ms>&lib=<name>&format=raw|wav
+           GET /metrics
+
+       The first library is used when lib is not given. Each library is
+       reopened if its file's mtime or size has changed."""
+
+    DEFAULT_CACHE_SIZE = 16 * 1024 * 1024
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, lib_files: Sequence[Path], cache_size: int = DEFAULT_CACHE_SIZE) -> None:
+        if not lib_files:
+            raise ValueError("No speech libs to serve")
+
+        self.libraries: Dict[str, _Library] = {}
+        for lib_file in lib_files:
+            if lib_file.stem in self.libraries:
+                raise ValueError(f"More than one speech lib named {lib_file.stem}")
+            self.libraries[lib_file.stem] = _Library(lib_file)
+        self.default_lib = next(iter(self.libraries))
+
+        self.cache = DecodedCache(cache_size)
+        self.reloads = 0
+        self.endpoints: Dict[str, EndpointStats] = {}
+
+        self._server: Optional[asyncio.AbstractServer] = None
+
+        for library in self.libraries.values():
+            library.refresh()
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8330) -> Tuple[str, int]:
+        """Start listening, returning the address actually bound (port 0
+           picks a free port)"""
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def serve_forever(self, host: str = '127.0.0.1', port: int = 8330) -> None:
+        address = await self.start(host, port)
+        logging.info(f"Serving {', '.join(self.libraries)} on http://{address[0]}:{address[1]}/")
+        assert self._server is not None
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+        for library in self.libraries.values():
+            library.close()
+
+    async def wait_closed(self) -> None:
+        if self._server is not None:
+            await self._server.wait_closed()
+
+    def _speechLib(self, lib_name: Optional[str]) -> Tuple[str, SpeechLib]:
+        if lib_name is None:
+            lib_name = self.default_lib
+        library = self.libraries.get(lib_name)
+        if library is None:
+            raise HTTPError(404, f"No speech lib named {lib_name}")
+
+        if library.refresh():
+            self.cache.purge(lib_name)
+            self.reloads += 1
+            logging.info(f"Reloaded {library.path}")
+        assert library.speechLib is not None
+        return lib_name, library.speechLib
+
+    def _word(self, lib_name: str, speechLib: SpeechLib, word_code: int) -> bytes:
+        if word_code not in speechLib.index.word_offsets:
+            raise HTTPError(404, f"No word code {word_code} in {lib_name}")
+        return self.cache.get(lib_name, word_code, speechLib)
+
+    def metrics(self) -> Dict[str, Any]:
+        requests = self.cache.hits + self.cache.misses
+        return {
+            'cache': {
+                'hits': self.cache.hits,
+                'misses': self.cache.misses,
+                'hit_rate': self.cache.hits / requests if requests else 0.0,
+                'entries': len(self.cache),
+                'bytes': self.cache.size,
+                'max_bytes': self.cache.max_bytes,
+            },
+            'reloads': self.reloads,
+            'endpoints': {name: stats.to_json() for name, stats in self.endpoints.items()},
+        }
+
+    def _route(self, method: str, target: str) -> Tuple[str, str, ByteString]:
+        """Handle a request, returning the endpoint name, content type and body"""
+        url = urlsplit(target)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        path = unquote(url.path)
+
+        if path == '/metrics':
+            endpoint = 'metrics'
+        elif path == '/phrase':
+            endpoint = 'phrase'
+        elif path.startswith('/word/'):
+            endpoint = 'word'
+        else:
+            raise HTTPError(404, f"No such endpoint {path}")
+
+        if method != 'GET':
+            raise HTTPError(405, f"{method} not allowed")
+        if endpoint == 'metrics':
+            return endpoint, 'application/json', json.dumps(self.metrics(), indent=4).encode()
+
+        output_format = query.get('format', 'raw')
+        if output_format not in ('raw', 'wav'):
+            raise HTTPError(400, f"Unknown format {output_format}")
+
+        try:
+            if endpoint == 'word':
+                word_codes = [int(path[len('/word/'):])]
+            else:
+                word_codes = [int(word_code) for word_code in query['codes'].split(',')]
+            gap_ms = int(query.get('gap', 0))
+        except (KeyError, ValueError):
+            raise HTTPError(400, "Word codes and gap must be integers")
+        if gap_ms < 0:
+            raise HTTPError(400, "The gap can't be negative")
+
+        lib_name, speechLib = self._speechLib(query.get('lib'))
+        if endpoint == 'word':
+            data: ByteString = self._word(lib_name, speechLib, word_codes[0])
+        else:
+            data = speechLib.render(
+                word_codes, gap_ms,
+                lambda word_code: self._word(lib_name, speechLib, word_code))
+
+        content_type = 'audio/wav' if output_format == 'wav' else 'audio/basic'
+        return endpoint, content_type, data
+
+    def _chunks(self, content_type: str, body: ByteString) -> Iterator[ByteString]:
+        """The body in chunks, decoding WAV audio a chunk at a time"""
+        if content_type != 'audio/wav':
+            for start in range(0, len(body), self.CHUNK_SIZE):
+                yield body[start:start + self.CHUNK_SIZE]
+            return
+
+        yield ulaw.wav_header(len(body))
+        # each μ-law byte decodes to two
+        for start in range(0, len(body), self.CHUNK_SIZE // 2):
+            yield ulaw.decode(body[start:start + self.CHUNK_SIZE // 2])
+
+    async def _handle(self, reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter) -> None:
+        start = time.perf_counter()
+        endpoint = 'error'
+        try:
+            request_line = (await reader.readline()).decode('latin-1')
+            # headers are ignored
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+
+            try:
+                parts = request_line.split()
+                if len(parts) != 3:
+                    raise HTTPError(400, "Malformed request line")
+                endpoint, content_type, body = self._route(parts[0], parts[1])
+                status = 200
+                length = len(body) if content_type != 'audio/wav' else 44 + len(body) * 2
+            except HTTPError as e:
+                status, content_type = e.status, 'text/plain; charset=utf-8'
+                body = f"{e}\n".encode()
+                length = len(body)
+            except Exception as e:
+                logging.exception(f"Error handling {request_line.strip()}")
+                status, content_type = 500, 'text/plain; charset=utf-8'
+                body = f"{e}\n".encode()
+                length = len(body)
+
+            writer.write(f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+                         f"Content-Type: {content_type}\r\n"
+                         f"Content-Length: {length}\r\n"
+                         f"Connection: close\r\n\r\n".encode('latin-1'))
+            for chunk in self._chunks(content_type, body):
+                writer.write(chunk)
+                await writer.drain()
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            self.endpoints.setdefault(endpoint, EndpointStats()).record(
+                time.perf_counter() - start)
+
+
+def serve(lib_files: List[Path], host: str = '127.0.0.1', port: int = 8330,
+          cache_size: int = PreviewServer.DEFAULT_CACHE_SIZE) -> None:
+    server = PreviewServer(lib_files, cache_size)
+    try:
+        asyncio.run(server.serve_forever(host, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
@@ -0,0 +1,217 @@
+"""Conversion between WAV files and the audio format the SCOM 7330
+expects: 8 kHz mono, one G.711 μ-law byte per sample.
+
+Samples are processed in bulk with lookup tables, slicing and map()
+rather than per-sample Python arithmetic where possible."""
+
+import re
+import struct
+import sys
+import wave
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import accumulate, repeat
+from operator import floordiv
+from pathlib import Path
+from typing import ByteString, Iterator, List, Pattern, Sequence
+
+SAMPLE_RATE = 8000
+# μ-law encoding of a zero sample
+SILENCE = b'\xff'
+
+# as in sox's g711.c, which works on 14 bit samples
+_CLIP = 8159
+_BIAS = 0x84 >> 2
+_SEGMENT_ENDS = (0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF)
+
+
+def _linear2ulaw(sample: int) -> int:
+    """Encode a signed 16 bit sample"""
+    sample >>= 2
+    if sample < 0:
+        sample, mask = -sample, 0x7F
+    else:
+        mask = 0xFF
+
+    sample = min(sample, _CLIP) + _BIAS
+    segment = bisect_left(_SEGMENT_ENDS, sample)
+    if segment >= 8:
+        return 0x7F ^ mask
+    return ((segment << 4) | ((sample >> (segment + 1)) & 0x0F)) ^ mask
+
+
+# indexed by a 16 bit sample, read as unsigned
+_ENCODE_TABLE = bytes(_linear2ulaw(sample - 0x10000 if sample & 0x8000 else sample)
+                      for sample in range(0x10000))
+
+# flips the sign bit, for unsigned 8 bit samples
+_UNSIGNED_TO_SIGNED = bytes(byte ^ 0x80 for byte in range(256))
+
+
+def _ulaw2linear(byte: int) -> int:
+    """Decode a μ-law byte to a signed 16 bit sample"""
+    byte = ~byte & 0xFF
+    sample = (((byte & 0x0F) << 3) + 0x84) << ((byte & 0x70) >> 4)
+    return 0x84 - sample if byte & 0x80 else sample - 0x84
+
+
+# the low and high bytes of each decoded little endian sample
+_DECODE_LOW_TABLE = bytes(_ulaw2linear(byte) & 0xFF for byte in range(256))
+_DECODE_HIGH_TABLE = bytes((_ulaw2linear(byte) >> 8) & 0xFF for byte in range(256))
+
+
+def decode(data: ByteString) -> bytes:
+    """Decode μ-law to little endian 16 bit PCM"""
+    data = bytes(data)
+    pcm = bytearray(len(data) * 2)
+    pcm[0::2] = data.translate(_DECODE_LOW_TABLE)
+    pcm[1::2] = data.translate(_DECODE_HIGH_TABLE)
+    return bytes(pcm)
+
+
+def wav_header(length: int) -> bytes:
+    """The header of a 16 bit PCM WAV file of length μ-law samples once
+       decoded, for writing ahead of the decoded data as it is produced"""
+    data_size = length * 2
+    return struct.pack('<4sI4s4sIHHIIHH4sI', b'RIFF', 36 + data_size, b'WAVE',
+                       b'fmt ', 16, 1, 1, SAMPLE_RATE, SAMPLE_RATE * 2, 2, 16,
+                       b'data', data_size)
+
+
+def to_wav(data: ByteString) -> bytes:
+    """Decode μ-law to a complete 16 bit PCM WAV file"""
+    return wav_header(len(data)) + decode(data)
+
+
+@lru_cache()
+def _loud_pattern(threshold: int) -> Pattern[bytes]:
+    """A regex matching any μ-law byte louder than threshold"""
+    loud = [bytes([byte]) for byte in range(256) if abs(_ulaw2linear(byte)) > threshold]
+    if not loud:
+        return re.compile(b'(?!)')
+    return re.compile(b'[' + b''.join(map(re.escape, loud)) + b']')
+
+
+@lru_cache()
+def _last_loud_pattern(threshold: int) -> Pattern[bytes]:
+    """A regex matching from the start up to and including the last μ-law
+       byte louder than threshold, backtracking from the end of the data"""
+    return re.compile(b'(?s).*' + _loud_pattern(threshold).pattern)
+
+
+@dataclass(frozen=True)
+class SilenceTrim:
+    """Trims leading and trailing silence from μ-law audio, keeping
+       padding samples either side of the first and last samples louder
+       than threshold (as a 16 bit amplitude)"""
+    threshold: int = 256
+    padding: int = SAMPLE_RATE // 20
+
+    def trim(self, data: bytes) -> bytes:
+        """Return data with the silence trimmed, or unchanged if it is all silence"""
+        pattern = _loud_pattern(self.threshold)
+
+        first = pattern.search(data)
+        if first is None:
+            return data
+        last = _last_loud_pattern(self.threshold).match(data)
+        assert last is not None
+
+        start = max(first.start() - self.padding, 0)
+        end = min(last.end() + self.padding, len(data))
+        return data[start:end]
+
+
+def encode(samples: array) -> bytes:
+    """Encode an array('h') of 16 bit samples as μ-law"""
+    return bytes(map(_ENCODE_TABLE.__getitem__, memoryview(samples).cast('B').cast('H')))
+
+
+def _to_16bit(frames: bytes, sample_width: int) -> array:
+    """Convert little endian PCM frames of any sample width (unsigned if
+       8 bit, as in WAV files) to 16 bit samples, keeping the top 16 bits"""
+    if sample_width == 2:
+        samples = array('h', frames)
+    else:
+        count = len(frames) // sample_width
+        buffer = bytearray(count * 2)
+        if sample_width == 1:
+            buffer[1::2] = frames.translate(_UNSIGNED_TO_SIGNED)
+        else:
+            buffer[0::2] = frames[sample_width - 2::sample_width]
+            buffer[1::2] = frames[sample_width - 1::sample_width]
+        samples = array('h', buffer)
+
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    return samples
+
+
+def downmix(samples: array, channels: int) -> array:
+    """Average interleaved channels into one"""
+    if channels == 1:
+        return samples
+
+    channel_samples = (samples[channel::channels] for channel in range(channels))
+    sums: Iterator[int] = map(sum, zip(*channel_samples))
+    return array('h', map(floordiv, sums, repeat(channels)))
+
+
+def resampled_length(length: int, rate: int) -> int:
+    return length * SAMPLE_RATE // rate
+
+
+def resample(samples: Sequence[int], rate: int) -> array:
+    """Resample to SAMPLE_RATE, averaging the input samples covered by
+       each output sample when downsampling, and interpolating linearly
+       when upsampling"""
+    if rate == SAMPLE_RATE:
+        return array('h', samples)
+    length = resampled_length(len(samples), rate)
+
+    if rate > SAMPLE_RATE:
+        sums = [0, *accumulate(samples)]
+        bounds = [i * rate // SAMPLE_RATE for i in range(length + 1)]
+        return array('h', [(sums[end] - sums[start]) // (end - start)
+                           for start, end in zip(bounds, bounds[1:])])
+
+    last = len(samples) - 1
+    resampled = array('h')
+    for i in range(length):
+        position, fraction = divmod(i * rate, SAMPLE_RATE)
+        sample = samples[position]
+        resampled.append(sample + (samples[min(position + 1, last)] - sample)
+                         * fraction // SAMPLE_RATE)
+    return resampled
+
+
+def wav_length(wav_file: Path) -> int:
+    """The length in bytes that a WAV file will have once converted,
+       from its header"""
+    with wave.open(str(wav_file), 'rb') as w:
+        return resampled_length(w.getnframes(), w.getframerate())
+
+
+def read_wav(wav_file: Path) -> bytes:
+    """Read a PCM WAV file as 8 kHz mono μ-law"""
+    with wave.open(str(wav_file), 'rb') as w:
+        channels = w.getnchannels()
+        sample_width = w.getsampwidth()
+        rate = w.getframerate()
+        frames = w.readframes(w.getnframes())
+
+    samples = downmix(_to_16bit(frames, sample_width), channels)
+    return encode(resample(samples, rate))
+
+
+def read_wavs(wav_files: Sequence[Path], jobs: int = 1) -> List[bytes]:
+    """Convert WAV files, across a pool of jobs processes, as the
+       conversion is CPU bound"""
+    if jobs <= 1 or len(wav_files) <= 1:
+        return [read_wav(wav_file) for wav_file in wav_files]
+
+    with ProcessPoolExecutor(jobs) as executor:
+        return list(executor.map(read_wav, wav_files))
@@ -1,4 +1,8 @@
+import random
+import tempfile
 import unittest
+from array import array
+from pathlib import Path
 from unittest import mock
 
 from scom7330.audiolib import AudioData, AudioDataEntry, AudioLengthException
@@ -11,6 +15,16 @@ class TestAudioDataEntry(unittest.TestCase):
 
         self.assertEqual(audio_data_bytes, b'\x00\x10\x0712345')
 
+    def test_write_into(self) -> None:
+        audio_data = AudioDataEntry(b'\x80\x82\xff\x7fasdf')
+
+        buffer = bytearray(b'\x00' * 0x20)
+        audio_data.write_into(buffer, 0x10)
+
+        self.assertEqual(buffer[:0x10], b'\x00' * 0x10)
+        self.assertEqual(buffer[0x10:0x1b], audio_data.to_bytes(0x10))
+        self.assertEqual(buffer[0x1b:], b'\x00' * 5)
+
     def test_high_byte_inversion(self) -> None:
         # anything > 0x7f should have the lower 7 bits inverted
         audio_data = AudioDataEntry(b'\x80\x82\xff\x7fasdf')
@@ -18,6 +32,24 @@ class TestAudioDataEntry(unittest.TestCase):
 
         self.assertEqual(audio_data_bytes[3:], b'\xff\xfd\x80\x7fasdf')
 
+    def test_high_byte_inversion_matches_loop(self) -> None:
+        def invert_loop(data: bytes) -> bytes:
+            # the original byte-by-byte implementation
+            dataarray = bytearray(data)
+            for index, byte in enumerate(dataarray):
+                dataarray[index] = byte ^ 127 if byte > 127 else byte
+            return bytes(dataarray)
+
+        rng = random.Random(7330)
+        for data in [bytes(range(256)),
+                     bytes(rng.getrandbits(8) for _ in range(0x10000)),
+                     b'']:
+            with self.subTest(length=len(data)):
+                inverted = AudioDataEntry._invert_high_bytes(data)
+                self.assertIsInstance(inverted, bytearray)
+                self.assertEqual(bytes(inverted), invert_loop(data))
+                self.assertEqual(bytes(AudioDataEntry._invert_high_bytes(inverted)), data)
+
     def test_from_bytes(self) -> None:
         audio_data = AudioDataEntry.from_bytes(b'\xff\xff\x00\x00\x081234', 2)
 
@@ -27,6 +59,10 @@ class TestAudioDataEntry(unittest.TestCase):
         with self.assertRaises(IndexError):
             AudioDataEntry.from_bytes(b'\x00\x10\x001234', 0)
 
+    def test_to_pcm(self) -> None:
+        self.assertEqual(AudioDataEntry(b'\xff\x7f\x80\x00\xce').to_pcm(),
+                         array('h', [0, 0, 32124, -32124, 988]).tobytes())
+
 
 class TestAudioData(unittest.TestCase):
     def test_to_bytes(self) -> None:
@@ -43,6 +79,22 @@ class TestAudioData(unittest.TestCase):
 
         self.assertEqual(audioData.to_bytes(index), b'12345678')
 
+    def test_write_into(self) -> None:
+        audioData = AudioData({
+            1: AudioDataEntry(b'1234'),
+            2: AudioDataEntry(b'5678'),
+        })
+
+        index = mock.Mock(word_offsets={
+            1: 0x2,
+            2: 0xb,
+        })
+
+        buffer = bytearray(b'\xff' * 0x12)
+        audioData.write_into(buffer, index)
+
+        self.assertEqual(buffer, b'\xff\xff\x00\x00\x081234\xff\xff\x00\x00\x115678')
+
     def test_from_bytes(self) -> None:
         index = mock.Mock(word_offsets={
             1: 0x100,
@@ -58,9 +110,87 @@ class TestAudioData(unittest.TestCase):
             2: AudioDataEntry(b'5678'),
         }))
 
+    def test_from_bytes_inverted(self) -> None:
+        index = mock.Mock(word_offsets={1: 0x2, 2: 0x9})
+
+        data = b'\xff\xff\x00\x00\x08\x80\x81\xfe\x01\x00\x00\x0c\xff'
+
+        audioData = AudioData.from_bytes(data, index)
+
+        self.assertEqual(audioData, AudioData({
+            1: AudioDataEntry(b'\xff\xfe\x81\x01'),
+            2: AudioDataEntry(b'\x80'),
+        }))
+
+    def test_from_bytes_out_of_bounds(self) -> None:
+        index = mock.Mock(word_offsets={1: 0})
+
+        with self.assertRaises(IndexError):
+            AudioData.from_bytes(b'\x00\x10\x001234', index)
+
+    def test_from_bytes_shared(self) -> None:
+        index = mock.Mock(word_offsets={1: 0x2, 2: 0x2})
+
+        audioData = AudioData.from_bytes(b'\xff\xff\x00\x00\x081234', index)
+
+        self.assertEqual(audioData, AudioData({
+            1: AudioDataEntry(b'1234'),
+            2: AudioDataEntry(b'1234'),
+        }))
+        self.assertIs(audioData.entries[1], audioData.entries[2])
+
+    def test_to_bytes_shared(self) -> None:
+        audioData = AudioData({
+            1: AudioDataEntry(b'1234'),
+            2: AudioDataEntry(b'1234'),
+            3: AudioDataEntry(b'5678'),
+        })
+
+        index = mock.Mock(word_offsets={1: 0x100, 2: 0x100, 3: 0x107})
+
+        self.assertEqual(audioData.to_bytes(index), b'\x00\x01\x061234\x00\x01\x0d5678')
+
+    def test_find_duplicates(self) -> None:
+        audioData = AudioData({
+            1: AudioDataEntry(b'1234'),
+            2: AudioDataEntry(b'5678'),
+            3: AudioDataEntry(b'1234'),
+            4: AudioDataEntry(b'5678'),
+            5: AudioDataEntry(b'1234'),
+        })
+
+        self.assertEqual(audioData.find_duplicates(), {3: 1, 4: 2, 5: 1})
+
+    def test_stored_length(self) -> None:
+        audioData = AudioData({
+            1: AudioDataEntry(b'1234'),
+            2: AudioDataEntry(b'1234'),
+            3: AudioDataEntry(b'56'),
+        })
+        index = mock.Mock(word_offsets={1: 0x100, 2: 0x100, 3: 0x107})
+
+        self.assertEqual(audioData.data_length, 10)
+        self.assertEqual(audioData.stored_data_length(index), 6)
+        self.assertEqual(audioData.full_length, 19)
+        self.assertEqual(audioData.stored_full_length(index), 12)
+
     def test_from_files(self) -> None:
-        # TODO
-        pass
+        with tempfile.TemporaryDirectory() as tempdir:
+            word_files = []
+            for word_code in [3002, 3000, 3001]:
+                word_file = Path(tempdir) / f'{word_code}.raw'
+                word_file.write_bytes(str(word_code).encode())
+                word_files.append(word_file)
+
+            for jobs in [1, 4]:
+                with self.subTest(jobs=jobs):
+                    audioData = AudioData.from_files(word_files, jobs)
+
+                    self.assertEqual(list(audioData.entries.items()), [
+                        (3002, AudioDataEntry(b'3002')),
+                        (3000, AudioDataEntry(b'3000')),
+                        (3001, AudioDataEntry(b'3001')),
+                    ])
 
     def test_check_audio_length_ok(self) -> None:
         audioData = AudioData({
@@ -77,6 +207,15 @@ class TestAudioData(unittest.TestCase):
         with self.assertRaises(AudioLengthException):
             audioData.check_audio_length()
 
+    def test_check_audio_length_shared(self) -> None:
+        entry = AudioDataEntry(b'\x00' * 5760000)
+        audioData = AudioData({1: entry, 2: entry})
+
+        with self.assertRaises(AudioLengthException):
+            audioData.check_audio_length()
+
+        audioData.check_audio_length(mock.Mock(word_offsets={1: 0x300, 2: 0x300}))
+
 
 if __name__ == '__main__':
     unittest.main()
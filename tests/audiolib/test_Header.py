@@ -42,6 +42,16 @@ class TestHeader(unittest.TestCase):
             header_bytes,
             b'SCOM\x00SCOM Cust ALib\xff\xff1.0.0\xff\xff\xff\xff\xff\xff\xffasdf\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff\x03\x00\x114\x00\x00\x00\x00'.ljust(0x100, b'\xff'))
 
+    def test_write_into(self) -> None:
+        header = Header(0x1234, timestamp_raw=b'asdf')
+
+        buffer = bytearray(b'\x00' * 0x300)
+        header.write_into(buffer, 0x100)
+
+        self.assertEqual(buffer[:0x100], b'\x00' * 0x100)
+        self.assertEqual(buffer[0x100:0x200], header.to_bytes())
+        self.assertEqual(buffer[0x200:], b'\x00' * 0x100)
+
     def test_from_bytes(self) -> None:
         header = Header.from_bytes(b'SCOM\x00SCOM Cust ALib\xff\xff1.0.0\xff\xff\xff\xff\xff\xff\xffasdf\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff\xff\x03\x00\x114\x00\x00\x00\x00'.ljust(0x100, b'\xff'))
 
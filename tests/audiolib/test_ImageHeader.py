@@ -12,6 +12,15 @@ class TestImageHeader(unittest.TestCase):
             imageHeader_bytes,
             b'\x00\x02\x00\x10\x04\x01\x00\x124'.ljust(0x100, b'\xff'))
 
+    def test_write_into(self) -> None:
+        imageHeader = ImageHeader(0x1000, 1024, 0x1234)
+
+        buffer = bytearray(b'\x00' * 0x200)
+        imageHeader.write_into(buffer, 0x100)
+
+        self.assertEqual(buffer[:0x100], b'\x00' * 0x100)
+        self.assertEqual(buffer[0x100:], imageHeader.to_bytes())
+
     def test_from_bytes(self) -> None:
         pass
         imageHeader = ImageHeader.from_bytes(
@@ -18,6 +18,15 @@ class TestIndex(unittest.TestCase):
             index_bytes,
             b'\xff\xff\xff\xff\x00\x124\xff\x00Eg'.ljust(0x100, b'\xff'))
 
+    def test_write_into(self) -> None:
+        index = Index(0x100, {1: 0x1234, 2: 0x4567})
+
+        buffer = bytearray(b'\x00' * 0x300)
+        index.write_into(buffer, 0x200)
+
+        self.assertEqual(buffer[:0x200], b'\x00' * 0x200)
+        self.assertEqual(buffer[0x200:], index.to_bytes())
+
     def test_from_bytes(self) -> None:
         index = Index.from_bytes(
             b'\xff\xff\xff\xff\x00\x124\xff\x00Eg'.ljust(0x100, b'\xff'))
@@ -29,6 +38,45 @@ class TestIndex(unittest.TestCase):
 
         self.assertEqual(index, Index(0x100, expected_word_offsets))
 
+    def test_from_bytes_unused_byte(self) -> None:
+        # the 4th byte of each slot is ignored
+        index = Index.from_bytes(
+            b'\xff\xff\xff\x00\x00\x124\x00\x00Eg\x12'.ljust(0x100, b'\xff'))
+
+        self.assertEqual(index.word_offsets, {1: 0x1234, 2: 0x4567})
+        self.assertEqual(index.to_bytes(),
+                         b'\xff\xff\xff\xff\x00\x124\xff\x00Eg'.ljust(0x100, b'\xff'))
+
+    def test_word_offsets_mapping(self) -> None:
+        index = Index(0x100, {1: 0x1234, 2: 0x4567})
+        word_offsets = index.word_offsets
+
+        self.assertEqual(word_offsets, {1: 0x1234, 2: 0x4567})
+        self.assertEqual(list(word_offsets.items()), [(1, 0x1234), (2, 0x4567)])
+        self.assertEqual(len(word_offsets), 2)
+        self.assertIn(2, word_offsets)
+        self.assertNotIn(0, word_offsets)
+        self.assertNotIn(1000, word_offsets)
+        self.assertIsNone(word_offsets.get(3))
+
+        word_offsets[0] = 0x300
+        del word_offsets[2]
+        self.assertEqual(dict(word_offsets), {0: 0x300, 1: 0x1234})
+        self.assertEqual(index.to_bytes(),
+                         b'\x00\x03\x00\xff\x00\x124\xff'.ljust(0x100, b'\xff'))
+
+        with self.assertRaises(KeyError):
+            del word_offsets[2]
+        with self.assertRaises(ValueError):
+            word_offsets[3] = 0xffffff
+
+    def test_sparse(self) -> None:
+        index = Index.from_bytes(
+            b'\xff' * 4000 * 4 + b'\x00\x12\x34\xff'.ljust(0x3F00 - 4000 * 4, b'\xff'))
+
+        self.assertEqual(index.word_offsets, {4000: 0x1234})
+        self.assertEqual(index.max_word, 4000)
+
     def test_from_audioData(self) -> None:
         audioData = mock.Mock(entries={
             1: mock.Mock(data=b'\xff' * 0x1234),
@@ -39,6 +87,39 @@ class TestIndex(unittest.TestCase):
         self.assertEqual(index, Index(0x100, {1: 0x300, 2: 0x1537}))
         self.assertEqual(index.max_word, 2)
 
+    def test_from_lengths(self) -> None:
+        index = Index.from_lengths({1: 0x1234, 2: 0x4567})
+
+        self.assertEqual(index, Index(0x100, {1: 0x300, 2: 0x1537}))
+
+    def test_from_lengths_max_word_on_boundary(self) -> None:
+        # 3008 * 4 == 0x2F00, so the slot of 3008 starts a new 0x100 block
+        index = Index.from_lengths({3000: 10, 3008: 20})
+
+        self.assertEqual(index.index_size, 0x3000)
+        self.assertEqual(Index.from_bytes(index.to_bytes()).word_offsets,
+                         {3000: 0x3200, 3008: 0x320D})
+        # unchanged where the max word's slot already fits
+        self.assertEqual(Index.from_lengths({3007: 10}).index_size, 0x2F00)
+
+    def test_from_lengths_duplicates(self) -> None:
+        index = Index.from_lengths({1: 0x1234, 2: 0x4567, 3: 0x1234, 4: 0x10},
+                                   duplicates={3: 1})
+
+        self.assertEqual(index, Index(0x100, {1: 0x300, 2: 0x1537, 3: 0x300, 4: 0x5aa1}))
+
+    def test_from_audioData_dedup(self) -> None:
+        audioData = mock.Mock(entries={
+            1: mock.Mock(data=b'\xff' * 0x1234),
+            2: mock.Mock(data=b'\xfe' * 0x1234),
+            3: mock.Mock(data=b'\xff' * 0x1234),
+        })
+        audioData.find_duplicates.return_value = {3: 1}
+
+        index = Index.from_AudioData(audioData, dedup=True)
+
+        self.assertEqual(index, Index(0x100, {1: 0x300, 2: 0x1537, 3: 0x300}))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,11 +1,19 @@
+import io
 import json
+import tempfile
 import unittest
 from datetime import datetime
 from hashlib import md5
 from pathlib import Path
 from typing import Dict
+from unittest import mock
 
-from scom7330.audiolib import Header, ImageHeader, Index, SpeechLib
+from benchmarks.synthetic import make_speechLib
+from scom7330 import profiling
+from scom7330.audiolib import (AudioDataEntry, Header, ImageHeader,
+                               Index, SpeechLib)
+from scom7330.manifest import Manifest
+from tests.ulaw.test_ulaw import write_wav
 
 
 class TestSpeechLib(unittest.TestCase):
@@ -18,8 +26,381 @@ class TestSpeechLib(unittest.TestCase):
         pass
 
     def test_from_directory(self) -> None:
-        # TODO
-        pass
+        entries = {
+            3000: b'\x01\x02\x03',
+            3001: b'\xff\x80' * 10,
+            4999: b'asdf',
+        }
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            for word_code, data in entries.items():
+                (Path(tempdir) / f'{word_code}.raw').write_bytes(data)
+            # ignored: wrong suffix, not a word code, or out of range
+            (Path(tempdir) / '3002.mp3').write_bytes(b'mp3')
+            (Path(tempdir) / 'notes.raw').write_bytes(b'notes')
+            (Path(tempdir) / '2999.raw').write_bytes(b'low')
+            (Path(tempdir) / '5000.raw').mkdir()
+
+            self.assertEqual(list(SpeechLib.scan_directory(Path(tempdir))), [3000, 3001, 4999])
+
+            speechLib = SpeechLib.from_directory(Path(tempdir), jobs=2)
+
+        expected = make_speechLib(entries)
+        self.assertEqual(speechLib.index, expected.index)
+        self.assertEqual(speechLib.audioData, expected.audioData)
+        self.assertEqual(speechLib.imageHeader, expected.imageHeader)
+        self.assertEqual(speechLib.header.firstFree, expected.header.firstFree)
+
+    def test_max_word_on_index_boundary(self) -> None:
+        entries = {3000: b'\x01\x02\x03', 3008: b'asdf'}
+        speechLib = SpeechLib.from_bytes(bytes(make_speechLib(entries).to_bytes()))
+
+        self.assertEqual({word_code: entry.data for word_code, entry
+                          in speechLib.audioData.entries.items()}, entries)
+
+
+class TestSpeechLibDedup(unittest.TestCase):
+    def setUp(self) -> None:
+        self.entries = {
+            3000: b'\x01\x02\x03',
+            3001: b'\xff\x80' * 10,
+            3002: b'\x01\x02\x03',
+            3003: b'asdf',
+            3004: b'\xff\x80' * 10,
+        }
+
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.input_dir = Path(tempdir.name)
+        for word_code, data in self.entries.items():
+            (self.input_dir / f'{word_code}.raw').write_bytes(data)
+
+        self.speechLib = SpeechLib.from_directory(self.input_dir, dedup=True)
+        self.lib_file = Path(tempdir.name) / 'lib.bin'
+        self.lib_file.write_bytes(self.speechLib.to_bytes())
+
+    def test_layout(self) -> None:
+        offsets = self.speechLib.index.word_offsets
+        self.assertEqual(offsets[3002], offsets[3000])
+        self.assertEqual(offsets[3004], offsets[3001])
+        self.assertEqual(len(set(offsets.values())), 3)
+
+        self.assertEqual(self.lib_file.stat().st_size,
+                         0x200 + self.speechLib.index.index_size + 3 * 3 + 3 + 20 + 4)
+        self.assertEqual(self.speechLib.header.firstFree, self.lib_file.stat().st_size)
+
+    def test_read(self) -> None:
+        expected = {word_code: AudioDataEntry(data) for word_code, data in self.entries.items()}
+
+        self.assertEqual(SpeechLib.from_file(self.lib_file).audioData.entries, expected)
+        with SpeechLib.open(self.lib_file) as speechLib:
+            self.assertEqual(dict(speechLib.audioData.entries), expected)
+        with open(self.lib_file, 'rb') as f:
+            self.assertEqual(dict(SpeechLib.iter_entries(f)), expected)
+        self.assertEqual(SpeechLib.read_words(self.lib_file, self.entries), expected)
+
+    def test_patch_shared(self) -> None:
+        SpeechLib.patch_file(self.lib_file, {3002: b'\x01'})
+
+        speechLib = SpeechLib.from_file(self.lib_file)
+        self.assertEqual(speechLib.audioData.entries[3000].data, b'\x01\x02\x03')
+        self.assertEqual(speechLib.audioData.entries[3002].data, b'\x01')
+
+    def test_compact_keeps_sharing(self) -> None:
+        compacted = self.speechLib.compacted()
+
+        self.assertEqual(compacted.to_bytes()[0x100:], self.speechLib.to_bytes()[0x100:])
+
+
+class TestSpeechLibWriteDirectory(unittest.TestCase):
+    def setUp(self) -> None:
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.dir = Path(tempdir.name)
+        self.input_dir = self.dir / 'input'
+        self.input_dir.mkdir()
+
+        (self.input_dir / '3000.raw').write_bytes(b'\x01\x02\x03')
+        # longer than a chunk
+        (self.input_dir / '3001.raw').write_bytes(bytes(range(256)) * 1000)
+        write_wav(self.input_dir / '3002.wav', b'\x00\x10\x00\xf0' * 100)
+        (self.input_dir / '4999.raw').write_bytes(b'asdf')
+
+    def assertSameAsFromDirectory(self, output_file: Path) -> None:
+        data = output_file.read_bytes()
+        expected = SpeechLib.from_directory(self.input_dir)
+        # only the timestamps differ
+        expected.header = Header.from_bytes(data[0:0x100])
+
+        self.assertEqual(data, expected.to_bytes())
+        self.assertEqual(len(data), expected.imageHeader.firstFree)
+
+    def test_write_directory(self) -> None:
+        for jobs in [1, 2]:
+            with self.subTest(jobs=jobs):
+                output_file = self.dir / f'out{jobs}.bin'
+                index, hashes = SpeechLib.write_directory(self.input_dir, output_file, jobs)
+
+                self.assertEqual(list(index.word_offsets), [3000, 3001, 3002, 4999])
+                self.assertEqual(hashes, {})
+                self.assertSameAsFromDirectory(output_file)
+
+    def test_write_directory_hashes(self) -> None:
+        output_file = self.dir / 'out.bin'
+        index, hashes = SpeechLib.write_directory(self.input_dir, output_file,
+                                                  algorithm='sha256')
+
+        expected = Manifest.from_library(output_file, 'sha256')
+        self.assertEqual(hashes, expected.hashes)
+        self.assertEqual(dict(index.word_offsets), expected.offsets)
+
+    def test_changed_size(self) -> None:
+        output_file = self.dir / 'out.bin'
+        word_files = SpeechLib.scan_directory(self.input_dir, suffixes=('raw', 'wav'))
+        path, size = word_files[3001]
+        word_files[3001] = (path, size + 1)
+
+        with mock.patch.object(SpeechLib, 'scan_directory', return_value=word_files), \
+                self.assertRaisesRegex(ValueError, "changed size"):
+            SpeechLib.write_directory(self.input_dir, output_file)
+        self.assertEqual(list(self.dir.iterdir()), [self.input_dir])
+
+    def test_memory(self) -> None:
+        (self.input_dir / '3003.raw').write_bytes(b'\x80' * 4 * 2**20)
+
+        with profiling.profile() as profiler:
+            SpeechLib.write_directory(self.input_dir, self.dir / 'out.bin')
+
+        self.assertLess(profiler.phases['file write'].peak_memory, 2**20)
+
+
+class TestSpeechLibOpen(unittest.TestCase):
+    def setUp(self) -> None:
+        self.speechLib = make_speechLib({
+            3000: b'\x01\x02\x03',
+            3001: b'\xff\x80' * 10,
+            3005: b'asdf',
+        })
+
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.lib_file = Path(tempdir.name) / 'lib.bin'
+        self.lib_file.write_bytes(self.speechLib.to_bytes())
+
+    def test_to_bytes(self) -> None:
+        data = self.speechLib.to_bytes()
+
+        self.assertEqual(len(data), self.speechLib.header.firstFree)
+        self.assertEqual(data,
+                         self.speechLib.header.to_bytes()
+                         + self.speechLib.imageHeader.to_bytes()
+                         + self.speechLib.index.to_bytes()
+                         + self.speechLib.audioData.to_bytes(self.speechLib.index))
+        self.assertEqual(SpeechLib.from_bytes(data), self.speechLib)
+
+    def test_open(self) -> None:
+        with SpeechLib.open(self.lib_file) as speechLib:
+            self.assertEqual(speechLib, self.speechLib)
+
+    def test_open_lazy(self) -> None:
+        with mock.patch.object(AudioDataEntry, 'from_bytes',
+                               wraps=AudioDataEntry.from_bytes) as from_bytes:
+            with SpeechLib.open(self.lib_file) as speechLib:
+                from_bytes.assert_not_called()
+                entry = speechLib.audioData.entries[3001]
+                self.assertIs(speechLib.audioData.entries[3001], entry)
+
+        self.assertEqual(from_bytes.call_count, 1)
+        self.assertEqual(entry, AudioDataEntry(b'\xff\x80' * 10))
+
+    def test_open_closed(self) -> None:
+        with SpeechLib.open(self.lib_file) as speechLib:
+            pass
+
+        with self.assertRaises(ValueError):
+            speechLib.audioData.entries[3000]
+
+
+class ShortReadStream(io.RawIOBase):
+    """Non-seekable stream that returns at most 5 bytes per read, like a pipe"""
+
+    def __init__(self, data: bytes) -> None:
+        self._data = io.BytesIO(data)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:  # type: ignore
+        chunk = self._data.read(min(len(buffer), 5))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+class TestSpeechLibIterEntries(unittest.TestCase):
+    def setUp(self) -> None:
+        self.entries = {
+            3000: b'\x01\x02\x03',
+            3001: b'\xff\x80' * 10,
+            3002: b'',
+            3005: b'asdf',
+        }
+        self.speechLib = make_speechLib(self.entries)
+
+    def test_read_headers(self) -> None:
+        stream = io.BytesIO(self.speechLib.to_bytes())
+        header, imageHeader, index = SpeechLib.read_headers(stream)
+
+        self.assertEqual(header, self.speechLib.header)
+        self.assertEqual(imageHeader, self.speechLib.imageHeader)
+        self.assertEqual(index, self.speechLib.index)
+        self.assertEqual(stream.tell(), 0x200 + index.index_size)
+
+    def test_iter_entries(self) -> None:
+        stream = ShortReadStream(self.speechLib.to_bytes())
+
+        self.assertEqual(list(SpeechLib.iter_entries(stream)),
+                         [(word_code, AudioDataEntry(data))
+                          for word_code, data in self.entries.items()])
+
+    def test_iter_entries_truncated(self) -> None:
+        stream = io.BytesIO(self.speechLib.to_bytes()[:-1])
+
+        with self.assertRaises(EOFError):
+            list(SpeechLib.iter_entries(stream))
+
+
+class TestSpeechLibRender(unittest.TestCase):
+    def setUp(self) -> None:
+        self.entries = {3000: b'\x01\x02\x03', 3001: b'\x80\x81', 3002: b'\x10'}
+        self.speechLib = make_speechLib(self.entries)
+
+    def test_render(self) -> None:
+        self.assertEqual(self.speechLib.render([3001, 3000, 3002]), b'\x80\x81\x01\x02\x03\x10')
+        self.assertEqual(self.speechLib.render([]), b'')
+
+    def test_render_gap(self) -> None:
+        # 1 ms is 8 samples of silence
+        self.assertEqual(self.speechLib.render([3000, 3001, 3000], gap_ms=1),
+                         b'\x01\x02\x03' + b'\xff' * 8 + b'\x80\x81' + b'\xff' * 8
+                         + b'\x01\x02\x03')
+
+    def test_render_negative_gap(self) -> None:
+        with self.assertRaises(ValueError):
+            self.speechLib.render([3000, 3001], gap_ms=-100)
+
+    def test_render_repeated(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            lib_file = Path(tempdir) / 'lib.bin'
+            lib_file.write_bytes(self.speechLib.to_bytes())
+
+            with SpeechLib.open(lib_file) as speechLib, \
+                    mock.patch.object(AudioDataEntry, 'from_bytes') as from_bytes, \
+                    mock.patch.object(AudioDataEntry, 'encoded_span',
+                                      wraps=AudioDataEntry.encoded_span) as encoded_span:
+                rendered = speechLib.render([3000, 3001, 3000, 3000])
+                with_gap = speechLib.render([3000, 3001], gap_ms=1)
+
+        self.assertEqual(rendered, b'\x01\x02\x03\x80\x81\x01\x02\x03\x01\x02\x03')
+        self.assertEqual(with_gap, b'\x01\x02\x03' + b'\xff' * 8 + b'\x80\x81')
+        # sized from the stop addresses, without decoding each entry
+        from_bytes.assert_not_called()
+        self.assertEqual(encoded_span.call_count, 4)
+
+    def test_render_missing(self) -> None:
+        with self.assertRaises(KeyError):
+            self.speechLib.render([3000, 3005])
+
+
+class TestSpeechLibReadWords(unittest.TestCase):
+    def setUp(self) -> None:
+        self.entries = {
+            3000: b'\x01\x02\x03',
+            3001: b'\xff\x80' * 10,
+            3005: b'asdf',
+        }
+
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.lib_file = Path(tempdir.name) / 'lib.bin'
+        self.lib_file.write_bytes(make_speechLib(self.entries).to_bytes())
+
+    def test_read_word(self) -> None:
+        self.assertEqual(SpeechLib.read_word(self.lib_file, 3001),
+                         AudioDataEntry(self.entries[3001]))
+
+    def test_read_words(self) -> None:
+        entries = SpeechLib.read_words(self.lib_file, [3005, 3000])
+
+        self.assertEqual(list(entries.items()), [
+            (3005, AudioDataEntry(self.entries[3005])),
+            (3000, AudioDataEntry(self.entries[3000])),
+        ])
+
+    def test_read_word_missing(self) -> None:
+        for word_code in [3002, 100000, -1]:
+            with self.subTest(word_code=word_code), self.assertRaises(KeyError):
+                SpeechLib.read_word(self.lib_file, word_code)
+
+
+class TestSpeechLibPatch(unittest.TestCase):
+    def setUp(self) -> None:
+        self.entries = {
+            3000: b'\x01\x02\x03',
+            3001: b'\xff\x80' * 10,
+            3005: b'asdf',
+        }
+
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.lib_file = Path(tempdir.name) / 'lib.bin'
+        self.lib_file.write_bytes(make_speechLib(self.entries).to_bytes())
+        self.original_size = self.lib_file.stat().st_size
+
+    def assertLibConsistent(self, expected_entries: Dict[int, bytes]) -> SpeechLib:
+        speechLib = SpeechLib.from_file(self.lib_file)
+        size = self.lib_file.stat().st_size
+
+        self.assertEqual(speechLib.header.firstFree, size)
+        self.assertEqual(speechLib.imageHeader.firstFree, size)
+        self.assertEqual(speechLib.imageHeader.max_word, max(expected_entries))
+        self.assertEqual({word_code: entry.data
+                          for word_code, entry in speechLib.audioData.entries.items()},
+                         expected_entries)
+
+        return speechLib
+
+    def test_patch_shorter(self) -> None:
+        SpeechLib.patch_file(self.lib_file, {3001: b'\x90\x91'})
+
+        self.assertEqual(self.lib_file.stat().st_size, self.original_size)
+        self.assertLibConsistent({**self.entries, 3001: b'\x90\x91'})
+
+    def test_patch_longer(self) -> None:
+        SpeechLib.patch_file(self.lib_file, {3000: b'\x90' * 10})
+
+        self.assertEqual(self.lib_file.stat().st_size, self.original_size + 13)
+        speechLib = self.assertLibConsistent({**self.entries, 3000: b'\x90' * 10})
+        self.assertEqual(speechLib.index.word_offsets[3000], self.original_size)
+
+    def test_patch_new_word(self) -> None:
+        SpeechLib.patch_file(self.lib_file, {3003: b'new', 3007: b'max'})
+
+        self.assertLibConsistent({**self.entries, 3003: b'new', 3007: b'max'})
+
+    def test_patch_outside_index(self) -> None:
+        with self.assertRaises(KeyError):
+            SpeechLib.patch_file(self.lib_file, {5000: b'1234'})
+
+    def test_compact(self) -> None:
+        SpeechLib.patch_file(self.lib_file, {3000: b'\x90' * 10, 3001: b'\x90'})
+        SpeechLib.compact_file(self.lib_file)
+
+        expected_entries = {**self.entries, 3000: b'\x90' * 10, 3001: b'\x90'}
+        self.assertLibConsistent(expected_entries)
+        self.assertEqual(self.lib_file.stat().st_size,
+                         self.original_size + 7 - 19)
+        self.assertEqual(SpeechLib.from_file(self.lib_file).header.timestamp_raw,
+                         b'09/09/09 12:00')
 
 
 class TestSpeechLib_Read_SpLibEng(unittest.TestCase):
@@ -73,6 +454,24 @@ class TestSpeechLib_Read_SpLibEng(unittest.TestCase):
 
         self.assertEqual(sums, expected_sums)
 
+    def test_read_words(self) -> None:
+        with open(self.source_file.with_suffix('.md5sums.json')) as f:
+            expected_sums = {int(k): v for k, v in json.load(f).items()}
+
+        word_codes = [1630, 0, 815]
+        entries = SpeechLib.read_words(self.source_file, word_codes)
+
+        self.assertEqual({word_code: md5(entry.data).hexdigest()
+                          for word_code, entry in entries.items()},
+                         {word_code: expected_sums[word_code] for word_code in word_codes})
+
+    def test_manifest(self) -> None:
+        actual = Manifest.from_library(self.source_file, jobs=4)
+
+        for suffix in ['.md5sums.json', '.offsets.json']:
+            expected = Manifest.load(self.source_file.with_suffix(suffix))
+            self.assertEqual(expected.compare(actual), [])
+
 
 class TestSpeechLib_DemoAudioLib(unittest.TestCase):
     source_url = "http://www.scomcontrollers.com/downloads/7330_V1.8b_191125.zip"
@@ -157,6 +556,20 @@ class TestSpeechLib_DemoAudioLib(unittest.TestCase):
 
         self.assertEqual(self.speechLibs["directory"].to_bytes(), data)
 
+    def test_write_directory_equals_file(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            output_file = Path(tempdir) / 'out.bin'
+            SpeechLib.write_directory(self.directory_source, output_file)
+            written = output_file.read_bytes()
+
+        with open(self.file_source, 'rb') as f:
+            data = f.read()
+
+        # apart from the timestamp
+        self.assertEqual(written[0x100:], data[0x100:])
+        self.assertEqual(Header.from_bytes(written[0:0x100]).firstFree,
+                         self.speechLibs["file"].header.firstFree)
+
 
 if __name__ == '__main__':
     unittest.main()
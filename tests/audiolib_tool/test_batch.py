@@ -0,0 +1,91 @@
+import contextlib
+import io
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from benchmarks.synthetic import make_speechLib
+from scom7330.audiolib_tool import _expand_glob, _read_manifest, batch, parse_args
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self) -> None:
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.dir = Path(tempdir.name)
+
+        self.entries = {word_code: bytes([word_code % 256]) * 100
+                        for word_code in range(3000, 3005)}
+        for name in ['a', 'b']:
+            (self.dir / f'{name}.bin').write_bytes(make_speechLib(self.entries).to_bytes())
+        (self.dir / 'broken.bin').write_bytes(b'not a speech lib')
+
+    def test_read_manifest(self) -> None:
+        manifest = self.dir / 'jobs.txt'
+        manifest.write_text("# a comment\n"
+                            "info 'with space.bin' --format json\n"
+                            "\n"
+                            "extract a.bin out  # trailing comment\n")
+
+        self.assertEqual(_read_manifest(manifest), [
+            ['info', 'with space.bin', '--format', 'json'],
+            ['extract', 'a.bin', 'out'],
+        ])
+
+    def test_expand_glob(self) -> None:
+        self.assertEqual(
+            _expand_glob(str(self.dir / '*.bin'), ['extract', '{path}', 'out/{stem}']),
+            [['extract', str(self.dir / f'{name}.bin'), f'out/{name}']
+             for name in ['a', 'b', 'broken']])
+
+    def test_batch(self) -> None:
+        job_argvs = [['info', '--format', 'json', str(self.dir / 'a.bin')],
+                     ['extract', str(self.dir / 'b.bin'), str(self.dir / 'out_b')],
+                     ['info', str(self.dir / 'broken.bin')],
+                     ['no-such-subcommand'],
+                     ['batch', '--glob', '*']]
+
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout), \
+             contextlib.redirect_stderr(io.StringIO()) as stderr:
+            results = batch(job_argvs, jobs=2)
+
+        self.assertEqual(sorted(result.argv for result in results), sorted(job_argvs))
+        self.assertEqual(sorted(result.argv for result in results if result.ok),
+                         sorted(job_argvs[:2]))
+        self.assertIn("5 jobs", stderr.getvalue())
+        self.assertIn("2 succeeded, 3 failed", stderr.getvalue())
+
+        self.assertEqual(json.loads(stdout.getvalue())['summary']['words'], 5)
+        self.assertEqual({int(f.stem): f.read_bytes() for f in (self.dir / 'out_b').iterdir()},
+                         self.entries)
+
+    def test_batch_false_result(self) -> None:
+        other_file = self.dir / 'other.bin'
+        other_file.write_bytes(make_speechLib({3000: b'\x01' * 10}).to_bytes())
+        job_argvs = [['diff', str(self.dir / 'a.bin'), str(self.dir / 'b.bin')],
+                     ['diff', str(self.dir / 'a.bin'), str(other_file)]]
+
+        with contextlib.redirect_stdout(io.StringIO()), \
+             contextlib.redirect_stderr(io.StringIO()) as stderr:
+            results = {result.argv[2]: result for result in batch(job_argvs, jobs=2)}
+
+        self.assertTrue(results[str(self.dir / 'b.bin')].ok)
+        self.assertFalse(results[str(other_file)].ok)
+        self.assertEqual(results[str(other_file)].error, "exited with status 1")
+        self.assertIn("1 succeeded, 1 failed", stderr.getvalue())
+
+    def test_no_jobs(self) -> None:
+        for argv in [['batch'], ['batch', '-m', 'jobs.txt', '--glob', '*.bin']]:
+            with self.subTest(argv=argv), \
+                    contextlib.redirect_stderr(io.StringIO()) as stderr, \
+                    self.assertRaises(SystemExit) as context:
+                parse_args(argv)
+
+            self.assertEqual(context.exception.code, 2)
+            self.assertIn("batch needs either a manifest or --glob", stderr.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from scom7330 import ulaw
+from scom7330.audiolib import SpeechLib
+from scom7330.audiolib_tool import generate_CustomAudioLib
+from scom7330.manifest import Manifest
+
+
+class TestCreateTrimSilence(unittest.TestCase):
+    def setUp(self) -> None:
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.dir = Path(tempdir.name)
+        self.input_dir = self.dir / 'input'
+        self.input_dir.mkdir()
+
+        # 0xff and 0x7f are silent, 0x80 and 0x00 are as loud as possible
+        self.entries = {
+            3000: b'\xff' * 100 + b'\x80\x00' * 10 + b'\x7f' * 50,
+            3001: b'\x80' * 10,
+            3002: b'\xff' * 20,
+            3003: b'\xff' * 100 + b'\x80\x00' * 10 + b'\x7f' * 50,
+        }
+        for word_code, data in self.entries.items():
+            (self.input_dir / f'{word_code}.raw').write_bytes(data)
+
+        self.trim = ulaw.SilenceTrim(padding=5)
+        self.expected = {
+            3000: b'\xff' * 5 + b'\x80\x00' * 10 + b'\x7f' * 5,
+            3001: b'\x80' * 10,
+            3002: b'\xff' * 20,
+            3003: b'\xff' * 5 + b'\x80\x00' * 10 + b'\x7f' * 5,
+        }
+
+    def words(self, output_file: Path) -> dict:
+        return {word_code: entry.data for word_code, entry
+                in SpeechLib.from_file(output_file).audioData.entries.items()}
+
+    def test_trim_silence(self) -> None:
+        for use_cache in [False, True]:
+            for dedup in [False, True]:
+                with self.subTest(use_cache=use_cache, dedup=dedup):
+                    output_file = self.dir / f'out_{use_cache}_{dedup}.bin'
+                    with self.assertLogs(level='INFO') as logs:
+                        generate_CustomAudioLib(self.input_dir, output_file,
+                                                use_cache=use_cache, dedup=dedup,
+                                                trim=self.trim)
+
+                    self.assertEqual(self.words(output_file), self.expected)
+                    self.assertEqual(output_file.stat().st_size,
+                                     0x200 + 0x2F00 + sum(len(data) + 3 for data
+                                                          in self.expected.values())
+                                     - (33 if dedup else 0))
+                    self.assertIn("INFO:root:word code: 3000 trimmed 140 bytes of silence",
+                                  logs.output)
+                    self.assertIn("INFO:root:Trimmed 280 bytes of silence in total", logs.output)
+
+    def test_cache_keeps_untrimmed(self) -> None:
+        output_file = self.dir / 'out.bin'
+        generate_CustomAudioLib(self.input_dir, output_file, use_cache=True, trim=self.trim)
+        generate_CustomAudioLib(self.input_dir, output_file, use_cache=True)
+
+        self.assertEqual(self.words(output_file), self.entries)
+
+
+class TestCreateManifest(unittest.TestCase):
+    def test_streamed_manifest(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            input_dir = Path(tempdir) / 'input'
+            input_dir.mkdir()
+            for word_code in range(3000, 3004):
+                (input_dir / f'{word_code}.raw').write_bytes(bytes([word_code % 256]) * 100)
+            output_file = Path(tempdir) / 'out.bin'
+            manifest_file = Path(tempdir) / 'manifest.json'
+
+            for use_cache in (False, True):
+                with self.subTest(use_cache=use_cache):
+                    # hashed while writing, without reading the output back
+                    with mock.patch.object(SpeechLib, 'open') as open_lib:
+                        generate_CustomAudioLib(input_dir, output_file, use_cache=use_cache,
+                                                manifest_file=manifest_file)
+                    open_lib.assert_not_called()
+
+                    self.assertEqual(Manifest.load(manifest_file),
+                                     Manifest.from_library(output_file))
+
+
+class TestCreateAtomic(unittest.TestCase):
+    def test_replaces_output(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            input_dir = Path(tempdir) / 'input'
+            input_dir.mkdir()
+            (input_dir / '3000.raw').write_bytes(b'\x01' * 10)
+            output_file = Path(tempdir) / 'out.bin'
+            output_file.write_bytes(b'old library')
+
+            for use_cache, dedup in [(False, False), (False, True), (True, False)]:
+                with self.subTest(use_cache=use_cache, dedup=dedup), \
+                        open(output_file, 'rb') as old:
+                    generate_CustomAudioLib(input_dir, output_file, use_cache=use_cache,
+                                            dedup=dedup)
+
+                    # a reader of the old file (such as serve) still sees it whole
+                    self.assertEqual(old.read(), b'old library')
+                    self.assertNotEqual(os.fstat(old.fileno()).st_ino,
+                                        output_file.stat().st_ino)
+                output_file.write_bytes(b'old library')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import tempfile
+import unittest
+import wave
+from pathlib import Path
+from unittest import mock
+
+from benchmarks.synthetic import make_speechLib
+from scom7330.audiolib import AudioDataEntry
+from scom7330.audiolib_tool import ExtractException, extract_audio
+
+
+class TestExtract(unittest.TestCase):
+    def setUp(self) -> None:
+        self.entries = {word_code: bytes([word_code % 256]) * word_code
+                        for word_code in range(3000, 3020)}
+
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.lib_file = Path(tempdir.name) / 'lib.bin'
+        self.lib_file.write_bytes(make_speechLib(self.entries).to_bytes())
+        self.output_dir = Path(tempdir.name) / 'out'
+
+    def assertExtracted(self) -> None:
+        self.assertEqual({int(f.stem): f.read_bytes() for f in self.output_dir.iterdir()},
+                         self.entries)
+
+    def test_extract(self) -> None:
+        extract_audio(self.lib_file, self.output_dir)
+        self.assertExtracted()
+
+    def test_extract_jobs(self) -> None:
+        extract_audio(self.lib_file, self.output_dir, jobs=4)
+        self.assertExtracted()
+
+    def test_extract_skip_existing(self) -> None:
+        extract_audio(self.lib_file, self.output_dir)
+        (self.output_dir / '3001.raw').write_bytes(b'changed')
+
+        with mock.patch('scom7330.audiolib_tool.open', wraps=open) as mock_open:
+            extract_audio(self.lib_file, self.output_dir, jobs=2, skip_existing=True)
+
+        written = [call.args[0] for call in mock_open.call_args_list
+                   if call.args[1] == 'wb']
+        self.assertEqual(written, [self.output_dir / '3001.raw'])
+        self.assertExtracted()
+
+    def test_extract_wav(self) -> None:
+        extract_audio(self.lib_file, self.output_dir, jobs=2, output_format='wav')
+
+        for word_code, data in self.entries.items():
+            with wave.open(str(self.output_dir / f'{word_code}.wav'), 'rb') as w:
+                self.assertEqual((w.getnchannels(), w.getsampwidth(), w.getframerate()),
+                                 (1, 2, 8000))
+                self.assertEqual(w.readframes(w.getnframes()), AudioDataEntry(data).to_pcm())
+
+    def test_extract_errors(self) -> None:
+        self.output_dir.mkdir()
+        # directories can't be opened for writing
+        (self.output_dir / '3005.raw').mkdir()
+        (self.output_dir / '3002.raw').mkdir()
+
+        with self.assertLogs(level='ERROR') as logs, \
+                self.assertRaises(ExtractException):
+            extract_audio(self.lib_file, self.output_dir, jobs=4)
+
+        self.assertEqual(len(logs.records), 2)
+        self.assertIn('3002', logs.records[0].getMessage())
+        self.assertIn('3005', logs.records[1].getMessage())
+
+
+if __name__ == '__main__':
+    unittest.main()
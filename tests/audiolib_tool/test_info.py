@@ -0,0 +1,75 @@
+import csv
+import io
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from benchmarks.synthetic import make_speechLib
+from scom7330.audiolib import AudioDataEntry, SpeechLib
+from scom7330.audiolib_tool import info
+
+
+class TestInfo(unittest.TestCase):
+    def setUp(self) -> None:
+        self.entries = {3000: b'\x01' * 800, 3001: b'\x02' * 1600, 3005: b'\x03' * 400}
+
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.lib_file = Path(tempdir.name) / 'lib.bin'
+        self.lib_file.write_bytes(make_speechLib(self.entries).to_bytes())
+
+    def info(self, output_format: str) -> str:
+        output = io.StringIO()
+        info(self.lib_file, output_format, output)
+        return output.getvalue()
+
+    def test_no_decode(self) -> None:
+        with mock.patch.object(AudioDataEntry, 'from_bytes') as from_bytes, \
+             mock.patch.object(SpeechLib, 'from_bytes') as speechLib_from_bytes:
+            self.info('text')
+
+        from_bytes.assert_not_called()
+        speechLib_from_bytes.assert_not_called()
+
+    def test_text(self) -> None:
+        output = self.info('text')
+
+        self.assertIn("word code: 3001  ", output)
+        self.assertIn("length: 0x640    (1600 bytes)", output)
+        self.assertIn("words: 3 (3 entries)", output)
+        self.assertIn("audio: 0.35 seconds (2800 bytes), 719.65 seconds below the maximum",
+                      output)
+
+    def test_json(self) -> None:
+        result = json.loads(self.info('json'))
+
+        self.assertEqual([word['word_code'] for word in result['words']], [3000, 3001, 3005])
+        self.assertEqual([word['length'] for word in result['words']], [800, 1600, 400])
+        self.assertEqual(result['words'][0]['seconds'], 0.1)
+        self.assertEqual(result['image_header']['max_word'], 3005)
+
+        summary = result['summary']
+        self.assertEqual(summary['audio_bytes'], 2800)
+        self.assertEqual(summary['index_slots'] - summary['unused_index_slots'], 3)
+        self.assertEqual(summary['unreferenced_bytes'], 0)
+        self.assertEqual(summary['file_size'], self.lib_file.stat().st_size)
+
+    def test_csv(self) -> None:
+        rows = list(csv.DictReader(io.StringIO(self.info('csv'))))
+
+        self.assertEqual([int(row['word_code']) for row in rows], [3000, 3001, 3005])
+        self.assertEqual([int(row['end']) - int(row['start']) - 2 for row in rows],
+                         [800, 1600, 400])
+
+    def test_unreferenced(self) -> None:
+        SpeechLib.patch_file(self.lib_file, {3000: b'\x04' * 1000})
+
+        summary = json.loads(self.info('json'))['summary']
+        self.assertEqual(summary['unreferenced_bytes'], 803)
+        self.assertEqual(summary['audio_bytes'], 3000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import io
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from scom7330.audiolib import AudioData, AudioLengthException, SpeechLib
+from scom7330.audiolib_tool import generate_CustomAudioLib, plan_build
+
+
+class TestPlan(unittest.TestCase):
+    def setUp(self) -> None:
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.dir = Path(tempdir.name)
+        self.input_dir = self.dir / 'input'
+        self.input_dir.mkdir()
+
+        self.entries = {3000: b'\x01' * 800, 3001: b'\x02' * 4000, 3005: b'\x03' * 2400}
+        for word_code, data in self.entries.items():
+            (self.input_dir / f'{word_code}.raw').write_bytes(data)
+
+    def plan(self) -> dict:
+        output = io.StringIO()
+        plan_build(self.input_dir, 'json', output)
+        return json.loads(output.getvalue())
+
+    def test_plan(self) -> None:
+        with mock.patch.object(AudioData, 'from_files') as from_files:
+            result = self.plan()
+        from_files.assert_not_called()
+
+        speechLib = SpeechLib.from_directory(self.input_dir)
+        summary = result['summary']
+        self.assertEqual(summary['first_free'], speechLib.header.firstFree)
+        self.assertEqual(summary['index_size'], speechLib.index.index_size)
+        self.assertEqual(summary['audio_bytes'], 7200)
+        self.assertAlmostEqual(summary['audio_minutes'], 0.015)
+        self.assertTrue(summary['fits'])
+
+        self.assertEqual([word['word_code'] for word in result['words']], [3001, 3005, 3000])
+        self.assertEqual({word['word_code']: word['start'] for word in result['words']},
+                         dict(speechLib.index.word_offsets))
+
+    def test_too_long(self) -> None:
+        with mock.patch.object(AudioData, 'MAX_AUDIO_LENGTH', 0.01):
+            self.assertFalse(self.plan()['summary']['fits'])
+
+            output = io.StringIO()
+            self.assertFalse(plan_build(self.input_dir, 'text', output))
+            self.assertIn("2400 bytes too many", output.getvalue())
+
+    def test_create_fails_before_reading(self) -> None:
+        for use_cache in [False, True]:
+            with self.subTest(use_cache=use_cache), \
+                    mock.patch.object(AudioData, 'MAX_AUDIO_LENGTH', 0.01), \
+                    mock.patch('builtins.open', wraps=open) as mock_open, \
+                    self.assertRaises(AudioLengthException):
+                generate_CustomAudioLib(self.input_dir, self.dir / 'lib.bin', use_cache=use_cache)
+
+            self.assertFalse([call for call in mock_open.call_args_list
+                              if str(call.args[0]).endswith('.raw')])
+
+    def test_dedup_checked_after_reading(self) -> None:
+        # too long as files, but fits once duplicates are shared
+        (self.input_dir / '3006.raw').write_bytes(self.entries[3001])
+
+        with mock.patch.object(AudioData, 'MAX_AUDIO_LENGTH', 0.016):
+            speechLib = SpeechLib.from_directory(self.input_dir, dedup=True)
+            self.assertEqual(speechLib.index.word_offsets[3006],
+                             speechLib.index.word_offsets[3001])
+
+            with self.assertRaises(AudioLengthException):
+                SpeechLib.from_directory(self.input_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
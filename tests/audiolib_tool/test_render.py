@@ -0,0 +1,44 @@
+import io
+import tempfile
+import unittest
+import wave
+from pathlib import Path
+from unittest import mock
+
+from benchmarks.synthetic import make_speechLib
+from scom7330 import ulaw
+from scom7330.audiolib_tool import parse_args, render
+
+
+class TestRender(unittest.TestCase):
+    def setUp(self) -> None:
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.dir = Path(tempdir.name)
+
+        self.lib_file = self.dir / 'lib.bin'
+        self.lib_file.write_bytes(make_speechLib({3000: b'\x01' * 80, 3001: b'\x80' * 40})
+                                  .to_bytes())
+
+    def test_raw(self) -> None:
+        output_file = self.dir / 'phrase.raw'
+        render(self.lib_file, [3001, 3000], output_file, gap_ms=10)
+
+        self.assertEqual(output_file.read_bytes(), b'\x80' * 40 + b'\xff' * 80 + b'\x01' * 80)
+
+    def test_wav(self) -> None:
+        output_file = self.dir / 'phrase.wav'
+        render(self.lib_file, [3000, 3000], output_file, output_format='wav')
+
+        with wave.open(str(output_file), 'rb') as w:
+            self.assertEqual(w.getframerate(), 8000)
+            self.assertEqual(w.readframes(w.getnframes()), ulaw.decode(b'\x01' * 160))
+
+    def test_negative_gap(self) -> None:
+        with mock.patch('sys.stderr', io.StringIO()) as stderr, self.assertRaises(SystemExit):
+            parse_args(['render', str(self.lib_file), '3000', '3001', '--gap', '-100'])
+        self.assertIn("-100 is negative", stderr.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import io
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from pathlib import Path
+
+from benchmarks.__main__ import compare, run
+from benchmarks.synthetic import generate_entries, generate_speechLib, write_directory
+from scom7330.audiolib import AudioData, SpeechLib
+
+
+class TestSynthetic(unittest.TestCase):
+    def test_deterministic(self) -> None:
+        self.assertEqual(generate_entries(20, 100), generate_entries(20, 100))
+        self.assertNotEqual(generate_entries(20, 100), generate_entries(20, 100, seed=1))
+
+    def test_entries(self) -> None:
+        entries = generate_entries(20, 100, first_code=3000)
+
+        self.assertEqual(list(entries), list(range(3000, 3020)))
+        for data in entries.values():
+            self.assertTrue(50 <= len(data) <= 150)
+
+    def test_round_trip(self) -> None:
+        speechLib = generate_speechLib(50, 200, first_code=3000)
+        self.assertEqual(SpeechLib.from_bytes(speechLib.to_bytes()), speechLib)
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            write_directory({word_code: entry.data
+                             for word_code, entry in speechLib.audioData.entries.items()},
+                            Path(tempdir))
+            fromDirectory = SpeechLib.from_directory(Path(tempdir))
+
+        self.assertEqual(fromDirectory.audioData, speechLib.audioData)
+        self.assertEqual(fromDirectory.index, speechLib.index)
+
+
+class TestRun(unittest.TestCase):
+    def test_over_length(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdir, redirect_stderr(io.StringIO()):
+            results = run(100, 60000, 1, Path(tempdir))
+
+        # more audio than a custom library may hold, as SpLibEng has
+        self.assertGreater(results['params']['library_size'],
+                           AudioData.MAX_AUDIO_LENGTH * AudioData.AUDIO_SAMPLE_RATE * 60)
+        self.assertEqual(len(results['results']), 6)
+
+
+class TestCompare(unittest.TestCase):
+    def test_compare(self) -> None:
+        params = {'word_count': 1}
+        baseline = {'params': params, 'results': {'a': {'seconds': 1.0},
+                                                  'b': {'seconds': 1.0}}}
+        results = {'params': params, 'results': {'a': {'seconds': 1.2},
+                                                 'b': {'seconds': 1.3},
+                                                 'c': {'seconds': 5.0}}}
+
+        regressions = compare(results, baseline, 0.25)
+
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith('b:'))
+
+
+if __name__ == '__main__':
+    unittest.main()
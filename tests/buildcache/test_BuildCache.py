@@ -0,0 +1,137 @@
+import hashlib
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from scom7330 import profiling
+from scom7330.audiolib import SpeechLib
+from scom7330.buildcache import BuildCache, generate_cached
+
+
+class TestBuildCache(unittest.TestCase):
+    def setUp(self) -> None:
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+
+        self.input_dir = Path(tempdir.name) / 'input'
+        self.input_dir.mkdir()
+        self.output_file = Path(tempdir.name) / 'lib.bin'
+
+        self.entries = {word_code: bytes([word_code % 256, 0x80, 0xff]) * (word_code - 2990)
+                        for word_code in range(3000, 3010)}
+        for word_code, data in self.entries.items():
+            (self.input_dir / f'{word_code}.raw').write_bytes(data)
+
+    def build(self, max_size: int = BuildCache.DEFAULT_MAX_SIZE) -> BuildCache:
+        with BuildCache.for_output(self.output_file, max_size) as cache:
+            generate_cached(self.input_dir, self.output_file, cache, jobs=2)
+
+        return cache
+
+    def assertOutputMatches(self) -> None:
+        expected = SpeechLib.from_directory(self.input_dir)
+        actual = SpeechLib.from_file(self.output_file)
+
+        self.assertEqual(actual.index, expected.index)
+        self.assertEqual(actual.imageHeader, expected.imageHeader)
+        self.assertEqual(actual.audioData, expected.audioData)
+
+    def test_rebuild(self) -> None:
+        cache = self.build()
+        self.assertEqual((cache.hits, cache.misses), (0, 10))
+        self.assertOutputMatches()
+
+        cache = self.build()
+        self.assertEqual((cache.hits, cache.misses), (10, 0))
+        self.assertOutputMatches()
+
+    def test_rebuild_changed(self) -> None:
+        self.build()
+
+        (self.input_dir / '3004.raw').write_bytes(b'\x81\x82' * 1000)
+        # a file which changes mtime but not contents is still found by hash
+        stat = (self.input_dir / '3005.raw').stat()
+        os.utime(self.input_dir / '3005.raw', ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+        cache = self.build()
+        self.assertEqual((cache.hits, cache.misses), (8, 2))
+        self.assertOutputMatches()
+
+    def test_rebuild_without_output(self) -> None:
+        self.build()
+        self.output_file.unlink()
+
+        # entries come from the cache directory instead
+        cache = self.build()
+        self.assertEqual((cache.hits, cache.misses), (10, 0))
+        self.assertOutputMatches()
+
+    def test_dedup(self) -> None:
+        (self.input_dir / '3010.raw').write_bytes(self.entries[3003])
+
+        with BuildCache.for_output(self.output_file) as cache:
+            generate_cached(self.input_dir, self.output_file, cache, dedup=True)
+
+        expected = SpeechLib.from_directory(self.input_dir, dedup=True)
+        self.assertEqual(self.output_file.read_bytes()[0x100:], expected.to_bytes()[0x100:])
+
+    def test_hashes(self) -> None:
+        (self.input_dir / '3010.raw').write_bytes(self.entries[3003])
+
+        with BuildCache.for_output(self.output_file) as cache:
+            index, hashes = generate_cached(self.input_dir, self.output_file, cache,
+                                            dedup=True, algorithm='md5')
+
+        self.assertEqual(index.word_offsets[3010], index.word_offsets[3003])
+        words = {**self.entries, 3010: self.entries[3003]}
+        self.assertEqual(hashes, {word_code: hashlib.md5(data).hexdigest()
+                                  for word_code, data in words.items()})
+
+    def test_memory(self) -> None:
+        for word_code in range(3010, 3050):
+            (self.input_dir / f'{word_code}.raw').write_bytes(bytes([word_code % 256]) * 2**17)
+
+        # built from the input files, then from the previous output
+        for _ in range(2):
+            with profiling.profile() as profiler, BuildCache.for_output(self.output_file) as cache:
+                generate_cached(self.input_dir, self.output_file, cache)
+
+            # 5 MiB in all, but held one entry at a time
+            self.assertLess(profiler.phases['entry encode'].peak_memory, 2**20)
+            self.assertLess(profiler.phases['file write'].peak_memory, 2**20)
+
+    def test_recently_used(self) -> None:
+        self.build()
+        blobs = list(self.output_file.with_name('lib.bin.cache').glob('*.bin'))
+        for blob in blobs:
+            os.utime(blob, ns=(0, 0))
+
+        # every entry comes from the previous output, but its blob is still in use
+        cache = self.build()
+        self.assertEqual((cache.hits, cache.misses), (10, 0))
+        for blob in blobs:
+            self.assertNotEqual(blob.stat().st_mtime_ns, 0)
+
+    def test_removed_input(self) -> None:
+        self.build()
+        (self.input_dir / '3000.raw').unlink()
+
+        cache = self.build()
+        self.assertNotIn(str(self.input_dir / '3000.raw'), cache._files)
+        self.assertEqual(len(cache._files), 9)
+
+    def test_eviction(self) -> None:
+        self.build(max_size=100)
+
+        blobs = list(self.output_file.with_name('lib.bin.cache').glob('*.bin'))
+        self.assertLessEqual(sum(blob.stat().st_size for blob in blobs), 100)
+
+        self.output_file.unlink()
+        cache = self.build()
+        self.assertEqual(cache.hits + cache.misses, 10)
+        self.assertOutputMatches()
+
+
+if __name__ == '__main__':
+    unittest.main()
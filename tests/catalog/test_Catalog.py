@@ -0,0 +1,130 @@
+import io
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+from typing import Dict
+from unittest import mock
+
+from benchmarks.synthetic import make_speechLib
+from scom7330.audiolib import Header, SpeechLib
+from scom7330.audiolib_tool import catalog_command, parse_args
+from scom7330.catalog import Catalog, hash_audio
+from scom7330.diff import LibDiff
+
+
+class TestCatalog(unittest.TestCase):
+    def setUp(self) -> None:
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.dir = Path(tempdir.name)
+
+        self.v1 = self.write_lib('v1.bin', {3000: b'\x01' * 40, 3001: b'\x02' * 20},
+                                 datetime(2020, 1, 1))
+        self.v2 = self.write_lib('v2.bin', {3000: b'\x01' * 40, 3001: b'\x03' * 20,
+                                            3002: b'\x02' * 20, 3003: b'\x02' * 20},
+                                 datetime(2021, 1, 1))
+
+        self.catalog = Catalog(self.dir / 'catalog.sqlite')
+        self.addCleanup(self.catalog.close)
+        self.assertEqual(self.catalog.update([self.v2, self.v1]), (2, 0, 0, 0))
+
+    def write_lib(self, name: str, entries: Dict[int, bytes], timestamp: datetime) -> Path:
+        speechLib = make_speechLib(entries)
+        speechLib.header = Header(speechLib.header.firstFree, timestamp=timestamp)
+        lib_file = self.dir / name
+        lib_file.write_bytes(speechLib.to_bytes())
+        return lib_file
+
+    def test_update_incremental(self) -> None:
+        with mock.patch.object(SpeechLib, 'open') as open_lib:
+            self.assertEqual(self.catalog.update([self.v1, self.v2]), (0, 2, 0, 0))
+        open_lib.assert_not_called()
+
+        self.write_lib('v1.bin', {3000: b'\x04' * 10}, datetime(2020, 1, 1))
+        stat = self.v1.stat()
+        os.utime(self.v1, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.assertEqual(self.catalog.update([self.v1, self.v2]), (1, 1, 0, 0))
+        self.assertEqual(self.catalog.find(hash_audio(b'\x02' * 20), 3001), [])
+
+        self.v2.unlink()
+        self.assertEqual(self.catalog.update([self.v1], prune=True), (0, 1, 1, 0))
+        self.assertEqual([path.name for path, *_ in self.catalog.libraries()], ['v1.bin'])
+
+    def test_update_failed(self) -> None:
+        bad = self.dir / 'bad.bin'
+        bad.write_bytes(b'not a speech lib')
+
+        with self.assertLogs(level='ERROR'):
+            self.assertEqual(self.catalog.update([bad, self.v1, self.dir / 'missing.bin']),
+                             (0, 1, 0, 2))
+        self.assertEqual(len(self.catalog.libraries()), 2)
+
+    def test_libraries(self) -> None:
+        self.assertEqual(self.catalog.libraries(), [
+            (self.v1.resolve(), 'SCOM Cust ALib', '1.0.0', datetime(2020, 1, 1), 2),
+            (self.v2.resolve(), 'SCOM Cust ALib', '1.0.0', datetime(2021, 1, 1), 4),
+        ])
+
+    def test_find(self) -> None:
+        audio_hash = self.catalog.word_hash(self.v1, 3001)
+        self.assertEqual(audio_hash, hash_audio(b'\x02' * 20))
+
+        occurrences = self.catalog.find(audio_hash)
+        self.assertEqual([(o.path.name, o.word_code) for o in occurrences],
+                         [('v1.bin', 3001), ('v2.bin', 3002), ('v2.bin', 3003)])
+        self.assertEqual([o.path.name for o in self.catalog.find(audio_hash, 3001)], ['v1.bin'])
+        self.assertEqual(self.catalog.first(audio_hash), occurrences[0])
+        self.assertIsNone(self.catalog.first(hash_audio(b'nothing')))
+
+    def test_diff(self) -> None:
+        self.assertEqual(self.catalog.diff(self.v1, self.v2), LibDiff.from_files(self.v1, self.v2))
+        self.assertTrue(self.catalog.diff(self.v1, self.v1).identical)
+
+        with self.assertRaises(KeyError):
+            self.catalog.diff(self.v1, self.dir / 'v3.bin')
+
+    def test_duplicates(self) -> None:
+        self.assertEqual(self.catalog.duplicates(self.v2), [([3002, 3003], 23)])
+        self.assertEqual(self.catalog.duplicates(self.v1), [])
+
+    def run_command(self, *argv: str, ok: bool = True) -> str:
+        args = parse_args(['catalog', '--db', str(self.catalog.db_file), *argv])
+        output = io.StringIO()
+        self.assertEqual(catalog_command(args, output), ok)
+        return output.getvalue()
+
+    def test_commands(self) -> None:
+        self.assertEqual(self.run_command('update', str(self.dir)),
+                         "0 updated, 2 unchanged, 0 pruned, 0 failed\n")
+
+        # create's build cache, next to a library built in the directory
+        cache_dir = self.dir / 'v2.bin.cache'
+        cache_dir.mkdir()
+        (cache_dir / '0123456789abcdef0123456789abcdef.bin').write_bytes(b'\x01' * 40)
+        self.assertEqual(self.run_command('update', str(self.dir)),
+                         "0 updated, 2 unchanged, 0 pruned, 0 failed\n")
+
+        (self.dir / 'bad.bin').write_bytes(b'')
+        with self.assertLogs(level='ERROR'):
+            self.assertEqual(self.run_command('update', str(self.dir), ok=False),
+                             "0 updated, 2 unchanged, 0 pruned, 1 failed\n")
+
+        raw_file = self.dir / '3001.raw'
+        raw_file.write_bytes(b'\x02' * 20)
+        first = self.run_command('first', '--file', str(raw_file))
+        self.assertIn(f"{self.v1.resolve()}  word code: 3001", first)
+        self.assertEqual(len(self.run_command('find', '3000', '--from', str(self.v2))
+                             .splitlines()), 2)
+
+        with mock.patch('sys.stderr', io.StringIO()) as stderr, self.assertRaises(SystemExit):
+            self.run_command('first', '--from', str(self.v2))
+        self.assertIn("--from needs a word code", stderr.getvalue())
+
+        self.assertIn("2 unchanged", self.run_command('diff', str(self.v1), str(self.v1)))
+        self.assertIn("23 bytes could be saved", self.run_command('dedup', str(self.v2)))
+
+
+if __name__ == '__main__':
+    unittest.main()
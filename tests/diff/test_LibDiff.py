@@ -0,0 +1,85 @@
+import io
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from benchmarks.synthetic import make_speechLib
+from scom7330.audiolib import SpeechLib
+from scom7330.audiolib_tool import diff
+from scom7330.diff import LibDiff, _format_codes
+
+
+class TestLibDiff(unittest.TestCase):
+    def setUp(self) -> None:
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.dir = Path(tempdir.name)
+
+        self.entries = {word_code: bytes([word_code % 256, 0x80]) * 50
+                        for word_code in range(3000, 3010)}
+        self.old_file = self.dir / 'old.bin'
+        self.old_file.write_bytes(make_speechLib(self.entries).to_bytes())
+
+    def write_new(self, entries: dict) -> Path:
+        new_file = self.dir / 'new.bin'
+        new_file.write_bytes(make_speechLib(entries).to_bytes())
+        return new_file
+
+    def test_identical(self) -> None:
+        libDiff = LibDiff.from_files(self.old_file, self.write_new(self.entries))
+
+        self.assertTrue(libDiff.identical)
+        self.assertEqual(libDiff.unchanged, 10)
+
+    def test_differences(self) -> None:
+        entries = dict(self.entries)
+        del entries[3000]
+        entries[3003] = b'\x01' * 10
+        # same length, different audio
+        entries[3005] = bytes(reversed(entries[3005]))
+        entries[3010] = b'\x02'
+        libDiff = LibDiff.from_files(self.old_file, self.write_new(entries))
+
+        self.assertFalse(libDiff.identical)
+        self.assertEqual(libDiff.added, [3010])
+        self.assertEqual(libDiff.removed, [3000])
+        self.assertEqual(libDiff.changed, {3003: (100, 10), 3005: (100, 100)})
+        # everything has moved up, from where 3000 was
+        self.assertEqual(list(libDiff.moved), [3001, 3002, 3004, 3006, 3007, 3008, 3009])
+        self.assertEqual(libDiff.unchanged, 0)
+        self.assertEqual(libDiff.imageHeader['max_word'], (3009, 3010))
+        self.assertIn('firstFree', libDiff.header)
+
+    def test_patched(self) -> None:
+        new_file = self.write_new(self.entries)
+        SpeechLib.patch_file(new_file, {3002: b'\x03' * 200})
+
+        libDiff = LibDiff.from_files(self.old_file, new_file)
+        self.assertEqual(libDiff.changed, {3002: (100, 200)})
+        self.assertEqual(libDiff.moved, {})
+        self.assertFalse(libDiff.same_audio)
+
+    def test_format_codes(self) -> None:
+        self.assertEqual(_format_codes([1, 2, 3, 5, 7, 8]), "1-3, 5, 7-8")
+        self.assertEqual(_format_codes([]), "")
+
+    def test_output(self) -> None:
+        entries = dict(self.entries)
+        entries[3003] = b'\x01' * 10
+        new_file = self.write_new(entries)
+
+        output = io.StringIO()
+        self.assertFalse(diff(self.old_file, new_file, 'text', output))
+        self.assertIn("word code: 3003  length: 100 -> 10", output.getvalue())
+        self.assertIn("Moved: 3004-3009", output.getvalue())
+
+        output = io.StringIO()
+        diff(self.old_file, new_file, 'json', output)
+        result = json.loads(output.getvalue())
+        self.assertEqual(result['changed'], {'3003': {'old_length': 100, 'new_length': 10}})
+        self.assertEqual(result['header']['firstFree'][0], self.old_file.stat().st_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import contextlib
+import hashlib
+import io
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from benchmarks.synthetic import make_speechLib
+from scom7330.audiolib import SpeechLib
+from scom7330.audiolib_tool import generate_CustomAudioLib, verify
+from scom7330.manifest import Manifest
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self) -> None:
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.dir = Path(tempdir.name)
+
+        self.entries = {word_code: bytes([word_code % 256, 0x80]) * (word_code - 2990)
+                        for word_code in range(3000, 3010)}
+        self.speechLib = make_speechLib(self.entries)
+        self.lib_file = self.dir / 'lib.bin'
+        self.lib_file.write_bytes(self.speechLib.to_bytes())
+
+        self.input_dir = self.dir / 'input'
+        self.input_dir.mkdir()
+        for word_code, data in self.entries.items():
+            (self.input_dir / f'{word_code}.raw').write_bytes(data)
+
+    def test_from_library(self) -> None:
+        manifest = Manifest.from_library(self.lib_file, 'sha256', jobs=4)
+
+        self.assertEqual(manifest.hashes, {word_code: hashlib.sha256(data).hexdigest()
+                                           for word_code, data in self.entries.items()})
+        self.assertEqual(manifest.offsets, dict(self.speechLib.index.word_offsets))
+
+    def test_from_directory(self) -> None:
+        # any word code, unlike create
+        (self.input_dir / '12.raw').write_bytes(b'\x01\x02')
+        manifest = Manifest.from_directory(self.input_dir, jobs=2)
+
+        self.assertEqual(manifest.hashes[12], hashlib.md5(b'\x01\x02').hexdigest())
+        self.assertEqual(len(manifest.hashes), 11)
+        self.assertIsNone(manifest.offsets)
+
+    def test_json(self) -> None:
+        manifest = Manifest.from_library(self.lib_file, 'blake2b')
+        self.assertEqual(Manifest.from_json(json.loads(json.dumps(manifest.to_json()))),
+                         manifest)
+
+    def test_legacy_json(self) -> None:
+        self.assertEqual(Manifest.from_json({"0": "abc", "1": "def"}),
+                         Manifest(hashes={0: "abc", 1: "def"}))
+        self.assertEqual(Manifest.from_json({"0": 7168, "1": 12264}),
+                         Manifest(offsets={0: 7168, 1: 12264}))
+
+    def test_compare(self) -> None:
+        expected = Manifest(hashes={1: 'a', 2: 'b', 3: 'c'}, offsets={1: 0x10, 2: 0x20, 3: 0x30})
+        actual = Manifest(hashes={1: 'a', 2: 'x', 4: 'd'}, offsets={1: 0x11, 2: 0x20, 4: 0x40})
+
+        self.assertEqual(expected.compare(actual), [
+            "word code 3: missing",
+            "word code 4: unexpected",
+            "word code 2: md5 x, expected b",
+            "word code 1: offset 0x11, expected 0x10",
+        ])
+        # directories have no offsets to compare
+        self.assertEqual(expected.compare(Manifest(hashes={1: 'a', 2: 'b', 3: 'c'})), [])
+
+        with self.assertRaises(ValueError):
+            expected.compare(Manifest('sha1', hashes={}))
+
+    def test_create_manifest(self) -> None:
+        for use_cache in [False, True]:
+            with self.subTest(use_cache=use_cache):
+                output_file = self.dir / f'out_{use_cache}.bin'
+                manifest_file = self.dir / f'out_{use_cache}.json'
+                generate_CustomAudioLib(self.input_dir, output_file, use_cache=use_cache,
+                                        manifest_file=manifest_file, algorithm='sha1')
+
+                self.assertEqual(Manifest.load(manifest_file),
+                                 Manifest.from_library(output_file, 'sha1'))
+                with contextlib.redirect_stdout(io.StringIO()) as stdout:
+                    self.assertTrue(verify(output_file, manifest_file))
+                    self.assertTrue(verify(self.input_dir, manifest_file))
+                self.assertEqual(stdout.getvalue(),
+                                 f"{output_file}: OK\n{self.input_dir}: OK\n")
+
+    def test_verify_mismatch(self) -> None:
+        manifest_file = self.dir / 'manifest.json'
+        Manifest.from_library(self.lib_file).save(manifest_file)
+
+        SpeechLib.patch_file(self.lib_file, {3001: b'\x00' * 10})
+
+        with self.assertLogs(level='ERROR') as logs, \
+                contextlib.redirect_stdout(io.StringIO()) as stdout:
+            self.assertFalse(verify(self.lib_file, manifest_file))
+        self.assertEqual(stdout.getvalue(), f"{self.lib_file}: 1 mismatches\n")
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("word code 3001", logs.output[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
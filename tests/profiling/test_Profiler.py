@@ -0,0 +1,73 @@
+import json
+import unittest
+
+from benchmarks.synthetic import make_speechLib
+from scom7330 import profiling
+from scom7330.audiolib import SpeechLib
+
+
+class TestProfiler(unittest.TestCase):
+    def test_phase(self) -> None:
+        profiler = profiling.Profiler()
+
+        for _ in range(2):
+            with profiler.phase("outer", 10):
+                with profiler.phase("inner", 5):
+                    pass
+        profiler.count("outer", 1)
+
+        self.assertEqual(profiler.phases["outer"].calls, 2)
+        self.assertEqual(profiler.phases["outer"].bytes, 21)
+        self.assertEqual(profiler.phases["inner"].calls, 2)
+        self.assertEqual(profiler.phases["inner"].bytes, 10)
+        self.assertGreaterEqual(profiler.phases["outer"].seconds,
+                                profiler.phases["inner"].seconds)
+
+    def test_phase_exception(self) -> None:
+        profiler = profiling.Profiler()
+
+        with self.assertRaises(ValueError):
+            with profiler.phase("failing"):
+                raise ValueError
+
+        self.assertEqual(profiler.phases["failing"].calls, 1)
+
+    def test_peak_memory(self) -> None:
+        with profiling.profile() as profiler:
+            with profiling.phase("allocate"):
+                data = bytearray(1024 * 1024)
+                del data
+            with profiling.phase("nothing"):
+                pass
+
+        self.assertGreaterEqual(profiler.phases["allocate"].peak_memory, 1024 * 1024)
+        self.assertLess(profiler.phases["nothing"].peak_memory, 1024 * 1024)
+
+    def test_inactive(self) -> None:
+        # phases outside of a profile context are ignored
+        with profiling.phase("ignored", 10):
+            profiling.count("ignored", 10)
+
+        with profiling.profile(trace_memory=False) as profiler:
+            pass
+
+        self.assertEqual(profiler.phases, {})
+
+    def test_SpeechLib(self) -> None:
+        data = make_speechLib({3000: b'\x01\x80' * 10, 3001: b'\x02\x81' * 20}).to_bytes()
+
+        with profiling.profile() as profiler:
+            SpeechLib.from_bytes(data)
+
+        self.assertEqual(profiler.phases["header parse"].bytes, 0x200)
+        self.assertEqual(profiler.phases["index parse"].calls, 1)
+        self.assertEqual(profiler.phases["entry decode"].bytes, len(data))
+
+        self.assertEqual(set(json.loads(json.dumps(profiler.to_dict()))), set(profiler.phases))
+        table = profiler.format_table().splitlines()
+        self.assertEqual(len(table), len(profiler.phases) + 1)
+        self.assertTrue(table[1].startswith("header parse"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+import wave
+from io import BytesIO
+from pathlib import Path
+from typing import Tuple
+
+from benchmarks.synthetic import make_speechLib
+from scom7330 import ulaw
+from scom7330.server import PreviewServer
+
+
+class TestPreviewServer(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.dir = Path(tempdir.name)
+
+        self.lib_file = self.dir / 'site1.bin'
+        self.lib_file.write_bytes(make_speechLib({3000: b'\x01' * 80, 3001: b'\x80' * 40})
+                                  .to_bytes())
+        self.other_file = self.dir / 'site2.bin'
+        self.other_file.write_bytes(make_speechLib({3000: b'\x02' * 20}).to_bytes())
+
+        self.server = PreviewServer([self.lib_file, self.other_file])
+        self.host, self.port = await self.server.start('127.0.0.1', 0)
+
+    async def asyncTearDown(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def get(self, target: str, method: str = 'GET') -> Tuple[int, bytes]:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        writer.write(f"{method} {target} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        response = await reader.read()
+        writer.close()
+
+        head, _, body = response.partition(b'\r\n\r\n')
+        status = int(head.split()[1])
+        headers = dict(line.split(': ', 1) for line in head.decode().split('\r\n')[1:])
+        self.assertEqual(int(headers['Content-Length']), len(body))
+        return status, body
+
+    async def test_word(self) -> None:
+        self.assertEqual(await self.get('/word/3001'), (200, b'\x80' * 40))
+        self.assertEqual(await self.get('/word/3000?lib=site2'), (200, b'\x02' * 20))
+
+    async def test_word_wav(self) -> None:
+        status, body = await self.get('/word/3000?format=wav')
+        self.assertEqual(status, 200)
+        with wave.open(BytesIO(body), 'rb') as w:
+            self.assertEqual(w.getframerate(), 8000)
+            self.assertEqual(w.readframes(w.getnframes()), ulaw.decode(b'\x01' * 80))
+
+    async def test_phrase(self) -> None:
+        self.assertEqual(await self.get('/phrase?codes=3001,3000&gap=10'),
+                         (200, b'\x80' * 40 + b'\xff' * 80 + b'\x01' * 80))
+
+    async def test_large_phrase(self) -> None:
+        # longer than a chunk, once decoded
+        status, body = await self.get('/phrase?codes=' + ','.join(['3000'] * 500)
+                                      + '&format=wav')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, ulaw.to_wav(b'\x01' * 80 * 500))
+
+    async def test_errors(self) -> None:
+        self.assertEqual((await self.get('/word/3002'))[0], 404)
+        self.assertEqual((await self.get('/word/3000?lib=site3'))[0], 404)
+        self.assertEqual((await self.get('/word/abc'))[0], 400)
+        self.assertEqual((await self.get('/phrase'))[0], 400)
+        self.assertEqual((await self.get('/word/3000?format=mp3'))[0], 400)
+        self.assertEqual((await self.get('/nothing'))[0], 404)
+        self.assertEqual((await self.get('/word/3000', 'POST'))[0], 405)
+
+    async def test_metrics(self) -> None:
+        await self.get('/word/3000')
+        await self.get('/word/3000')
+        await self.get('/phrase?codes=3000,3001')
+
+        status, body = await self.get('/metrics')
+        self.assertEqual(status, 200)
+        metrics = json.loads(body)
+        self.assertEqual(metrics['cache']['hits'], 2)
+        self.assertEqual(metrics['cache']['misses'], 2)
+        self.assertEqual(metrics['cache']['bytes'], 120)
+        self.assertEqual(metrics['endpoints']['word']['requests'], 2)
+        self.assertEqual(metrics['endpoints']['phrase']['requests'], 1)
+
+    async def test_cache_limit(self) -> None:
+        self.server.cache.max_bytes = 100
+        await self.get('/word/3000')
+        await self.get('/word/3001')
+        self.assertEqual(self.server.cache.size, 40)
+        await self.get('/word/3000')
+        self.assertEqual(self.server.cache.misses, 3)
+
+    async def test_reload(self) -> None:
+        await self.get('/word/3000')
+        self.lib_file.write_bytes(make_speechLib({3000: b'\x03' * 10}).to_bytes())
+        # in case the mtime resolution is coarse
+        stat = self.lib_file.stat()
+        os.utime(self.lib_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+        self.assertEqual(await self.get('/word/3000'), (200, b'\x03' * 10))
+        self.assertEqual((await self.get('/word/3001'))[0], 404)
+        self.assertEqual(self.server.reloads, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import tempfile
+import unittest
+import warnings
+import wave
+from array import array
+from pathlib import Path
+
+from scom7330 import ulaw
+from scom7330.audiolib import SpeechLib
+from scom7330.buildcache import BuildCache, generate_cached
+
+
+def write_wav(path: Path, frames: bytes, rate: int = 8000, channels: int = 1,
+              sample_width: int = 2) -> None:
+    with wave.open(str(path), 'wb') as w:
+        w.setnchannels(channels)
+        w.setsampwidth(sample_width)
+        w.setframerate(rate)
+        w.writeframes(frames)
+
+
+class TestEncode(unittest.TestCase):
+    def test_encode(self) -> None:
+        self.assertEqual(ulaw.encode(array('h', [0, -1, 32767, -32768, 1000, -1000])),
+                         bytes([0xFF, 0x7E, 0x80, 0x00, 0xCE, 0x4E]))
+
+    def test_matches_audioop(self) -> None:
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', DeprecationWarning)
+                import audioop
+        except ImportError:
+            raise unittest.SkipTest("audioop is not available")
+
+        samples = array('h', range(-32768, 32768))
+        self.assertEqual(ulaw.encode(samples), audioop.lin2ulaw(samples.tobytes(), 2))
+
+
+class TestDecode(unittest.TestCase):
+    def test_round_trip(self) -> None:
+        data = bytes(range(256))
+        encoded = ulaw.encode(array('h', ulaw.decode(data)))
+
+        # the two encodings of zero decode the same
+        self.assertEqual(encoded, data.replace(b'\x7f', b'\xff'))
+
+    def test_matches_audioop(self) -> None:
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', DeprecationWarning)
+                import audioop
+        except ImportError:
+            raise unittest.SkipTest("audioop is not available")
+
+        data = bytes(range(256))
+        self.assertEqual(ulaw.decode(data), audioop.ulaw2lin(data, 2))
+
+
+class TestSilenceTrim(unittest.TestCase):
+    def test_trim(self) -> None:
+        silence = ulaw.encode(array('h', [0, 50, -100, 200, -200]))
+        loud = ulaw.encode(array('h', [1000, 0, -5000]))
+        trim = ulaw.SilenceTrim(threshold=256, padding=2)
+
+        self.assertEqual(trim.trim(silence + loud + silence), silence[-2:] + loud + silence[:2])
+        self.assertEqual(trim.trim(loud), loud)
+        self.assertEqual(ulaw.SilenceTrim(padding=0).trim(silence * 3 + loud), loud)
+        # all silence is left alone
+        self.assertEqual(trim.trim(silence), silence)
+        self.assertEqual(ulaw.SilenceTrim(threshold=40000).trim(loud), loud)
+
+    def test_trim_newlines(self) -> None:
+        # 0x0A is loud, and must be matched by the search for the last loud byte
+        silence = b'\xff' * 10
+        trim = ulaw.SilenceTrim(padding=0)
+
+        self.assertEqual(trim.trim(silence + b'\x0a\xff\x0a' + silence), b'\x0a\xff\x0a')
+        self.assertEqual(trim.trim(silence + b'\x00\x0a\x0a' + silence), b'\x00\x0a\x0a')
+
+    def test_trim_memoryview(self) -> None:
+        data = b'\xff' * 10 + b'\x80' * 5 + b'\xff' * 10
+        trim = ulaw.SilenceTrim(padding=1)
+
+        self.assertEqual(bytes(trim.trim(memoryview(data))), trim.trim(data))
+
+
+class TestConvert(unittest.TestCase):
+    def test_to_16bit(self) -> None:
+        expected = array('h', [0x1234, -0x1234])
+        self.assertEqual(ulaw._to_16bit(bytes([0x80 + 0x12, 0x80 - 0x13]), 1),
+                         array('h', [0x1200, -0x1300]))
+        self.assertEqual(ulaw._to_16bit(expected.tobytes(), 2), expected)
+        self.assertEqual(ulaw._to_16bit(b'\xff\x34\x12\x00\xcc\xed', 3), expected)
+        self.assertEqual(ulaw._to_16bit(b'\x00\xff\x34\x12\x00\x00\xcc\xed', 4), expected)
+
+    def test_downmix(self) -> None:
+        self.assertEqual(ulaw.downmix(array('h', [100, 200, -100, -301, 5, 5]), 2),
+                         array('h', [150, -201, 5]))
+        mono = array('h', [1, 2, 3])
+        self.assertIs(ulaw.downmix(mono, 1), mono)
+
+    def test_resample(self) -> None:
+        self.assertEqual(ulaw.resample(array('h', [0, 10, 20, 30, 40, 50]), 16000),
+                         array('h', [5, 25, 45]))
+        self.assertEqual(ulaw.resample(array('h', [0, 10, 20]), 4000),
+                         array('h', [0, 5, 10, 15, 20, 20]))
+        self.assertEqual(ulaw.resample([1, 2, 3], 8000), array('h', [1, 2, 3]))
+        self.assertEqual(len(ulaw.resample(array('h', [0]) * 44100, 44100)), 8000)
+
+    def test_read_wav(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            wav_file = Path(tempdir) / '3000.wav'
+            # stereo at 16 kHz, channels differing
+            write_wav(wav_file, array('h', [1000, 3000, -1000, -3000] * 8).tobytes(),
+                      rate=16000, channels=2)
+
+            self.assertEqual(ulaw.wav_length(wav_file), 8)
+            self.assertEqual(ulaw.read_wav(wav_file),
+                             ulaw.encode(array('h', [0] * 8)))
+
+            write_wav(wav_file, array('h', [1000, -1000]).tobytes())
+            self.assertEqual(ulaw.read_wav(wav_file), bytes([0xCE, 0x4E]))
+
+
+class TestWavInput(unittest.TestCase):
+    def setUp(self) -> None:
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.input_dir = Path(tempdir.name) / 'input'
+        self.input_dir.mkdir()
+        self.output_file = Path(tempdir.name) / 'lib.bin'
+
+        self.entries = {}
+        for word_code in range(3000, 3004):
+            samples = array('h', range(-5 * word_code, 5 * word_code, word_code // 100))
+            write_wav(self.input_dir / f'{word_code}.wav', samples.tobytes())
+            self.entries[word_code] = ulaw.encode(samples)
+        self.entries[3004] = b'\x01\x02\x03'
+        (self.input_dir / '3004.raw').write_bytes(self.entries[3004])
+
+    def test_from_directory(self) -> None:
+        speechLib = SpeechLib.from_directory(self.input_dir, jobs=2)
+
+        self.assertEqual({word_code: entry.data
+                          for word_code, entry in speechLib.audioData.entries.items()},
+                         self.entries)
+
+    def test_cached(self) -> None:
+        for hits in [0, 5]:
+            with BuildCache.for_output(self.output_file) as cache:
+                generate_cached(self.input_dir, self.output_file, cache, jobs=2)
+            self.assertEqual(cache.hits, hits)
+
+            self.assertEqual({word_code: entry.data for word_code, entry
+                              in SpeechLib.from_file(self.output_file).audioData.entries.items()},
+                             self.entries)
+
+    def test_duplicate_word_code(self) -> None:
+        (self.input_dir / '3000.raw').write_bytes(b'\x00')
+
+        with self.assertRaises(ValueError):
+            SpeechLib.from_directory(self.input_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()